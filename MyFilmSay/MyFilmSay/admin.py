@@ -1,3 +1,217 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from .models import (Genre, Person, Movie, MovieGenre, MovieCredit, User, Comment, CommentReply, Vote, Task,
+                     RoleEnum, MovieActivity, ContentSignature, SignatureBand, ArchivedThread)
+from .moderation import related_count, bulk_user_action, bulk_delete_comments, ModerationError
+from .purge import soft_delete_movie, soft_delete_replies
 
-# Register your models here.
+
+class FastChangeListAdmin(admin.ModelAdmin):
+    # No COUNT(*) over the whole table on every changelist page, and no <select> with every related row
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ("-id",)
+
+    def get_raw_id_fields(self, request):
+        return [field.name for field in self.model._meta.get_fields()
+                if (field.many_to_one or field.one_to_one) and not field.auto_created]
+
+
+class SoftDeleteAdmin(FastChangeListAdmin):
+    # Lists deleted rows too, and deletes through the soft delete and purge queue rather than Django's cascade
+    list_filter = ("is_deleted",)
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        return queryset.order_by(*ordering) if ordering else queryset
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+
+class ReadOnlyAdmin(FastChangeListAdmin):
+    # Derived or archived rows: changed only by their jobs, so the admin just shows them
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Genre)
+class GenreAdmin(FastChangeListAdmin):
+    list_display = ("id", "name", "slug")
+    search_fields = ("name",)
+    prepopulated_fields = {"slug": ("name",)}
+
+
+@admin.register(Person)
+class PersonAdmin(FastChangeListAdmin):
+    list_display = ("id", "name")
+    search_fields = ("name",)
+
+
+@admin.register(Movie)
+class MovieAdmin(SoftDeleteAdmin):
+    list_display = ("id", "title", "year", "rating", "view_count", "last_activity", "is_deleted")
+    search_fields = ("title",)
+    exclude = ("genre_tags", "people")
+
+    def delete_model(self, request, obj):
+        soft_delete_movie(obj)
+
+
+@admin.register(MovieActivity)
+class MovieActivityAdmin(ReadOnlyAdmin):
+    list_display = ("id", "movie", "bucket", "comments", "replies", "votes")
+    list_select_related = ("movie",)
+    ordering = ("-bucket",)
+
+
+@admin.register(MovieGenre)
+class MovieGenreAdmin(FastChangeListAdmin):
+    list_display = ("id", "movie", "genre")
+    list_select_related = ("movie", "genre")
+
+
+@admin.register(MovieCredit)
+class MovieCreditAdmin(FastChangeListAdmin):
+    list_display = ("id", "movie", "person", "job")
+    list_select_related = ("movie", "person")
+    list_filter = ("job",)
+
+
+def _run_user_action(modeladmin, request, queryset, action, role=None):
+    try:
+        changed = bulk_user_action(request.user, action, queryset.values_list("id", flat=True), role=role)
+        modeladmin.message_user(request, f"Updated {changed} users.")
+    except ModerationError as e:
+        modeladmin.message_user(request, str(e), level=messages.ERROR)
+
+
+@admin.action(description="Ban selected users")
+def ban_users(modeladmin, request, queryset):
+    _run_user_action(modeladmin, request, queryset, "ban")
+
+
+@admin.action(description="Make selected users moderators")
+def make_moderators(modeladmin, request, queryset):
+    _run_user_action(modeladmin, request, queryset, "role", RoleEnum.MODERATOR)
+
+
+@admin.action(description="Revoke roles of selected users")
+def revoke_roles(modeladmin, request, queryset):
+    _run_user_action(modeladmin, request, queryset, "role", RoleEnum.USER)
+
+
+@admin.action(description="Delete selected users")
+def purge_users(modeladmin, request, queryset):
+    _run_user_action(modeladmin, request, queryset, "purge")
+
+
+@admin.register(User)
+class UserAdmin(FastChangeListAdmin):
+    list_display = ("id", "name", "email", "role", "is_active", "comment_count", "reply_count")
+    list_filter = ("role", "is_active")
+    search_fields = ("name", "email")
+    exclude = ("password", "groups", "user_permissions")
+    readonly_fields = ("last_login",)
+    actions = (ban_users, make_moderators, revoke_roles, purge_users)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            comment_count=related_count(Comment, "author"),
+            reply_count=related_count(CommentReply, "author"),
+        )
+
+    @admin.display(description="Comments")
+    def comment_count(self, obj):
+        return obj.comment_count
+
+    @admin.display(description="Replies")
+    def reply_count(self, obj):
+        return obj.reply_count
+
+    def get_actions(self, request):
+        # Django's own bulk delete would bypass the soft delete and purge queue
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+
+@admin.action(description="Delete selected comments")
+def delete_comments(modeladmin, request, queryset):
+    try:
+        deleted = bulk_delete_comments(request.user, queryset.values_list("id", flat=True))
+        modeladmin.message_user(request, f"Deleted {deleted} comments.")
+    except ModerationError as e:
+        modeladmin.message_user(request, str(e), level=messages.ERROR)
+
+
+@admin.register(Comment)
+class CommentAdmin(FastChangeListAdmin):
+    list_display = ("id", "author", "movie", "short_text", "likes_count", "dislikes_count", "timestamp")
+    list_select_related = ("author", "movie")
+    search_fields = ("text",)
+    actions = (delete_comments,)
+
+    @admin.display(description="Text")
+    def short_text(self, obj):
+        return obj.text[:80]
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+
+@admin.register(CommentReply)
+class CommentReplyAdmin(SoftDeleteAdmin):
+    list_display = ("id", "author", "comment", "likes_count", "dislikes_count", "timestamp", "is_deleted")
+    # Reply.__str__ shows the parent comment's id, Comment.__str__ its author's name
+    list_select_related = ("author", "comment__author")
+    search_fields = ("reply_text",)
+
+    def delete_model(self, request, obj):
+        soft_delete_replies([obj.id])
+
+
+@admin.register(ArchivedThread)
+class ArchivedThreadAdmin(ReadOnlyAdmin):
+    list_display = ("comment_id", "movie", "author", "timestamp", "reply_count", "archived_at")
+    list_select_related = ("movie", "author")
+    ordering = ("-archived_at",)
+    exclude = ("payload",)
+
+
+@admin.register(ContentSignature)
+class ContentSignatureAdmin(ReadOnlyAdmin):
+    list_display = ("doc_id", "duplicate_of", "created_at")
+    ordering = ("-created_at",)
+    exclude = ("signature",)
+
+
+@admin.register(SignatureBand)
+class SignatureBandAdmin(ReadOnlyAdmin):
+    list_display = ("id", "key", "doc_id")
+    search_fields = ("=doc_id",)
+
+
+@admin.register(Vote)
+class VoteAdmin(FastChangeListAdmin):
+    list_display = ("id", "user", "vote_type", "comment_id", "reply_id")
+    list_select_related = ("user",)
+    list_filter = ("vote_type",)
+
+
+@admin.register(Task)
+class TaskAdmin(FastChangeListAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_at", "finished_at", "created_by")
+    list_select_related = ("created_by",)
+    list_filter = ("status", "name")
+    readonly_fields = ("result", "progress", "error", "locked_by", "locked_at", "finished_at")
@@ -0,0 +1,225 @@
+import base64
+import json
+from datetime import datetime
+from functools import wraps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+from .caching import cacheable_page, catalogue_etag, movie_etag, movie_last_modified
+from .models import Movie, Comment, CommentReply
+from .search import search_comments
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Public field name -> ORM path
+MOVIE_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "year": "year",
+    "rating": "rating",
+    "img_url": "img_url",
+    "date": "date",
+    "director": "director",
+    "writers": "writers",
+    "genres": "genres",
+    "body": "body",
+}
+MOVIE_DEFAULT_FIELDS = ("id", "title", "year", "rating", "img_url")
+
+COMMENT_FIELDS = {
+    "id": "id",
+    "author_id": "author_id",
+    "author_name": "author__name",
+    "text": "text",
+    "html": "text_html",
+    "user_rating": "user_rating",
+    "likes": "likes_count",
+    "dislikes": "dislikes_count",
+    "timestamp": "timestamp",
+}
+COMMENT_DEFAULT_FIELDS = tuple(COMMENT_FIELDS)
+
+REPLY_FIELDS = {
+    "id": "id",
+    "parent_id": "parent_id",
+    "author_id": "author_id",
+    "author_name": "author__name",
+    "text": "reply_text",
+    "html": "reply_html",
+    "likes": "likes_count",
+    "dislikes": "dislikes_count",
+    "timestamp": "timestamp",
+}
+REPLY_DEFAULT_FIELDS = tuple(REPLY_FIELDS)
+
+
+class ApiError(Exception):
+    pass
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode("utf-8")
+
+
+def api_response(data, status=200):
+    return HttpResponse(dumps(data), content_type="application/json", status=status)
+
+
+def api_error(message, status=400):
+    return JsonResponse({"success": False, "message": message}, status=status)
+
+
+def selected_fields(request, available, default):
+    requested = request.GET.get("fields")
+    if not requested:
+        return list(default)
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def page_limit(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer")
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(dumps(values)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(request, *types):
+    cursor = request.GET.get("cursor")
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return [convert(value) for convert, value in zip(types, values)]
+    except (TypeError, ValueError):
+        raise ApiError("Invalid cursor")
+
+
+def serialize_rows(queryset, names, available, key_paths=()):
+    # Rows come straight from values_list(); the cursor key columns ride along at the end
+    paths = [available[name] for name in names]
+    rows = []
+    keys = []
+    for values in queryset.values_list(*paths, *key_paths):
+        rows.append(dict(zip(names, values)))
+        keys.append(values[len(paths):])
+    return rows, keys
+
+
+def paginate(request, queryset, names, available, key_paths, limit):
+    rows, keys = serialize_rows(queryset[:limit + 1], names, available, key_paths)
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params["cursor"] = encode_cursor([
+            value.isoformat() if isinstance(value, datetime) else value for value in keys[limit - 1]
+        ])
+        next_url = f"{request.path}?{params.urlencode()}"
+    return {"results": rows, "next": next_url}
+
+
+def api_view(view_func):
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except ApiError as e:
+            return api_error(str(e))
+    return _wrapped_view
+
+
+@gzip_page
+@require_GET
+@cacheable_page(catalogue_etag)
+@api_view
+def movie_list(request):
+    names = selected_fields(request, MOVIE_FIELDS, MOVIE_DEFAULT_FIELDS)
+    movies = Movie.objects.order_by("id")
+    cursor = decode_cursor(request, int)
+    if cursor:
+        movies = movies.filter(id__gt=cursor[0])
+    return api_response(paginate(request, movies, names, MOVIE_FIELDS, ("id",), page_limit(request)))
+
+
+@gzip_page
+@require_GET
+@cacheable_page(movie_etag, movie_last_modified)
+@api_view
+def movie_detail(request, movie_id):
+    names = selected_fields(request, MOVIE_FIELDS, MOVIE_FIELDS)
+    rows, _ = serialize_rows(Movie.objects.filter(id=movie_id), names, MOVIE_FIELDS)
+    if not rows:
+        return api_error("Movie not found.", status=404)
+    return api_response(rows[0])
+
+
+@gzip_page
+@require_GET
+@cacheable_page(movie_etag, movie_last_modified)
+@api_view
+def movie_comments(request, movie_id):
+    if not Movie.objects.filter(id=movie_id).exists():
+        return api_error("Movie not found.", status=404)
+    names = selected_fields(request, COMMENT_FIELDS, COMMENT_DEFAULT_FIELDS)
+    comments = Comment.objects.filter(movie_id=movie_id).order_by("-timestamp", "-id")
+    cursor = decode_cursor(request, datetime.fromisoformat, int)
+    if cursor:
+        timestamp, last_id = cursor
+        comments = comments.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=last_id))
+    return api_response(
+        paginate(request, comments, names, COMMENT_FIELDS, ("timestamp", "id"), page_limit(request))
+    )
+
+
+@gzip_page
+@require_GET
+@api_view
+def comment_replies(request, comment_id):
+    if not Comment.objects.filter(id=comment_id).exists():
+        return api_error("Comment not found.", status=404)
+    names = selected_fields(request, REPLY_FIELDS, REPLY_DEFAULT_FIELDS)
+    replies = CommentReply.objects.filter(comment_id=comment_id).order_by("id")
+    cursor = decode_cursor(request, int)
+    if cursor:
+        replies = replies.filter(id__gt=cursor[0])
+    return api_response(paginate(request, replies, names, REPLY_FIELDS, ("id",), page_limit(request)))
+
+
+@gzip_page
+@require_GET
+@cacheable_page(movie_etag, movie_last_modified)
+@api_view
+def movie_comment_search(request, movie_id):
+    if not Movie.objects.filter(id=movie_id).exists():
+        return api_error("Movie not found.", status=404)
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return api_error("q is required")
+    results, next_after = search_comments(movie_id, query, decode_cursor(request, float, int), page_limit(request))
+    next_url = None
+    if next_after:
+        params = request.GET.copy()
+        params["cursor"] = encode_cursor(next_after)
+        next_url = f"{request.path}?{params.urlencode()}"
+    return api_response({"results": results, "next": next_url})
@@ -0,0 +1,162 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .caching import touch_movies
+from .duplicates import forget_documents
+from .markup import render_markup
+from .models import ArchivedThread, Comment, CommentReply, User, Vote
+
+ARCHIVE_BATCH_SIZE = 200
+COMPRESSION_LEVEL = 9
+COMMENT_FIELDS = ("id", "text", "text_html", "text_plain", "author_id", "timestamp", "user_rating",
+                  "likes_count", "dislikes_count")
+REPLY_FIELDS = ("id", "parent_id", "reply_text", "reply_html", "reply_plain", "author_id", "timestamp",
+                "likes_count", "dislikes_count")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds to milliseconds; restored rows keep their exact timestamps
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def cold_threads(cutoff=None):
+    cutoff = cutoff or timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    # Top-level comments nobody has answered since the cutoff, on movies with no newer comments at all
+    return Comment.objects.filter(parent__isnull=True, timestamp__lt=cutoff).exclude(
+        Exists(Comment.all_objects.filter(parent_id=OuterRef("pk")))
+        | Exists(CommentReply.all_objects.filter(comment_id=OuterRef("pk"), timestamp__gte=cutoff))
+        | Exists(Comment.all_objects.filter(movie_id=OuterRef("movie_id"), timestamp__gte=cutoff))
+    )
+
+
+def pack(thread):
+    return zlib.compress(json.dumps(thread, cls=ArchiveEncoder, separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+
+
+def unpack(payload):
+    thread = json.loads(zlib.decompress(payload))
+    for row in [thread["comment"], *thread["replies"]]:
+        row["timestamp"] = parse_datetime(row["timestamp"])
+    return thread
+
+
+def _archive_batch(comments):
+    comment_ids = [comment["id"] for comment in comments]
+    replies = {comment_id: [] for comment_id in comment_ids}
+    for reply in CommentReply.objects.filter(comment_id__in=comment_ids).order_by("id") \
+            .values("comment_id", *REPLY_FIELDS):
+        replies[reply.pop("comment_id")].append(reply)
+    reply_ids = {reply["id"]: comment_id for comment_id, rows in replies.items() for reply in rows}
+    votes = {comment_id: [] for comment_id in comment_ids}
+    for user_id, comment_id, reply_id, vote_type in Vote.objects.filter(
+            Q(comment_id__in=comment_ids) | Q(reply_id__in=reply_ids)
+    ).values_list("user_id", "comment_id", "reply_id", "vote_type"):
+        votes[comment_id or reply_ids[reply_id]].append([user_id, reply_id, vote_type])
+
+    ArchivedThread.objects.bulk_create([
+        ArchivedThread(
+            comment_id=comment["id"],
+            movie_id=comment["movie_id"],
+            author_id=comment["author_id"],
+            timestamp=comment["timestamp"],
+            reply_count=len(replies[comment["id"]]),
+            payload=pack({
+                "comment": {field: comment[field] for field in COMMENT_FIELDS},
+                "replies": replies[comment["id"]],
+                "votes": votes[comment["id"]],
+            }),
+        )
+        for comment in comments
+    ])
+    # Soft-deleted replies go with their thread; the collector removes replies and votes too
+    all_reply_ids = list(CommentReply.all_objects.filter(comment_id__in=comment_ids).values_list("id", flat=True))
+    Comment.all_objects.filter(id__in=comment_ids).delete()
+    forget_documents(comment_ids=comment_ids, reply_ids=all_reply_ids)
+    touch_movies({comment["movie_id"] for comment in comments})
+
+
+def archive_threads(cutoff=None, batch_size=ARCHIVE_BATCH_SIZE, movie_id=None):
+    threads = cold_threads(cutoff).order_by("id")
+    if movie_id is not None:
+        threads = threads.filter(movie_id=movie_id)
+    archived = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            comments = list(threads.filter(id__gt=last_id).values("movie_id", *COMMENT_FIELDS)[:batch_size])
+            if not comments:
+                break
+            _archive_batch(comments)
+        last_id = comments[-1]["id"]
+        archived += len(comments)
+    return archived
+
+
+def restore_thread(comment_id):
+    archived = ArchivedThread.objects.filter(comment_id=comment_id).first()
+    if archived is None:
+        raise ArchiveError(f"Thread {comment_id} is not archived.")
+    thread = unpack(archived.payload)
+    users = set(User.all_objects.filter(
+        id__in={thread["comment"]["author_id"], *(r["author_id"] for r in thread["replies"]),
+                *(user_id for user_id, _, _ in thread["votes"])}
+    ).values_list("id", flat=True))
+    if thread["comment"]["author_id"] not in users:
+        raise ArchiveError(f"The author of thread {comment_id} no longer exists.")
+
+    with transaction.atomic():
+        Comment.all_objects.create(movie_id=archived.movie_id, **thread["comment"])
+        # Replies by purged users are dropped, along with everything under them
+        kept = set()
+        replies = []
+        for reply in thread["replies"]:
+            if reply["author_id"] in users and (reply["parent_id"] is None or reply["parent_id"] in kept):
+                kept.add(reply["id"])
+                replies.append(CommentReply(comment_id=comment_id, **reply))
+        CommentReply.all_objects.bulk_create(replies)
+        Vote.objects.bulk_create([
+            Vote(user_id=user_id, comment_id=None if reply_id else comment_id, reply_id=reply_id, vote_type=vote_type)
+            for user_id, reply_id, vote_type in thread["votes"]
+            if user_id in users and (reply_id is None or reply_id in kept)
+        ])
+        archived.delete()
+        touch_movies([archived.movie_id])
+    return 1 + len(replies)
+
+
+def archived_threads(movie_id, offset=0, limit=None):
+    rows = ArchivedThread.objects.filter(movie_id=movie_id).order_by("-timestamp", "-comment_id") \
+        .values_list("payload", flat=True)
+    threads = [unpack(payload) for payload in (rows[offset:offset + limit] if limit else rows[offset:])]
+    # Authors are looked up live, so content of users deleted since archiving stays hidden
+    authors = User.objects.in_bulk({
+        row["author_id"] for thread in threads for row in [thread["comment"], *thread["replies"]]
+    })
+    visible = []
+    for thread in threads:
+        comment = thread["comment"]
+        if comment["author_id"] not in authors:
+            continue
+        comment["author"] = authors[comment["author_id"]]
+        # Threads archived before text_html was filled in are rendered as they are shown
+        comment["html"] = comment["text_html"] or render_markup(comment["text"])[0]
+        comment["replies"] = [
+            {**reply, "author": authors[reply["author_id"]],
+             "html": reply["reply_html"] or render_markup(reply["reply_text"])[0]}
+            for reply in thread["replies"] if reply["author_id"] in authors
+        ]
+        visible.append(comment)
+    return visible
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+USER_CACHE_PREFIX = "authuser:"
+
+
+def _user_key(user_id):
+    return f"{USER_CACHE_PREFIX}{user_id}"
+
+
+def cache_is_shared(alias=DEFAULT_CACHE_ALIAS):
+    # A per-process cache only forgets a banned, deleted or re-passworded user in the worker that changed it
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def forget_users(user_ids):
+    # Again after commit, in case a concurrent request re-cached the old row meanwhile
+    keys = [_user_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def forget_user(user_id):
+    forget_users([user_id])
+
+
+class CachedModelBackend(ModelBackend):
+    # AuthenticationMiddleware resolves request.user through get_user on every request
+    def get_user(self, user_id):
+        if not cache_is_shared():
+            return super().get_user(user_id)
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _forget_saved_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+from functools import lru_cache
+from html import escape
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+AVATAR_CACHE_PREFIX = "avatar:"
+AVATAR_COLOURS = (
+    "#1abc9c", "#2ecc71", "#3498db", "#9b59b6", "#34495e", "#16a085", "#27ae60", "#2980b9",
+    "#8e44ad", "#2c3e50", "#e67e22", "#e74c3c", "#d35400", "#c0392b", "#7f8c8d", "#f39c12",
+)
+AVATAR_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100" viewBox="0 0 100 100">'
+    '<circle cx="50" cy="50" r="50" fill="{colour}"/>'
+    '<text x="50" y="50" dy=".35em" text-anchor="middle" fill="#fff" '
+    'font-family="Open Sans, Helvetica, Arial, sans-serif" font-size="40" font-weight="600">{initials}</text>'
+    '</svg>'
+)
+# render_avatar's digest: the first 16 hex characters of the SVG's SHA-1
+AVATAR_DIGEST_RE = re.compile(r"[0-9a-f]{16}")
+
+
+def avatar_initials(name):
+    words = re.findall(r"[^\W_]+", name or "")
+    if not words:
+        return "?"
+    if len(words) == 1:
+        return words[0][:2].upper()
+    return (words[0][0] + words[-1][0]).upper()
+
+
+def avatar_colour(name):
+    return AVATAR_COLOURS[zlib.crc32((name or "").encode("utf-8")) % len(AVATAR_COLOURS)]
+
+
+def render_avatar(name):
+    svg = AVATAR_SVG.format(colour=avatar_colour(name), initials=escape(avatar_initials(name))).encode("utf-8")
+    return hashlib.sha1(svg).hexdigest()[:16], svg
+
+
+def _avatar_path(digest):
+    return Path(settings.AVATAR_ROOT) / f"{digest}.svg"
+
+
+def _write_avatar(path, svg):
+    # Written beside the target and renamed over it, so a concurrent load_avatar never reads half a file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(svg)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+@lru_cache(maxsize=4096)
+def avatar_url(name):
+    digest, svg = render_avatar(name)
+    cache.set(AVATAR_CACHE_PREFIX + digest, svg, None)
+    path = _avatar_path(digest)
+    if not path.exists():
+        _write_avatar(path, svg)
+    return reverse("avatar", args=[digest])
+
+
+def load_avatar(digest):
+    if not AVATAR_DIGEST_RE.fullmatch(digest):
+        return None
+    svg = cache.get(AVATAR_CACHE_PREFIX + digest)
+    if svg is None:
+        try:
+            svg = _avatar_path(digest).read_bytes()
+        except OSError:
+            return None
+        cache.set(AVATAR_CACHE_PREFIX + digest, svg, None)
+    return svg
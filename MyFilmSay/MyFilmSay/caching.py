@@ -0,0 +1,124 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from .catalogue import catalogue_version
+from .models import Movie
+from .trending import trending_version
+
+
+def touch_movie(movie_id):
+    touch_movies([movie_id])
+
+
+def touch_movies(movie_ids):
+    Movie.objects.filter(id__in=movie_ids).update(
+        activity_version=F("activity_version") + 1,
+        last_activity=timezone.now(),
+    )
+
+
+def user_key(request):
+    if request.user.is_authenticated:
+        # Login rotates the CSRF cookie, and a page revalidated across it would post a stale {% csrf_token %}
+        csrf = hashlib.md5(request.COOKIES.get(settings.CSRF_COOKIE_NAME, "").encode("utf-8")).hexdigest()[:12]
+        return f"u{request.user.id}-{request.user.role}-{csrf}"
+    return "anon"
+
+
+def _has_messages(request):
+    return len(get_messages(request)) > 0
+
+
+def _movie_activity(request, movie_id):
+    if not hasattr(request, "_movie_activity"):
+        request._movie_activity = Movie.objects.filter(id=movie_id) \
+            .values_list("activity_version", "last_activity").first()
+    return request._movie_activity
+
+
+def movie_etag(request, movie_id):
+    activity = _movie_activity(request, movie_id)
+    if activity is None or _has_messages(request):
+        return None
+    offset = request.GET.get("offset", 0)
+    return f"movie-{movie_id}-{activity[0]}-{offset}-{user_key(request)}-{settings.RELEASE_VERSION}"
+
+
+def movie_last_modified(request, movie_id):
+    activity = _movie_activity(request, movie_id)
+    if activity is None or _has_messages(request):
+        return None
+    return activity[1]
+
+
+def catalogue_etag(request):
+    if _has_messages(request):
+        return None
+    sort_by = request.GET.get("sort_by", "title")
+    # The carousel shows trending movies on every sort order
+    return (f"catalogue-{catalogue_version()}-{trending_version()}-{sort_by}-{user_key(request)}"
+            f"-{settings.RELEASE_VERSION}")
+
+
+def static_page_etag(request):
+    if _has_messages(request):
+        return None
+    return f"page-{request.path}-{user_key(request)}-{settings.RELEASE_VERSION}"
+
+
+def rendered_page_key(request, etag):
+    digest = hashlib.md5(f"{request.get_full_path()}|{etag}".encode("utf-8")).hexdigest()
+    return f"rendered:{digest}"
+
+
+def _rendered_page_cache(view_func, etag_func):
+    # Anonymous pages are identical for every visitor, so the rendered body is kept
+    # under a key that includes the ETag and goes stale together with it.
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        etag = etag_func(request, *args, **kwargs)
+        if etag is None:
+            return view_func(request, *args, **kwargs)
+
+        key = rendered_page_key(request, etag)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            cache.set(key, (response.content, response["Content-Type"]), settings.RENDERED_PAGE_SECONDS)
+        return response
+    return _wrapped_view
+
+
+def cacheable_page(etag_func, last_modified_func=None):
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(
+            _rendered_page_cache(view_func, etag_func)
+        )
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD") and response.status_code in (200, 304):
+                if request.user.is_authenticated:
+                    patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+                else:
+                    patch_cache_control(
+                        response, public=True, max_age=0, must_revalidate=True,
+                        s_maxage=settings.PAGE_CACHE_SECONDS,
+                    )
+            return response
+        return _wrapped_view
+    return decorator
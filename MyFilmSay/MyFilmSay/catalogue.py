@@ -0,0 +1,140 @@
+import re
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, IntegerField
+from django.db.models.functions import Floor
+from django.utils.text import slugify
+from .models import Movie, Genre, Person, MovieGenre, MovieCredit, CreditJobEnum
+from .snapshot import invalidate_snapshot
+from .state import bump_state_version, state_version
+
+CATALOGUE_VERSION_KEY = "catalogue_version"
+FACET_CACHE_TIMEOUT = 60 * 60
+FACET_FIELDS = ("genre", "decade", "rating", "person")
+
+
+def split_names(value):
+    names = []
+    for part in (value or "").split(","):
+        name = part.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def parse_year(date):
+    match = re.match(r"\s*(\d{4})", date or "")
+    return int(match.group(1)) if match else None
+
+
+def catalogue_version():
+    # In the database, so a bump from run_worker (imports, purges, posters) reaches every web worker
+    return state_version(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    invalidate_snapshot()
+    return bump_state_version(CATALOGUE_VERSION_KEY)
+
+
+def _ensure_genres(names):
+    by_slug = {slugify(name): name for name in names if slugify(name)}
+    Genre.objects.bulk_create(
+        [Genre(name=name, slug=slug) for slug, name in by_slug.items()],
+        ignore_conflicts=True,
+    )
+    return list(Genre.objects.filter(slug__in=by_slug).values_list("id", flat=True))
+
+
+def _ensure_people(names):
+    Person.objects.bulk_create([Person(name=name) for name in names], ignore_conflicts=True)
+    return dict(Person.objects.filter(name__in=names).values_list("name", "id"))
+
+
+def sync_movie_relations(movie):
+    genre_ids = _ensure_genres(split_names(movie.genres))
+    directors = split_names(movie.director)
+    writers = split_names(movie.writers)
+    people = _ensure_people(directors + writers)
+
+    credits = [MovieCredit(movie=movie, person_id=people[name], job=CreditJobEnum.DIRECTOR)
+               for name in directors if name in people]
+    credits += [MovieCredit(movie=movie, person_id=people[name], job=CreditJobEnum.WRITER)
+                for name in writers if name in people]
+
+    with transaction.atomic():
+        Movie.objects.filter(id=movie.id).update(year=parse_year(movie.date))
+        MovieGenre.objects.filter(movie=movie).exclude(genre_id__in=genre_ids).delete()
+        MovieGenre.objects.bulk_create(
+            [MovieGenre(movie=movie, genre_id=genre_id) for genre_id in genre_ids],
+            ignore_conflicts=True,
+        )
+        MovieCredit.objects.filter(movie=movie).delete()
+        MovieCredit.objects.bulk_create(credits, ignore_conflicts=True)
+
+    movie.year = parse_year(movie.date)
+    bump_catalogue_version()
+
+
+def parse_filters(params):
+    filters = {"genre": params.get("genre") or None}
+    for field in ("decade", "rating", "person"):
+        try:
+            filters[field] = int(params[field])
+        except (KeyError, TypeError, ValueError):
+            filters[field] = None
+    return filters
+
+
+def filter_movies(genre=None, decade=None, rating=None, person=None):
+    movies = Movie.objects.all()
+    if genre:
+        movies = movies.filter(id__in=MovieGenre.objects.filter(genre__slug=genre).values("movie_id"))
+    if person:
+        movies = movies.filter(id__in=MovieCredit.objects.filter(person_id=person).values("movie_id"))
+    if decade is not None:
+        movies = movies.filter(year__gte=decade, year__lt=decade + 10)
+    if rating is not None:
+        movies = movies.filter(rating__gte=rating, rating__lt=rating + 1)
+    return movies
+
+
+def _without(filters, field):
+    return {key: value for key, value in filters.items() if key != field}
+
+
+def _compute_facets(filters):
+    genre_movies = filter_movies(**_without(filters, "genre")).values("id")
+    genres = MovieGenre.objects.filter(movie_id__in=genre_movies) \
+        .values("genre__slug", "genre__name") \
+        .annotate(count=Count("movie_id")) \
+        .order_by("genre__name")
+
+    decades = filter_movies(**_without(filters, "decade")) \
+        .exclude(year=None) \
+        .annotate(decade=ExpressionWrapper(F("year") / 10 * 10, output_field=IntegerField())) \
+        .values("decade") \
+        .annotate(count=Count("id")) \
+        .order_by("-decade")
+
+    ratings = filter_movies(**_without(filters, "rating")) \
+        .exclude(rating=None) \
+        .annotate(band=Floor("rating")) \
+        .values("band") \
+        .annotate(count=Count("id")) \
+        .order_by("-band")
+
+    return {
+        "genres": [{"slug": g["genre__slug"], "name": g["genre__name"], "count": g["count"]} for g in genres],
+        "decades": [{"decade": d["decade"], "count": d["count"]} for d in decades],
+        "ratings": [{"band": int(r["band"]), "count": r["count"]} for r in ratings],
+    }
+
+
+def facet_counts(filters):
+    key = "facets:%s:%s" % (catalogue_version(), ":".join(str(filters.get(field)) for field in FACET_FIELDS))
+    facets = cache.get(key)
+    if facets is None:
+        facets = _compute_facets(filters)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
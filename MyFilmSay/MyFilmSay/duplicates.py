@@ -0,0 +1,196 @@
+import hashlib
+import re
+import zlib
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from .models import Comment, CommentReply, ContentSignature, SignatureBand
+
+# 16 bands of 8 rows put the LSH candidate threshold near 0.7 Jaccard; candidates are then
+# checked against DUPLICATE_THRESHOLD on the full signature
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+PRIME = (1 << 31) - 1
+SEED = 1
+SCAN_BATCH_SIZE = 500
+
+Fingerprint = namedtuple("Fingerprint", ["signature", "keys", "duplicate_of"])
+
+# model, plain-text field, doc_id parity
+SOURCES = (
+    (Comment, "text_plain", 0),
+    (CommentReply, "reply_plain", 1),
+)
+
+
+def comment_doc_id(comment_id):
+    return comment_id * 2
+
+
+def reply_doc_id(reply_id):
+    return reply_id * 2 + 1
+
+
+@lru_cache(maxsize=None)
+def _permutations():
+    # NumPy is imported on the first fingerprint rather than at boot
+    import numpy as np
+    rng = np.random.default_rng(SEED)
+    return rng.integers(1, PRIME, NUM_PERM, dtype=np.uint64), rng.integers(0, PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def signature(text):
+    import numpy as np
+
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < settings.DUPLICATE_MIN_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # One universal hash per permutation, minimised over every shingle at once
+    a, b = _permutations()
+    return ((np.outer(hashes % PRIME, a) + b) % PRIME).min(axis=0).astype(np.uint32)
+
+
+def band_keys(sig):
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for band, rows in enumerate(sig.reshape(BANDS, ROWS))
+    ]
+
+
+def _match(items, exclude=()):
+    import numpy as np
+
+    # items: (doc_id, signature, keys) in posting order; returns {doc_id: root of its duplicate cluster}
+    buckets = defaultdict(set)
+    rows = SignatureBand.objects.filter(key__in={key for _, _, keys in items for key in keys}) \
+        .exclude(doc_id__in=exclude).values_list("key", "doc_id")
+    for key, doc_id in rows:
+        buckets[key].add(doc_id)
+    known = {
+        doc_id: (np.frombuffer(sig, dtype=np.uint32), duplicate_of or doc_id)
+        for doc_id, sig, duplicate_of in ContentSignature.objects
+        .filter(doc_id__in=set().union(*buckets.values())).values_list("doc_id", "signature", "duplicate_of")
+    }
+
+    roots = {}
+    for doc_id, sig, keys in items:
+        candidates = sorted({other for key in keys for other in buckets[key] if other in known and other != doc_id})
+        if candidates:
+            similarity = (np.stack([known[other][0] for other in candidates]) == sig).mean(axis=1)
+            # An edited original is not a copy of its own copies
+            matches = [known[other][1] for other, score in zip(candidates, similarity)
+                       if score >= settings.DUPLICATE_THRESHOLD and known[other][1] != doc_id]
+            if matches:
+                roots[doc_id] = min(matches)
+        # Later items in the same batch are compared against this one too
+        known[doc_id] = (sig, roots.get(doc_id, doc_id))
+        for key in keys:
+            buckets[key].add(doc_id)
+    return roots
+
+
+def fingerprint(text, doc_id=None):
+    sig = signature(text)
+    if sig is None:
+        return None
+    keys = band_keys(sig)
+    exclude = [doc_id] if doc_id is not None else []
+    return Fingerprint(sig, keys, _match([(doc_id, sig, keys)], exclude).get(doc_id))
+
+
+def rejects(fp):
+    return fp is not None and fp.duplicate_of is not None and settings.DUPLICATE_ACTION == "reject"
+
+
+def _store(entries):
+    # entries: (doc_id, Fingerprint or None); replaces whatever was indexed for these documents
+    doc_ids = [doc_id for doc_id, _ in entries]
+    ContentSignature.objects.filter(doc_id__in=doc_ids).delete()
+    SignatureBand.objects.filter(doc_id__in=doc_ids).delete()
+    entries = [(doc_id, fp) for doc_id, fp in entries if fp is not None]
+    ContentSignature.objects.bulk_create([
+        ContentSignature(doc_id=doc_id, signature=fp.signature.tobytes(), duplicate_of=fp.duplicate_of)
+        for doc_id, fp in entries
+    ])
+    SignatureBand.objects.bulk_create([
+        SignatureBand(key=key, doc_id=doc_id) for doc_id, fp in entries for key in fp.keys
+    ])
+
+
+def forget_documents(comment_ids=(), reply_ids=()):
+    doc_ids = [comment_doc_id(i) for i in comment_ids] + [reply_doc_id(i) for i in reply_ids]
+    ContentSignature.objects.filter(doc_id__in=doc_ids).delete()
+    SignatureBand.objects.filter(doc_id__in=doc_ids).delete()
+
+
+def index_document(doc_id, fp):
+    with transaction.atomic():
+        _store([(doc_id, fp)])
+
+
+def scan_history(batch_size=SCAN_BATCH_SIZE, rebuild=False):
+    if rebuild:
+        ContentSignature.objects.all().delete()
+        SignatureBand.objects.all().delete()
+
+    scanned = flagged = 0
+    for model, field, parity in SOURCES:
+        last_id = 0
+        while True:
+            batch = list(model.objects.filter(id__gt=last_id).order_by("id").values_list("id", field)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            doc_texts = {row_id * 2 + parity: text for row_id, text in batch}
+            done = set(ContentSignature.objects.filter(doc_id__in=doc_texts).values_list("doc_id", flat=True))
+            items = []
+            for doc_id, text in doc_texts.items():
+                sig = signature(text) if doc_id not in done else None
+                if sig is not None:
+                    items.append((doc_id, sig, band_keys(sig)))
+            roots = _match(items)
+            with transaction.atomic():
+                _store([(doc_id, Fingerprint(sig, keys, roots.get(doc_id))) for doc_id, sig, keys in items])
+            scanned += len(items)
+            flagged += len(roots)
+    return {"scanned": scanned, "flagged": flagged}
+
+
+def cluster_members(root):
+    members = [root, *ContentSignature.objects.filter(duplicate_of=root).values_list("doc_id", flat=True)]
+    comment_ids = [doc_id // 2 for doc_id in members if doc_id % 2 == 0]
+    reply_ids = [doc_id // 2 for doc_id in members if doc_id % 2 == 1]
+    # Soft-deleted members are hidden by the managers
+    return (list(Comment.objects.filter(id__in=comment_ids).values_list("id", "author_id")),
+            list(CommentReply.objects.filter(id__in=reply_ids).values_list("id", "author_id")))
+
+
+def cluster_page(before=None, size=50):
+    clusters = ContentSignature.objects.filter(duplicate_of__isnull=False).order_by("-duplicate_of") \
+        .values("duplicate_of").annotate(size=Count("doc_id"))
+    if before:
+        clusters = clusters.filter(duplicate_of__lt=before)
+    rows = list(clusters[:size + 1])
+    next_before = rows[size - 1]["duplicate_of"] if len(rows) > size else None
+    rows = rows[:size]
+
+    roots = [row["duplicate_of"] for row in rows]
+    texts = dict(Comment.all_objects.filter(id__in=[r // 2 for r in roots if r % 2 == 0])
+                 .values_list("id", "text_plain"))
+    reply_texts = dict(CommentReply.all_objects.filter(id__in=[r // 2 for r in roots if r % 2 == 1])
+                       .values_list("id", "reply_plain"))
+    return [
+        {
+            "root": row["duplicate_of"],
+            "type": "reply" if row["duplicate_of"] % 2 else "comment",
+            "size": row["size"] + 1,
+            "text": (reply_texts if row["duplicate_of"] % 2 else texts).get(row["duplicate_of"] // 2, ""),
+        }
+        for row in rows
+    ], next_before
@@ -10,6 +10,14 @@ class CreateMovieForm(forms.ModelForm):
             "title", "img_url", "body", "date", "rating",
             "director", "writers", "genres"]
 
+    def clean_title(self):
+        # The unique check only sees live movies; a deleted one keeps its title until purge_movie removes the row
+        title = self.cleaned_data["title"]
+        deleted = Movie.all_objects.filter(title=title, is_deleted=True).exclude(pk=self.instance.pk)
+        if deleted.exists():
+            raise forms.ValidationError("A deleted movie with this title is still being purged. Try again shortly.")
+        return title
+
 
 class RegisterForm(forms.Form):
     name = forms.CharField(label="Name", max_length=100, required=True)
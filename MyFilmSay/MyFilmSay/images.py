@@ -0,0 +1,52 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+
+STATIC_SOURCE_DIR = Path(__file__).resolve().parent / "static"
+VARIANTS_DIR = "assets/img/variants"
+VARIANTS_MANIFEST = STATIC_SOURCE_DIR / VARIANTS_DIR / "variants.json"
+VARIANT_WIDTHS = (480, 960, 1920)
+VARIANT_FORMATS = (
+    ("avif", "image/avif"),
+    ("webp", "image/webp"),
+)
+
+
+@lru_cache(maxsize=1)
+def load_variants():
+    try:
+        return json.loads(VARIANTS_MANIFEST.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def image_variants(path):
+    return load_variants().get(path, {})
+
+
+def optimize_image(relpath, widths=VARIANT_WIDTHS, quality=70):
+    from PIL import Image, features
+
+    source = STATIC_SOURCE_DIR / relpath
+    out_dir = STATIC_SOURCE_DIR / VARIANTS_DIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    variants = {}
+    with Image.open(source) as original:
+        image = original.convert("RGB")
+        fitting = [width for width in widths if width < image.width] + [min(image.width, max(widths))]
+        for fmt, _ in VARIANT_FORMATS:
+            if not features.check(fmt):
+                continue
+            for width in sorted(set(fitting)):
+                height = round(image.height * width / image.width)
+                name = f"{source.stem}-{width}.{fmt}"
+                image.resize((width, height), Image.Resampling.LANCZOS).save(out_dir / name, fmt.upper(), quality=quality)
+                variants.setdefault(fmt, []).append([width, f"{VARIANTS_DIR}/{name}"])
+    return variants
+
+
+def write_variants_manifest(variants):
+    VARIANTS_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    VARIANTS_MANIFEST.write_text(json.dumps(variants, indent=2, sort_keys=True))
+    load_variants.cache_clear()
@@ -0,0 +1,100 @@
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.urls import reverse
+from .catalogue import sync_movie_relations
+from .models import Movie
+from .popularity import flush_view_counts
+from .posters import PosterError, cache_movie_poster
+from .purge import recount_vote_counters
+from .sitemaps import base_url, build_all
+from .snapshot import publish_snapshot
+from .tasks import task, enqueue, PermanentTaskError
+from .trending import refresh_trending
+from . import purge, tmdb
+
+
+@task("import_tmdb_movie", max_attempts=4, retry_delay=15)
+def import_tmdb_movie(tmdb_id):
+    data = tmdb.fetch_movie(tmdb_id)
+    existing = Movie.all_objects.filter(title=data["title"]).first()
+    if existing is not None and existing.is_deleted:
+        raise PermanentTaskError(f"Deleted movie \"{data['title']}\" is still being purged.")
+    if existing is not None:
+        raise PermanentTaskError(f"Movie \"{data['title']}\" already exists.")
+
+    with transaction.atomic():
+        movie = Movie.objects.create(**data)
+        sync_movie_relations(movie)
+        if movie.img_url:
+            enqueue("cache_poster", payload={"movie_id": movie.id}, unique_key=f"poster:{movie.id}")
+    return {"movie_id": movie.id, "redirect_url": reverse("edit_movie", args=[movie.id])}
+
+
+@task("cache_poster", max_attempts=3, retry_delay=60)
+def cache_poster(movie_id):
+    try:
+        variants = cache_movie_poster(movie_id)
+    except PosterError as e:
+        raise PermanentTaskError(str(e))
+    return {"variants": sorted(variants or {})}
+
+
+@task("recount_vote_counters", every=24 * 60 * 60)
+def recount_vote_counters_job():
+    comments, replies = recount_vote_counters()
+    return {"comments": comments, "replies": replies}
+
+
+@task("flush_view_counts", every=settings.VIEW_FLUSH_SECONDS)
+def flush_view_counts_job():
+    return {"views": flush_view_counts()}
+
+
+@task("refresh_trending", every=settings.TRENDING_REFRESH_SECONDS)
+def refresh_trending_job():
+    return refresh_trending()
+
+
+@task("build_sitemaps", every=settings.SITEMAP_REFRESH_SECONDS)
+def build_sitemaps_job():
+    if not settings.SITEMAP_BASE_URL:
+        return {"files": 0}
+    return {"files": len(build_all(base_url()))}
+
+
+@task("publish_snapshot", max_attempts=3, retry_delay=30)
+def publish_snapshot_job():
+    # Queued by movie changes, and by a worker that finds no snapshot published
+    if not settings.CATALOGUE_SNAPSHOT:
+        return {"path": None}
+    return {"path": str(publish_snapshot())}
+
+
+@task("render_comments", max_attempts=3, retry_delay=60)
+def render_comments_job():
+    # Queued by migration 0017 for rows written before the rendered columns existed
+    out = StringIO()
+    call_command("render_comments", stdout=out)
+    return {"output": out.getvalue().splitlines()}
+
+
+@task("purge_comment")
+def purge_comment_job(comment_id):
+    return purge.purge_comment(comment_id)
+
+
+@task("purge_replies")
+def purge_replies_job(reply_ids):
+    return purge.purge_replies(reply_ids)
+
+
+@task("purge_movie")
+def purge_movie_job(movie_id):
+    return purge.purge_movie(movie_id)
+
+
+@task("purge_user")
+def purge_user_job(user_id):
+    return purge.purge_user(user_id)
@@ -0,0 +1,35 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from MyFilmSay.archive import ARCHIVE_BATCH_SIZE, ArchiveError, archive_threads, cold_threads, restore_thread
+
+
+class Command(BaseCommand):
+    help = "Move cold comment threads into the compressed archive, or restore one from it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive threads idle for this many days "
+                                                     "(default ARCHIVE_AFTER_DAYS).")
+        parser.add_argument("--movie", type=int, help="Only archive threads of this movie.")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Count the cold threads without moving them.")
+        parser.add_argument("--restore", type=int, metavar="COMMENT_ID", help="Move an archived thread back.")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            try:
+                restored = restore_thread(options["restore"])
+            except ArchiveError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Restored thread {options['restore']} ({restored} posts)"))
+            return
+
+        cutoff = timezone.now() - timedelta(days=options["days"]) if options["days"] is not None else None
+        if options["dry_run"]:
+            threads = cold_threads(cutoff)
+            if options["movie"]:
+                threads = threads.filter(movie_id=options["movie"])
+            self.stdout.write(f"{threads.count()} threads would be archived")
+            return
+        archived = archive_threads(cutoff, batch_size=options["batch_size"], movie_id=options["movie"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} threads"))
@@ -0,0 +1,46 @@
+import inspect
+import time
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import RequestFactory
+from django.utils.text import compress_string
+from MyFilmSay import api, views
+from MyFilmSay.models import Movie
+
+
+class Command(BaseCommand):
+    help = "Compare payload size and render time of the comment page as HTML (load_comments) and as API JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--movie", type=int, help="Movie id; defaults to the movie with most comments.")
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **options):
+        movie_id = options["movie"]
+        if movie_id is None:
+            movie_id = Movie.objects.annotate(total=Count("comments")).order_by("-total") \
+                .values_list("id", flat=True).first()
+        if movie_id is None:
+            raise CommandError("No movies to benchmark.")
+
+        factory = RequestFactory()
+        paths = (
+            ("html", inspect.unwrap(views.load_comments), {}),
+            ("api", inspect.unwrap(api.movie_comments), {"limit": views.COMMENTS_PER_PAGE}),
+        )
+        self.stdout.write(f"Movie {movie_id}, {views.COMMENTS_PER_PAGE} comments per page")
+        for label, view_func, params in paths:
+            request = factory.get("/", params)
+            request.user = AnonymousUser()
+            content = view_func(request, movie_id=movie_id).content
+
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                view_func(request, movie_id=movie_id)
+            elapsed = (time.perf_counter() - started) / options["repeat"]
+
+            self.stdout.write(
+                f"{label:>5}: {elapsed * 1000:.2f} ms, {len(content)} bytes, "
+                f"{len(compress_string(content))} bytes gzipped"
+            )
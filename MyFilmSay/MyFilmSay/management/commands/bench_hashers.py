@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of one login (password verification) for every configured hasher."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--budget-ms", type=float, default=250.0,
+                            help="Target CPU time per login on this machine.")
+
+    def handle(self, *args, **options):
+        password = "correct horse battery staple"
+        budget = options["budget_ms"]
+        for position, hasher in enumerate(get_hashers()):
+            encoded = hasher.encode(password, hasher.salt())
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                hasher.verify(password, encoded)
+            elapsed = (time.perf_counter() - started) / options["repeat"] * 1000
+
+            role = "hashes new passwords" if position == 0 else "verifies old hashes"
+            verdict = "over budget" if elapsed > budget else "within budget"
+            self.stdout.write(f"{hasher.algorithm:>14}: {elapsed:8.1f} ms per login, {verdict} ({role})")
+
+        self.stdout.write(
+            f"Current argon2 costs: time={settings.ARGON2_TIME_COST} memory={settings.ARGON2_MEMORY_COST} KiB "
+            f"parallelism={settings.ARGON2_PARALLELISM}; scrypt: N={settings.SCRYPT_WORK_FACTOR} "
+            f"r={settings.SCRYPT_BLOCK_SIZE} p={settings.SCRYPT_PARALLELISM}"
+        )
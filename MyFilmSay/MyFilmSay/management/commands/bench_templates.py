@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.test import RequestFactory
+
+LEGACY_FRAGMENT = """{% for comment in comments %}
+<a href="{% url 'user_profile' comment.author.id %}">{{ comment.author.name }}</a>
+<span>
+    {% for i in star_range %}
+        {% if i <= comment.user_rating|default:0 %}
+            &#9733;
+        {% else %}
+            &#9734;
+        {% endif %}
+    {% endfor %}
+</span>
+{% if user.is_authenticated %}
+    <button type="button" class="btn btn-outline-success btn-sm mx-1 vote-button"
+            data-comment-id="comment-{{ comment.id }}" data-vote-type="like">
+        Like ({{ comment.likes_count|default:0 }})
+    </button>
+    <button type="button" class="btn btn-outline-danger btn-sm mx-1 vote-button"
+            data-comment-id="comment-{{ comment.id }}" data-vote-type="dislike">
+        Dislike ({{ comment.dislikes_count|default:0 }})
+    </button>
+{% else %}
+    <a href="{% url 'login' %}?next={{ request.path }}" class="btn btn-outline-success btn-sm mx-1">
+        Like ({{ comment.likes_count|default:0 }})
+    </a>
+    <a href="{% url 'login' %}?next={{ request.path }}" class="btn btn-outline-danger btn-sm mx-1">
+        Dislike ({{ comment.dislikes_count|default:0 }})
+    </a>
+{% endif %}
+<form method="POST" action="{% url 'reply_comment' comment.id %}"></form>
+{% endfor %}"""
+
+FAST_FRAGMENT = """{% load film_tags %}{% for comment in comments %}
+{% profile_link comment.author %}
+<span>{% star_rating comment.user_rating %}</span>
+{% vote_buttons "comment" comment %}
+<form method="POST" action="{% id_url 'reply_comment' comment.id %}"></form>
+{% endfor %}"""
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the per-comment template fragments: legacy loops vs film_tags."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--authenticated", action="store_true")
+
+    def handle(self, *args, **options):
+        comments = [
+            SimpleNamespace(
+                id=i, user_rating=(i % 10) + 0.5, likes_count=i, dislikes_count=i // 2,
+                author=SimpleNamespace(id=i % 17 + 1, name=f"User {i % 17}"),
+            )
+            for i in range(1, options["comments"] + 1)
+        ]
+        request = RequestFactory().get("/movie/1")
+        user = SimpleNamespace(is_authenticated=True, id=1) if options["authenticated"] else AnonymousUser()
+        context = {"comments": comments, "request": request, "user": user, "star_range": range(1, 11)}
+
+        engine = engines["django"]
+        results = {}
+        for label, source in (("legacy", LEGACY_FRAGMENT), ("film_tags", FAST_FRAGMENT)):
+            template = engine.from_string(source)
+            template.render(context)
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                template.render(context)
+            results[label] = (time.perf_counter() - started) / options["repeat"]
+
+        per_hundred = 100 / options["comments"] * 1000
+        for label, seconds in results.items():
+            self.stdout.write(f"{label:>10}: {seconds * per_hundred:.2f} ms per 100 comments")
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {results['legacy'] / results['film_tags']:.1f}x"))
@@ -0,0 +1,22 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from MyFilmSay.sitemaps import build_all
+
+
+class Command(BaseCommand):
+    help = "Precompute the sitemap index and every movie sitemap shard that is out of date."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default=settings.SITEMAP_BASE_URL,
+                            help="Site URL the sitemaps point at; defaults to SITEMAP_BASE_URL.")
+
+    def handle(self, *args, **options):
+        if not options["base_url"]:
+            raise CommandError("Set SITEMAP_BASE_URL or pass --base-url.")
+        started = time.perf_counter()
+        files = build_all(options["base_url"].rstrip("/"))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(files)} sitemap files up to date in {settings.SITEMAP_ROOT} ({elapsed:.2f}s)"
+        ))
@@ -0,0 +1,35 @@
+import requests
+from django.core.management.base import BaseCommand
+from MyFilmSay.models import Movie
+from MyFilmSay.posters import PosterError, cache_movie_poster
+from MyFilmSay.tasks import enqueue
+
+
+class Command(BaseCommand):
+    help = "Download TMDb posters into the local poster cache, resized and re-encoded per variant."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Refetch posters that are already cached.")
+        parser.add_argument("--enqueue", action="store_true",
+                            help="Queue cache_poster jobs for the worker instead of fetching inline.")
+
+    def handle(self, *args, **options):
+        movies = Movie.objects.exclude(img_url__isnull=True).exclude(img_url="").order_by("id")
+        if not options["all"]:
+            movies = movies.filter(poster__isnull=True)
+
+        cached = failed = 0
+        for movie_id in movies.values_list("id", flat=True).iterator():
+            if options["enqueue"]:
+                enqueue("cache_poster", payload={"movie_id": movie_id}, unique_key=f"poster:{movie_id}")
+                cached += 1
+                continue
+            try:
+                cache_movie_poster(movie_id)
+                cached += 1
+            except (PosterError, requests.RequestException) as e:
+                failed += 1
+                self.stderr.write(f"Movie {movie_id}: {e}")
+
+        verb = "Queued" if options["enqueue"] else "Cached"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {cached} posters, {failed} failed"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from MyFilmSay.snapshot import publish_snapshot, snapshot_status
+
+
+class Command(BaseCommand):
+    help = "Publish the memory-mapped catalogue snapshot, or report it with this process's resident memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["publish", "status"])
+
+    def handle(self, *args, **options):
+        if options["action"] == "publish":
+            path = publish_snapshot()
+            self.stdout.write(self.style.SUCCESS(f"Published {path}"))
+
+        status = snapshot_status()
+        if not status["enabled"]:
+            raise CommandError("CATALOGUE_SNAPSHOT is off.")
+        if status["version"] is None:
+            raise CommandError("No snapshot is published yet; a build has been queued for the task worker.")
+        self.stdout.write(f"Snapshot {status['version']}: {status['movies']} movies, {status['bytes']} bytes")
+        self.stdout.write(
+            f"Process {status['pid']}: RSS {status['rss_kb']} kB "
+            f"(anonymous {status['rss_anon_kb']} kB, file-backed {status['rss_file_kb']} kB, "
+            f"shared memory {status['rss_shmem_kb']} kB)"
+        )
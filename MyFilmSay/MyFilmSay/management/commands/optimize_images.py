@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from MyFilmSay.images import STATIC_SOURCE_DIR, VARIANT_WIDTHS, optimize_image, write_variants_manifest
+
+
+class Command(BaseCommand):
+    help = "Build resized AVIF/WebP variants of the static JPEG banners for srcset/image-set."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quality", type=int, default=70)
+        parser.add_argument("--widths", type=int, nargs="+", default=list(VARIANT_WIDTHS))
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError("Pillow is required to optimize images (pip install pillow).")
+
+        started = time.perf_counter()
+        variants = {}
+        for source in sorted((STATIC_SOURCE_DIR / "assets" / "img").glob("*.jpg")):
+            relpath = source.relative_to(STATIC_SOURCE_DIR).as_posix()
+            variants[relpath] = optimize_image(relpath, widths=options["widths"], quality=options["quality"])
+            original_size = source.stat().st_size
+            smallest = min(
+                ((STATIC_SOURCE_DIR / path).stat().st_size
+                for entries in variants[relpath].values() for _, path in entries),
+                default=original_size,
+            )
+            self.stdout.write(f"{relpath}: {original_size // 1024} KiB -> smallest variant {smallest // 1024} KiB")
+
+        write_variants_manifest(variants)
+        self.stdout.write(self.style.SUCCESS(
+            f"Optimized {len(variants)} images in {time.perf_counter() - started:.1f}s"
+        ))
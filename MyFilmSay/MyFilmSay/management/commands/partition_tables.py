@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from MyFilmSay import partitioning
+
+
+class Command(BaseCommand):
+    help = "Move Vote and Comment onto hash-partitioned tables online (PostgreSQL): prepare, backfill, then swap."
+
+    def add_arguments(self, parser):
+        parser.add_argument("step", choices=["status", "prepare", "unprepare", "backfill", "swap", "drop-legacy"])
+        parser.add_argument("--table", choices=list(partitioning.TABLES), action="append",
+                            help="Limit the step to one table; may be repeated.")
+        parser.add_argument("--batch-size", type=int, default=partitioning.BACKFILL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for table in options["table"] or partitioning.TABLES:
+            try:
+                if options["step"] == "prepare":
+                    partitioning.prepare(table)
+                    self.stdout.write(self.style.SUCCESS(f"{table}: mirroring into {table}_partitioned"))
+                elif options["step"] == "unprepare":
+                    partitioning.unprepare(table)
+                    self.stdout.write(self.style.SUCCESS(f"{table}: partitioned copy dropped"))
+                elif options["step"] == "backfill":
+                    copied = partitioning.backfill(
+                        table, options["batch_size"],
+                        progress=lambda done, total: self.stdout.write(f"{table}: {done}/{total}"),
+                    )
+                    self.stdout.write(self.style.SUCCESS(f"{table}: copied {copied} rows"))
+                elif options["step"] == "swap":
+                    partitioning.swap(table)
+                    self.stdout.write(self.style.SUCCESS(f"{table}: now partitioned"))
+                elif options["step"] == "drop-legacy":
+                    partitioning.drop_legacy(table)
+                    self.stdout.write(self.style.SUCCESS(f"{table}: legacy table dropped"))
+                else:
+                    self.stdout.write(f"{table}: {partitioning.status(table)}")
+            except partitioning.PartitionError as e:
+                raise CommandError(str(e))
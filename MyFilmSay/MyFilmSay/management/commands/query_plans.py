@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from MyFilmSay.queryplans import (HOT_QUERIES, SNAPSHOT_PATH, PlanError, capture, diff_plans, load_snapshot,
+                                  regressions, save_snapshot, seed)
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot querysets and diff their plan shapes against the recorded snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", action="store_true",
+                            help="Plan against synthetic rows, rolled back afterwards.")
+        parser.add_argument("--update", action="store_true", help="Record the current plans as the new baseline.")
+        parser.add_argument("--query", action="append", choices=sorted(HOT_QUERIES),
+                            help="Only this query; may be repeated.")
+        parser.add_argument("--snapshot", default=str(SNAPSHOT_PATH))
+
+    def handle(self, *args, **options):
+        names = options["query"] or list(HOT_QUERIES)
+        try:
+            with transaction.atomic():
+                if options["seed"]:
+                    seed()
+                current = capture(names)
+                transaction.set_rollback(True)
+        except PlanError as e:
+            raise CommandError(str(e))
+
+        if options["update"]:
+            # Plans of queries that are no longer registered are dropped from the baseline
+            kept = {name: plan for name, plan in load_snapshot(options["snapshot"]).items() if name in HOT_QUERIES}
+            save_snapshot({**kept, **current}, options["snapshot"])
+            self.stdout.write(self.style.SUCCESS(f"Recorded {len(current)} {connection.vendor} plans"))
+            return
+
+        baseline = load_snapshot(options["snapshot"])
+        if not baseline:
+            raise CommandError(f"No {connection.vendor} baseline in {options['snapshot']}; record one with --update.")
+        changes = diff_plans({name: plan for name, plan in baseline.items() if name in names}, current)
+        for name, lines in changes.items():
+            self.stdout.write(name)
+            for worse, message in lines:
+                self.stdout.write(self.style.ERROR(f"  ! {message}") if worse else f"    {message}")
+
+        failed = regressions(changes)
+        summary = f"{len(names)} queries checked, {len(changes)} changed, {len(failed)} regressed"
+        if failed:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
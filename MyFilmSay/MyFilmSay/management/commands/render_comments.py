@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from MyFilmSay.caching import touch_movies
+from MyFilmSay.markup import render_markup
+from MyFilmSay.models import Comment, CommentReply
+
+# model, source field, html field, plain field, path to the movie id
+TARGETS = (
+    (Comment, "text", "text_html", "text_plain", "movie_id"),
+    (CommentReply, "reply_text", "reply_html", "reply_plain", "comment__movie_id"),
+)
+
+
+class Command(BaseCommand):
+    help = "Fill the sanitized HTML and plain-text columns of comments and replies in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--all", action="store_true",
+                            help="Re-render every row, e.g. after changing the allowed tags.")
+
+    def handle(self, *args, **options):
+        for model, source, html_field, plain_field, movie_path in TARGETS:
+            rows = model.all_objects.order_by("id")
+            if not options["all"]:
+                rows = rows.filter(**{html_field: ""})
+
+            last_id = 0
+            rendered = 0
+            while True:
+                batch = list(rows.filter(id__gt=last_id).values_list("id", source, movie_path)[:options["batch_size"]])
+                if not batch:
+                    break
+                objs = []
+                for row_id, text, _ in batch:
+                    html, plain = render_markup(text)
+                    objs.append(model(id=row_id, **{html_field: html, plain_field: plain}))
+                with transaction.atomic():
+                    model.all_objects.bulk_update(objs, [html_field, plain_field])
+                    # Cached pages of these movies still hold the old markup
+                    touch_movies({movie_id for _, _, movie_id in batch})
+                last_id = batch[-1][0]
+                rendered += len(batch)
+            self.stdout.write(f"{model.__name__}: rendered {rendered} rows")
@@ -0,0 +1,61 @@
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from MyFilmSay.tasks import claim_tasks, run_task, requeue_stale_tasks, schedule_periodic_tasks
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Worker threads.")
+        parser.add_argument("--poll-interval", type=float, default=None, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        self.poll_interval = options["poll_interval"] or settings.TASK_POLL_INTERVAL
+        self.burst = options["burst"]
+        self.processed = 0
+        self.lock = threading.Lock()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        requeue_stale_tasks()
+        schedule_periodic_tasks()
+
+        concurrency = max(1, options["concurrency"])
+        self.stdout.write(f"Worker started with {concurrency} thread(s)")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for number in range(concurrency):
+                pool.submit(self.loop, f"{socket.gethostname()}:{os.getpid()}:{number}")
+        self.stdout.write(self.style.SUCCESS(f"Worker stopped after {self.processed} task(s)"))
+
+    def stop(self, signum, frame):
+        self.stdout.write("Stopping after current tasks...")
+        self.stopping.set()
+
+    def loop(self, worker_id):
+        try:
+            while not self.stopping.is_set():
+                claimed = claim_tasks(worker_id)
+                if not claimed:
+                    if self.burst:
+                        break
+                    requeue_stale_tasks()
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                for task_obj in claimed:
+                    run_task(task_obj)
+                    with self.lock:
+                        self.processed += 1
+        except Exception as e:
+            self.stderr.write(f"{worker_id} crashed: {str(e)}")
+            self.stopping.set()
+        finally:
+            connection.close()
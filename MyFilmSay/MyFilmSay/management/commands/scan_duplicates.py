@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from MyFilmSay.duplicates import SCAN_BATCH_SIZE, scan_history
+
+
+class Command(BaseCommand):
+    help = "Fingerprint existing comments and replies and flag near-duplicates of earlier posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SCAN_BATCH_SIZE)
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Drop every stored signature first, e.g. after changing the threshold.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = scan_history(batch_size=options["batch_size"], rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {result['scanned']} posts, flagged {result['flagged']} duplicates "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from MyFilmSay.startup import parse_importtime
+
+
+class Command(BaseCommand):
+    help = "Import the app in a fresh interpreter under -X importtime and report the slowest modules."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="demo.wsgi", help="Module to import after django.setup().")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--sort", choices=["cumulative", "self"], default="cumulative")
+        parser.add_argument("--prefix", default="", help="Only list modules starting with this, e.g. MyFilmSay.")
+        parser.add_argument("--preload", action="store_true", help="Profile with PRELOAD_APP switched on.")
+        parser.add_argument("--json", action="store_true", help="Machine-readable output for CI.")
+        parser.add_argument("--max-ms", type=float, help="Fail when the total import time exceeds this.")
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE,
+               "PRELOAD_APP": str(options["preload"])}
+        code = f"import django; django.setup(); import {options['target']}"
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                capture_output=True, text=True, env=env, cwd=settings.BASE_DIR)
+        modules = parse_importtime(result.stderr)
+        if result.returncode or not modules:
+            raise CommandError(f"Importing {options['target']} failed:\n{result.stderr[-2000:]}")
+
+        total_ms = sum(module["self_us"] for module in modules) / 1000
+        listed = sorted(
+            (module for module in modules if module["module"].startswith(options["prefix"])),
+            key=lambda module: module[f"{options['sort']}_us"], reverse=True,
+        )[:options["limit"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps({
+                "target": options["target"], "total_ms": round(total_ms, 1), "modules": len(modules), "slowest": listed,
+            }))
+        else:
+            self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+            for module in listed:
+                self.stdout.write(f"{module['cumulative_us'] / 1000:>14.1f} {module['self_us'] / 1000:>9.1f}  "
+                                  f"{module['module']}")
+            self.stdout.write(f"Imported {len(modules)} modules in {total_ms:.1f} ms")
+
+        if options["max_ms"] is not None and total_ms > options["max_ms"]:
+            raise CommandError(f"Import time {total_ms:.1f} ms exceeds the {options['max_ms']:.1f} ms budget")
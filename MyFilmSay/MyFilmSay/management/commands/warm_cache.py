@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from MyFilmSay.popularity import top_movie_ids
+
+SORT_MODES = ("title", "rating", "date", "trending")
+
+
+def warmup_urls(top):
+    urls = [f"{reverse('get_all_movies')}?sort_by={sort_by}" for sort_by in SORT_MODES]
+    for movie_id in top_movie_ids(top):
+        urls.append(reverse("show_movie", args=[movie_id]))
+        urls.append(reverse("load_comments", args=[movie_id]))
+    return urls
+
+
+class Command(BaseCommand):
+    help = "Pre-render the index and the most-viewed movie pages into the page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=50, help="Number of most-viewed movies to warm.")
+        parser.add_argument("--workers", type=int, default=4, help="Pages rendered concurrently.")
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*", "") and not h.startswith(".")), "localhost")
+        self.factory = RequestFactory(SERVER_NAME=host)
+
+        started = time.perf_counter()
+        urls = warmup_urls(options["top"])
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            results = list(pool.map(self.warm, urls))
+
+        failed = [url for url, ok in zip(urls, results) if not ok]
+        for url in failed:
+            self.stderr.write(f"Failed to warm {url}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(urls) - len(failed)}/{len(urls)} pages in {elapsed:.2f}s"
+        ))
+
+    def warm(self, url):
+        request = self.factory.get(url)
+        request.user = AnonymousUser()
+        request.is_cache_warmup = True
+        try:
+            match = resolve(request.path_info)
+            return match.func(request, *match.args, **match.kwargs).status_code == 200
+        except Exception as e:
+            self.stderr.write(f"{url}: {str(e)}")
+            return False
+        finally:
+            connection.close()
@@ -0,0 +1,49 @@
+import html
+import re
+import threading
+from functools import lru_cache
+import nh3
+from django.conf import settings
+from django.utils.html import linebreaks
+
+ALLOWED_TAGS = {
+    "p", "br", "strong", "em", "b", "i", "u", "s", "del", "a", "ul", "ol", "li",
+    "blockquote", "code", "pre", "hr",
+}
+ALLOWED_ATTRIBUTES = {"a": {"href", "title"}}
+URL_SCHEMES = {"http", "https", "mailto"}
+LINK_REL = "nofollow noopener noreferrer ugc"
+
+BREAK_RE = re.compile(r"<br\s*/?>\n?", re.IGNORECASE)
+
+_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _markdown_module():
+    # Imported on the first comment written, not at boot; optional like before
+    try:
+        import markdown
+    except ImportError:
+        return None
+    return markdown
+
+
+def _markdown():
+    # Markdown instances are reusable but not thread-safe, so each thread keeps its own
+    converter = getattr(_local, "markdown", None)
+    if converter is None:
+        converter = _local.markdown = _markdown_module().Markdown(extensions=["nl2br", "sane_lists"])
+    return converter.reset()
+
+
+def render_markup(text):
+    if settings.COMMENT_MARKDOWN and _markdown_module() is not None:
+        rendered = _markdown().convert(text)
+    else:
+        rendered = linebreaks(text)
+    safe_html = nh3.clean(
+        rendered, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, url_schemes=URL_SCHEMES, link_rel=LINK_REL
+    )
+    plain = html.unescape(nh3.clean(BREAK_RE.sub("\n", rendered), tags=set())).strip()
+    return safe_html.strip(), plain
@@ -0,0 +1,136 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:37
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+# Frozen copies of MyFilmSay.catalogue helpers as they were when this migration was written
+def split_names(value):
+    names = []
+    for part in (value or "").split(","):
+        name = part.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def parse_year(date):
+    match = re.match(r"\s*(\d{4})", date or "")
+    return int(match.group(1)) if match else None
+
+
+def split_movie_strings(apps, schema_editor):
+    Movie = apps.get_model('MyFilmSay', 'Movie')
+    Genre = apps.get_model('MyFilmSay', 'Genre')
+    Person = apps.get_model('MyFilmSay', 'Person')
+    MovieGenre = apps.get_model('MyFilmSay', 'MovieGenre')
+    MovieCredit = apps.get_model('MyFilmSay', 'MovieCredit')
+
+    genres = {}
+    people = {}
+    movie_genres = []
+    movie_credits = []
+
+    for movie in Movie.objects.only('id', 'date', 'genres', 'director', 'writers').iterator(chunk_size=500):
+        year = parse_year(movie.date)
+        if year:
+            Movie.objects.filter(id=movie.id).update(year=year)
+
+        for name in split_names(movie.genres):
+            slug = slugify(name)
+            if not slug:
+                continue
+            if slug not in genres:
+                genres[slug] = Genre.objects.get_or_create(slug=slug, defaults={'name': name})[0].id
+            movie_genres.append(MovieGenre(movie_id=movie.id, genre_id=genres[slug]))
+
+        for job, value in (('director', movie.director), ('writer', movie.writers)):
+            for name in split_names(value):
+                if name not in people:
+                    people[name] = Person.objects.get_or_create(name=name)[0].id
+                movie_credits.append(MovieCredit(movie_id=movie.id, person_id=people[name], job=job))
+
+    MovieGenre.objects.bulk_create(movie_genres, batch_size=1000, ignore_conflicts=True)
+    MovieCredit.objects.bulk_create(movie_credits, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0002_vote_reply_alter_vote_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Person',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='year',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='rating',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MovieGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movie_links', to='MyFilmSay.genre')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genre_links', to='MyFilmSay.movie')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genre_tags',
+            field=models.ManyToManyField(blank=True, related_name='movies', through='MyFilmSay.MovieGenre', to='MyFilmSay.genre'),
+        ),
+        migrations.CreateModel(
+            name='MovieCredit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(choices=[('director', 'Director'), ('writer', 'Writer')], max_length=20)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='MyFilmSay.movie')),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='MyFilmSay.person')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='people',
+            field=models.ManyToManyField(blank=True, related_name='movies', through='MyFilmSay.MovieCredit', to='MyFilmSay.person'),
+        ),
+        migrations.AddIndex(
+            model_name='moviegenre',
+            index=models.Index(fields=['genre', 'movie'], name='moviegenre_genre_movie_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='moviegenre',
+            constraint=models.UniqueConstraint(fields=('movie', 'genre'), name='unique_movie_genre'),
+        ),
+        migrations.AddIndex(
+            model_name='moviecredit',
+            index=models.Index(fields=['person', 'job', 'movie'], name='moviecredit_person_job_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='moviecredit',
+            constraint=models.UniqueConstraint(fields=('movie', 'person', 'job'), name='unique_movie_person_job'),
+        ),
+        migrations.RunPython(split_movie_strings, migrations.RunPython.noop),
+    ]
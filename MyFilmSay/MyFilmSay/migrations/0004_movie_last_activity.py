@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0003_genre_person_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='activity_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0005_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='view_count',
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+    ]
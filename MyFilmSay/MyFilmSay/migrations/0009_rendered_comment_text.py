@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0008_moderation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='text_html',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='text_plain',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='commentreply',
+            name='reply_html',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='commentreply',
+            name='reply_plain',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,159 @@
+from django.db import migrations
+
+# One search document per comment (doc_id = 2 * id) and per reply (doc_id = 2 * id + 1),
+# kept in step with the text_plain / reply_plain columns by triggers.
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    """
+    CREATE TABLE comment_search (
+        doc_id bigint PRIMARY KEY,
+        movie_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    # btree_gin lets one GIN index serve both the movie filter and the text match
+    "CREATE INDEX comment_search_movie_document_idx ON comment_search USING gin (movie_id, document)",
+    """
+    CREATE FUNCTION comment_search_sync_comment() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM comment_search WHERE doc_id = OLD.id * 2;
+        ELSIF NEW.is_deleted THEN
+            DELETE FROM comment_search WHERE doc_id = NEW.id * 2;
+        ELSE
+            INSERT INTO comment_search (doc_id, movie_id, document)
+            VALUES (NEW.id * 2, NEW.movie_id, to_tsvector('english', NEW.text_plain))
+            ON CONFLICT (doc_id) DO UPDATE SET document = EXCLUDED.document;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE FUNCTION comment_search_sync_reply() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM comment_search WHERE doc_id = OLD.id * 2 + 1;
+        ELSIF NEW.is_deleted THEN
+            DELETE FROM comment_search WHERE doc_id = NEW.id * 2 + 1;
+        ELSE
+            INSERT INTO comment_search (doc_id, movie_id, document)
+            SELECT NEW.id * 2 + 1, c.movie_id, to_tsvector('english', NEW.reply_plain)
+            FROM "MyFilmSay_comment" c WHERE c.id = NEW.comment_id
+            ON CONFLICT (doc_id) DO UPDATE SET document = EXCLUDED.document;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER comment_search_sync AFTER INSERT OR DELETE OR UPDATE OF text_plain, is_deleted
+    ON "MyFilmSay_comment" FOR EACH ROW EXECUTE FUNCTION comment_search_sync_comment()
+    """,
+    """
+    CREATE TRIGGER comment_search_sync AFTER INSERT OR DELETE OR UPDATE OF reply_plain, is_deleted
+    ON "MyFilmSay_commentreply" FOR EACH ROW EXECUTE FUNCTION comment_search_sync_reply()
+    """,
+    """
+    INSERT INTO comment_search (doc_id, movie_id, document)
+    SELECT id * 2, movie_id, to_tsvector('english', text_plain) FROM "MyFilmSay_comment" WHERE NOT is_deleted
+    """,
+    """
+    INSERT INTO comment_search (doc_id, movie_id, document)
+    SELECT r.id * 2 + 1, c.movie_id, to_tsvector('english', r.reply_plain)
+    FROM "MyFilmSay_commentreply" r JOIN "MyFilmSay_comment" c ON c.id = r.comment_id
+    WHERE NOT r.is_deleted
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    'DROP TRIGGER IF EXISTS comment_search_sync ON "MyFilmSay_comment"',
+    'DROP TRIGGER IF EXISTS comment_search_sync ON "MyFilmSay_commentreply"',
+    "DROP FUNCTION IF EXISTS comment_search_sync_comment()",
+    "DROP FUNCTION IF EXISTS comment_search_sync_reply()",
+    "DROP TABLE IF EXISTS comment_search",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE comment_search USING fts5(body, movie_id UNINDEXED, tokenize = 'porter unicode61')",
+    """
+    CREATE TRIGGER comment_search_insert_comment AFTER INSERT ON "MyFilmSay_comment" WHEN NOT NEW.is_deleted BEGIN
+        INSERT INTO comment_search (rowid, body, movie_id) VALUES (NEW.id * 2, NEW.text_plain, NEW.movie_id);
+    END
+    """,
+    """
+    CREATE TRIGGER comment_search_update_comment AFTER UPDATE OF text_plain, is_deleted ON "MyFilmSay_comment" BEGIN
+        DELETE FROM comment_search WHERE rowid = OLD.id * 2;
+        INSERT INTO comment_search (rowid, body, movie_id)
+        SELECT NEW.id * 2, NEW.text_plain, NEW.movie_id WHERE NOT NEW.is_deleted;
+    END
+    """,
+    """
+    CREATE TRIGGER comment_search_delete_comment AFTER DELETE ON "MyFilmSay_comment" BEGIN
+        DELETE FROM comment_search WHERE rowid = OLD.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER comment_search_insert_reply AFTER INSERT ON "MyFilmSay_commentreply" WHEN NOT NEW.is_deleted BEGIN
+        INSERT INTO comment_search (rowid, body, movie_id)
+        SELECT NEW.id * 2 + 1, NEW.reply_plain, movie_id FROM "MyFilmSay_comment" WHERE id = NEW.comment_id;
+    END
+    """,
+    """
+    CREATE TRIGGER comment_search_update_reply AFTER UPDATE OF reply_plain, is_deleted ON "MyFilmSay_commentreply"
+    BEGIN
+        DELETE FROM comment_search WHERE rowid = OLD.id * 2 + 1;
+        INSERT INTO comment_search (rowid, body, movie_id)
+        SELECT NEW.id * 2 + 1, NEW.reply_plain, movie_id FROM "MyFilmSay_comment"
+        WHERE id = NEW.comment_id AND NOT NEW.is_deleted;
+    END
+    """,
+    """
+    CREATE TRIGGER comment_search_delete_reply AFTER DELETE ON "MyFilmSay_commentreply" BEGIN
+        DELETE FROM comment_search WHERE rowid = OLD.id * 2 + 1;
+    END
+    """,
+    """
+    INSERT INTO comment_search (rowid, body, movie_id)
+    SELECT id * 2, text_plain, movie_id FROM "MyFilmSay_comment" WHERE NOT is_deleted
+    """,
+    """
+    INSERT INTO comment_search (rowid, body, movie_id)
+    SELECT r.id * 2 + 1, r.reply_plain, c.movie_id
+    FROM "MyFilmSay_commentreply" r JOIN "MyFilmSay_comment" c ON c.id = r.comment_id
+    WHERE NOT r.is_deleted
+    """,
+]
+
+SQLITE_BACKWARD = [
+    *[f"DROP TRIGGER IF EXISTS comment_search_{action}_{kind}"
+      for action in ("insert", "update", "delete") for kind in ("comment", "reply")],
+    "DROP TABLE IF EXISTS comment_search",
+]
+
+STATEMENTS = {
+    "postgresql": (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    "sqlite": (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def run_statements(direction):
+    def run(apps, schema_editor):
+        # Other backends get no index; the search endpoint reports them as unsupported
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        if statements:
+            for sql in statements[direction]:
+                schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0009_rendered_comment_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(0), run_statements(1)),
+    ]
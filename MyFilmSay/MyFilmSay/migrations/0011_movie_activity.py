@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0010_comment_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('comments', models.PositiveIntegerField(default=0)),
+                ('replies', models.PositiveIntegerField(default=0)),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='MyFilmSay.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='movieactivity_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'bucket'), name='unique_movie_activity_bucket')],
+            },
+        ),
+    ]
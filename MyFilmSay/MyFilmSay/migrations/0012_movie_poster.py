@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0011_movie_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0012_movie_poster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentSignature',
+            fields=[
+                ('doc_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('signature', models.BinaryField()),
+                ('duplicate_of', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('doc_id', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key'], name='signatureband_key_idx'), models.Index(fields=['doc_id'], name='signatureband_doc_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Q
+from django.utils import timezone
+
+# The default managers used to hide comments and replies by joining to their author, movie and
+# comment. Soft deletes now mark the children deleted too; this catches up rows whose parents
+# were soft-deleted before that.
+
+
+def hide_orphaned(apps, schema_editor):
+    Comment = apps.get_model('MyFilmSay', 'Comment')
+    CommentReply = apps.get_model('MyFilmSay', 'CommentReply')
+    now = timezone.now()
+
+    Comment.objects.filter(is_deleted=False).filter(
+        Q(author__is_deleted=True) | Q(movie__is_deleted=True)
+    ).update(is_deleted=True, deleted_at=now)
+    CommentReply.objects.filter(is_deleted=False).filter(
+        Q(author__is_deleted=True) | Q(comment__is_deleted=True)
+    ).update(is_deleted=True, deleted_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0014_archivedthread'),
+    ]
+
+    operations = [
+        migrations.RunPython(hide_orphaned, migrations.RunPython.noop),
+    ]
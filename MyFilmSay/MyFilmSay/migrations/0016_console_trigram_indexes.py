@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# The moderation console searches users and comments with icontains, which PostgreSQL runs as
+# UPPER(column::text) LIKE UPPER(pattern). Trigram GIN indexes on that same expression let it use
+# an index scan instead of reading the whole table.
+
+INDEXES = [
+    ("user_name_trgm_idx", "MyFilmSay_user", "name"),
+    ("user_email_trgm_idx", "MyFilmSay_user", "email"),
+    ("comment_text_trgm_idx", "MyFilmSay_comment", "text"),
+]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    *[f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+      for name, table, column in INDEXES],
+]
+
+POSTGRES_BACKWARD = [f"DROP INDEX IF EXISTS {name}" for name, _, _ in INDEXES]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        # SQLite has no trigram indexes; the console falls back to a scan there
+        if schema_editor.connection.vendor == "postgresql":
+            for sql in statements:
+                schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0015_hide_orphaned_comments'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(POSTGRES_FORWARD), run_statements(POSTGRES_BACKWARD)),
+    ]
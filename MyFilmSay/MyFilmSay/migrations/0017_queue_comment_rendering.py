@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.utils import timezone
+
+# Comments and replies from before 0009 have empty rendered columns. Rather than importing the
+# renderer here, the existing render_comments backfill is queued for the task runner; until it
+# gets to a row, pages render that row's markup as they show it.
+
+
+def queue_backfill(apps, schema_editor):
+    Comment = apps.get_model('MyFilmSay', 'Comment')
+    CommentReply = apps.get_model('MyFilmSay', 'CommentReply')
+    Task = apps.get_model('MyFilmSay', 'Task')
+    if not (Comment.objects.filter(text_html="").exists() or CommentReply.objects.filter(reply_html="").exists()):
+        return
+    Task.objects.get_or_create(
+        unique_key="render_comments",
+        status="queued",
+        defaults={"name": "render_comments", "run_at": timezone.now(), "max_attempts": 3},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0016_console_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# manage.py partition_tables swap drops the foreign key constraints that point at Comment, since
+# PostgreSQL cannot reference a partitioned table through id alone. This records that in the model
+# state only: the constraints stay in the database until the swap removes them, and SQLite would
+# otherwise rebuild Comment and CommentReply (and lose the search triggers from 0010) to drop them.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0017_queue_comment_rendering'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='parent',
+                    field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='MyFilmSay.comment'),
+                ),
+                migrations.AlterField(
+                    model_name='commentreply',
+                    name='comment',
+                    field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='replies_set', to='MyFilmSay.comment'),
+                ),
+                migrations.AlterField(
+                    model_name='vote',
+                    name='comment',
+                    field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='MyFilmSay.comment'),
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-19 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MyFilmSay', '0018_partitioned_comment_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedState',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.JSONField()),
+            ],
+        ),
+    ]
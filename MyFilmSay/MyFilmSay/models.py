@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from .markup import render_markup
 
 
 class RoleEnum(models.TextChoices):
@@ -9,21 +10,125 @@ class RoleEnum(models.TextChoices):
     ADMIN = "admin", "Admin"
 
 
+class CreditJobEnum(models.TextChoices):
+    DIRECTOR = "director", "Director"
+    WRITER = "writer", "Writer"
+
+
+class SoftDeleteManager(models.Manager):
+    # Soft-deleting a user, movie or comment marks the comments and replies under it deleted as well
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
+class Genre(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Person(models.Model):
+    name = models.CharField(max_length=250, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Movie(models.Model):
     title = models.CharField(max_length=250, unique=True)
     date = models.CharField(max_length=250)
+    year = models.PositiveSmallIntegerField(blank=True, null=True, db_index=True)
     body = models.TextField()
     img_url = models.CharField(max_length=250, blank=True, null=True)
-    rating = models.FloatField(blank=True, null=True)
+    # Locally cached poster variants: {variant: {extension: file name}}
+    poster = models.JSONField(blank=True, null=True)
+    rating = models.FloatField(blank=True, null=True, db_index=True)
     director = models.CharField(max_length=250, blank=True, null=True)
     writers = models.CharField(max_length=250, blank=True, null=True)
     genres = models.CharField(max_length=250, blank=True, null=True)
+    genre_tags = models.ManyToManyField(Genre, through="MovieGenre", related_name="movies", blank=True)
+    people = models.ManyToManyField(Person, through="MovieCredit", related_name="movies", blank=True)
+    activity_version = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
+    view_count = models.PositiveBigIntegerField(default=0, db_index=True)
+    is_deleted = models.BooleanField(default=False, db_index=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.title
 
 
+class MovieActivity(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="activity")
+    bucket = models.DateTimeField()
+    comments = models.PositiveIntegerField(default=0)
+    replies = models.PositiveIntegerField(default=0)
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["movie", "bucket"], name="unique_movie_activity_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["bucket"], name="movieactivity_bucket_idx"),
+        ]
+
+
+class ContentSignature(models.Model):
+    # doc_id = 2 * id for comments, 2 * id + 1 for replies, as in the comment search index
+    doc_id = models.BigIntegerField(primary_key=True)
+    signature = models.BinaryField()
+    duplicate_of = models.BigIntegerField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class SignatureBand(models.Model):
+    key = models.BigIntegerField()
+    doc_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["key"], name="signatureband_key_idx"),
+            models.Index(fields=["doc_id"], name="signatureband_doc_id_idx"),
+        ]
+
+
+class MovieGenre(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="genre_links")
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name="movie_links")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["movie", "genre"], name="unique_movie_genre"),
+        ]
+        indexes = [
+            models.Index(fields=["genre", "movie"], name="moviegenre_genre_movie_idx"),
+        ]
+
+
+class MovieCredit(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="credits")
+    person = models.ForeignKey(Person, on_delete=models.CASCADE, related_name="credits")
+    job = models.CharField(max_length=20, choices=CreditJobEnum.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["movie", "person", "job"], name="unique_movie_person_job"),
+        ]
+        indexes = [
+            models.Index(fields=["person", "job", "movie"], name="moviecredit_person_job_idx"),
+        ]
+
+
 class MyUserManager(BaseUserManager):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
     def create_user(self, email, password=None, **extra_fields):
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
@@ -44,8 +149,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     role = models.CharField(max_length=20, choices=RoleEnum.choices, default=RoleEnum.USER)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    is_deleted = models.BooleanField(default=False, db_index=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
 
     objects = MyUserManager()
+    all_objects = models.Manager()
     USERNAME_FIELD = 'email'
 
     @property
@@ -60,33 +168,96 @@ class User(AbstractBaseUser, PermissionsMixin):
     def is_user(self):
         return self.role == RoleEnum.USER
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["role", "id"], name="user_role_id_idx"),
+        ]
+
 
 class Comment(models.Model):
     text = models.TextField()
+    # Sanitized HTML and plain text, rendered from text whenever it is written
+    text_html = models.TextField(blank=True, default="")
+    text_plain = models.TextField(blank=True, default="")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     timestamp = models.DateTimeField(default=timezone.now)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="comments")
     user_rating = models.FloatField(blank=True, null=True)
-    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies")
+    # No database constraint: foreign keys cannot reference Comment once it is partitioned
+    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies",
+                               db_constraint=False)
     likes_count = models.IntegerField(default=0)
     dislikes_count = models.IntegerField(default=0)
+    is_deleted = models.BooleanField(default=False, db_index=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"{self.author.name}: {self.text[:30]}"
 
+    @property
+    def html(self):
+        # Rows written before text_html existed render live until the render_comments backfill reaches them
+        return self.text_html or render_markup(self.text)[0]
+
+    def render(self):
+        if getattr(self, "_rendered_text", None) != self.text:
+            self.text_html, self.text_plain = render_markup(self.text)
+            self._rendered_text = self.text
+
+    def save(self, *args, **kwargs):
+        # Every write path, the admin included, keeps the rendered columns in step with text
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "text" in update_fields:
+            self.render()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "text_html", "text_plain"}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["author", "id"], name="comment_author_id_idx"),
+        ]
+
 
 class CommentReply(models.Model):
-    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name="replies_set")
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name="replies_set", db_constraint=False)
     parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="child_replies")
     reply_text = models.TextField()
+    reply_html = models.TextField(blank=True, default="")
+    reply_plain = models.TextField(blank=True, default="")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="replies")
     timestamp = models.DateTimeField(default=timezone.now)
     likes_count = models.IntegerField(default=0)
     dislikes_count = models.IntegerField(default=0)
+    is_deleted = models.BooleanField(default=False, db_index=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"Reply by {self.author.name} to {self.comment.id}"
 
+    @property
+    def html(self):
+        return self.reply_html or render_markup(self.reply_text)[0]
+
+    def render(self):
+        if getattr(self, "_rendered_text", None) != self.reply_text:
+            self.reply_html, self.reply_plain = render_markup(self.reply_text)
+            self._rendered_text = self.reply_text
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "reply_text" in update_fields:
+            self.render()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "reply_html", "reply_plain"}
+        super().save(*args, **kwargs)
+
 
 class Vote(models.Model):
     VOTE_CHOICES = [
@@ -95,7 +266,8 @@ class Vote(models.Model):
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="votes")
-    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name="votes")
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name="votes",
+                                db_constraint=False)
     reply = models.ForeignKey(CommentReply, on_delete=models.CASCADE, null=True, blank=True, related_name="votes")
     vote_type = models.CharField(max_length=10, choices=VOTE_CHOICES)
 
@@ -108,3 +280,69 @@ class Vote(models.Model):
             models.UniqueConstraint(fields=["user", "comment"], name="unique_user_comment_vote"),
             models.UniqueConstraint(fields=["user", "reply"], name="unique_user_reply_vote"),
         ]
+
+
+class ArchivedThread(models.Model):
+    # A cold top-level comment with its replies and votes, as zlib-compressed JSON
+    comment_id = models.BigIntegerField(primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="archived_threads")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_threads")
+    timestamp = models.DateTimeField()
+    reply_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["movie", "-timestamp"], name="archivedthread_movie_idx"),
+        ]
+
+
+class TaskStatusEnum(models.TextChoices):
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+class Task(models.Model):
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=TaskStatusEnum.choices, default=TaskStatusEnum.QUEUED)
+    unique_key = models.CharField(max_length=200, blank=True, null=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    result = models.JSONField(blank=True, null=True)
+    progress = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="tasks")
+    created_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="task_status_run_at_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["unique_key"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="unique_pending_task_key",
+            ),
+        ]
+
+
+class SharedState(models.Model):
+    # Versions and small values every process must agree on: web workers and run_worker each have
+    # their own cache unless a shared backend is configured
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.JSONField()
+
+    def __str__(self):
+        return self.key
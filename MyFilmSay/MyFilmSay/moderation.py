@@ -0,0 +1,124 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .auth import forget_users
+from .duplicates import cluster_members
+from .models import User, Comment, CommentReply, RoleEnum
+from .permissions import has_capability
+from .purge import soft_delete_comments, soft_delete_replies, soft_delete_users
+
+CONSOLE_PAGE_SIZE = 50
+BULK_BATCH_SIZE = 500
+
+# Bulk action -> capability it needs
+USER_ACTIONS = {
+    "role": "assign_roles",
+    "ban": "moderate_content",
+    "unban": "moderate_content",
+    "purge": "delete_users",
+}
+
+
+class ModerationError(Exception):
+    pass
+
+
+def related_count(model, field):
+    rows = model.objects.filter(**{field: OuterRef("pk")}).order_by() \
+        .values(field).annotate(total=Count("id")).values("total")
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def console_users(query="", role="", before=None):
+    users = User.objects.order_by("-id")
+    if query:
+        users = users.filter(Q(name__icontains=query) | Q(email__icontains=query))
+    if role:
+        users = users.filter(role=role)
+    if before:
+        users = users.filter(id__lt=before)
+    return users.annotate(comment_count=related_count(Comment, "author"),
+                          reply_count=related_count(CommentReply, "author"))
+
+
+def console_comments(query="", author_id=None, before=None):
+    comments = Comment.objects.select_related("author", "movie").order_by("-id")
+    if query:
+        comments = comments.filter(text__icontains=query)
+    if author_id:
+        comments = comments.filter(author_id=author_id)
+    if before:
+        comments = comments.filter(id__lt=before)
+    return comments.annotate(reply_count=related_count(CommentReply, "comment"))
+
+
+def console_page(queryset, size=CONSOLE_PAGE_SIZE):
+    # One extra row tells whether there is a next page, so the console never counts the whole table
+    rows = list(queryset[:size + 1])
+    next_before = rows[size - 1].id if len(rows) > size else None
+    return rows[:size], next_before
+
+
+def _batches(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), BULK_BATCH_SIZE):
+        yield ids[start:start + BULK_BATCH_SIZE]
+
+
+def _targets(actor, user_ids):
+    # Nobody acts on themselves, and only admins may act on other admins
+    targets = User.objects.filter(id__in=user_ids).exclude(id=actor.id)
+    if not has_capability(actor, "assign_admin"):
+        targets = targets.exclude(role=RoleEnum.ADMIN)
+    return list(targets.values_list("id", flat=True))
+
+
+def bulk_user_action(actor, action, user_ids, role=None):
+    if action not in USER_ACTIONS:
+        raise ModerationError("Unknown action.")
+    if not has_capability(actor, USER_ACTIONS[action]):
+        raise ModerationError("You do not have permission to do that.")
+    if action == "role":
+        if role not in RoleEnum.values:
+            raise ModerationError("Invalid role.")
+        if role == RoleEnum.ADMIN and not has_capability(actor, "assign_admin"):
+            raise ModerationError("You do not have permission to assign the admin role.")
+
+    changes = {
+        "role": {"role": role},
+        "ban": {"is_active": False},
+        "unban": {"is_active": True},
+    }
+    done = 0
+    for batch in _batches(_targets(actor, user_ids)):
+        if action == "purge":
+            soft_delete_users(batch)
+        else:
+            with transaction.atomic():
+                User.objects.filter(id__in=batch).update(**changes[action])
+                forget_users(batch)
+        done += len(batch)
+    return done
+
+
+def bulk_delete_comments(actor, comment_ids):
+    if not has_capability(actor, "moderate_content"):
+        raise ModerationError("You do not have permission to do that.")
+    done = 0
+    for batch in _batches(Comment.objects.filter(id__in=comment_ids).values_list("id", flat=True)):
+        soft_delete_comments(batch)
+        done += len(batch)
+    return done
+
+
+def bulk_delete_cluster(actor, root, ban_authors=False):
+    if not has_capability(actor, "moderate_content"):
+        raise ModerationError("You do not have permission to do that.")
+    comments, replies = cluster_members(root)
+    for batch in _batches([comment_id for comment_id, _ in comments]):
+        soft_delete_comments(batch)
+    for batch in _batches([reply_id for reply_id, _ in replies]):
+        soft_delete_replies(batch)
+    if ban_authors:
+        bulk_user_action(actor, "ban", {author_id for _, author_id in comments + replies})
+    return len(comments) + len(replies)
@@ -0,0 +1,277 @@
+from django.db import connection, transaction
+
+# PostgreSQL only. Each table is rebuilt online as a hash-partitioned copy:
+#   prepare   create "<table>_partitioned" and a trigger mirroring every write into it
+#   unprepare drop the copy and its trigger again, before a swap
+#   backfill  copy existing rows across in id ranges
+#   swap      rename the copy into place under a short exclusive lock, keeping "<table>_legacy"
+#   drop      drop "<table>_legacy" once the partitioned table has been verified
+#
+# Partition keys must appear in every unique constraint, so Vote is hashed by user_id (both of its
+# unique constraints start with it) and Comment by movie_id, which show_movie always filters on.
+# Foreign keys cannot point at a partitioned table through id alone, so swapping Comment drops the
+# constraints from Vote, CommentReply and Comment.parent; Django already cascades those deletes itself,
+# and the models declare them db_constraint=False (migration 0018). Django keeps addressing rows by
+# id alone, which stays unique because it is still drawn from one sequence.
+PARTITION_COUNT = 16
+BACKFILL_BATCH_SIZE = 10000
+BACKFILLED = "backfilled"
+
+TABLES = {
+    "MyFilmSay_vote": {
+        "key": "user_id",
+        "unique": [
+            ("unique_user_comment_vote", ("user_id", "comment_id")),
+            ("unique_user_reply_vote", ("user_id", "reply_id")),
+        ],
+        "indexes": [
+            ("vote_comment_id_idx", ("comment_id",)),
+            ("vote_reply_id_idx", ("reply_id",)),
+        ],
+        "expression_indexes": [],
+        "foreign_keys": [("user_id", "MyFilmSay_user"), ("reply_id", "MyFilmSay_commentreply")],
+        "triggers": [],
+    },
+    "MyFilmSay_comment": {
+        "key": "movie_id",
+        "unique": [],
+        "indexes": [
+            ("comment_author_id_idx", ("author_id", "id")),
+            ("comment_movie_id_idx", ("movie_id", "id")),
+            ("comment_parent_id_idx", ("parent_id",)),
+            ("comment_is_deleted_idx", ("is_deleted",)),
+        ],
+        # Created by migration 0016 for the moderation console search
+        "expression_indexes": [
+            ("comment_text_trgm_idx", 'USING gin ((UPPER("text"::text)) gin_trgm_ops)'),
+        ],
+        "foreign_keys": [("author_id", "MyFilmSay_user"), ("movie_id", "MyFilmSay_movie")],
+        # Created by migration 0010; moved onto the new table at swap
+        "triggers": [(
+            "comment_search_sync", "comment_search_sync_comment()",
+            "AFTER INSERT OR DELETE OR UPDATE OF text_plain, is_deleted",
+        )],
+    },
+}
+
+
+class PartitionError(Exception):
+    pass
+
+
+def _shadow(table):
+    return f"{table}_partitioned"
+
+
+def _legacy(table):
+    return f"{table}_legacy"
+
+
+def _mirror_function(table):
+    return f"{table.lower()}_partition_mirror"
+
+
+def _fetch(cursor, sql, params=()):
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def _columns(cursor, table):
+    return [name for name, in _fetch(cursor, """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position
+    """, [table])]
+
+
+def _exists(cursor, table):
+    return _fetch(cursor, "SELECT to_regclass(%s) IS NOT NULL", [f'"{table}"'])[0][0]
+
+
+def _quoted(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def _check_vendor():
+    if connection.vendor != "postgresql":
+        raise PartitionError(f"Partitioning needs PostgreSQL, not {connection.vendor}.")
+
+
+def status(table):
+    _check_vendor()
+    with connection.cursor() as cursor:
+        if _exists(cursor, _shadow(table)):
+            comment = _fetch(cursor, "SELECT obj_description(%s::regclass, 'pg_class')", [f'"{_shadow(table)}"'])[0][0]
+            return "backfilled" if comment == BACKFILLED else "mirroring"
+        partitioned = _fetch(cursor, "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", [f'"{table}"'])
+        if partitioned and partitioned[0][0]:
+            return "partitioned, legacy kept" if _exists(cursor, _legacy(table)) else "partitioned"
+        return "not prepared"
+
+
+def prepare(table, partitions=PARTITION_COUNT):
+    _check_vendor()
+    spec = TABLES[table]
+    shadow = _shadow(table)
+    key = spec["key"]
+    state = status(table)
+    if state != "not prepared":
+        raise PartitionError(f"{table} is already {state}.")
+    with transaction.atomic(), connection.cursor() as cursor:
+        columns = _columns(cursor, table)
+        cursor.execute(f'CREATE TABLE "{shadow}" (LIKE "{table}" INCLUDING DEFAULTS) PARTITION BY HASH ("{key}")')
+        for remainder in range(partitions):
+            cursor.execute(f'CREATE TABLE "{table}_p{remainder}" PARTITION OF "{shadow}" '
+                           f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})')
+        cursor.execute(f'ALTER TABLE "{shadow}" ADD CONSTRAINT "{shadow}_pkey" PRIMARY KEY ("id", "{key}")')
+        for name, fields in spec["unique"]:
+            cursor.execute(f'ALTER TABLE "{shadow}" ADD CONSTRAINT "{name}_p" UNIQUE ({_quoted(fields)})')
+        for name, fields in spec["indexes"]:
+            cursor.execute(f'CREATE INDEX "{name}_p" ON "{shadow}" ({_quoted(fields)})')
+        for name, definition in spec["expression_indexes"]:
+            cursor.execute(f'CREATE INDEX "{name}_p" ON "{shadow}" {definition}')
+        for column, target in spec["foreign_keys"]:
+            cursor.execute(f'ALTER TABLE "{shadow}" ADD CONSTRAINT "{shadow}_{column}_fk" FOREIGN KEY ("{column}") '
+                           f'REFERENCES "{target}" ("id") DEFERRABLE INITIALLY DEFERRED')
+
+        # The column list is fixed now; swap refuses to run if the table has changed since
+        function = _mirror_function(table)
+        cursor.execute(f"""
+            CREATE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    DELETE FROM "{shadow}" WHERE id = OLD.id AND "{key}" = OLD."{key}";
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    INSERT INTO "{shadow}" ({_quoted(columns)})
+                    VALUES ({", ".join(f'NEW."{column}"' for column in columns)});
+                END IF;
+                RETURN NULL;
+            END
+            $$
+        """)
+        cursor.execute(f"""
+            CREATE FUNCTION {function}_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                TRUNCATE "{shadow}";
+                RETURN NULL;
+            END
+            $$
+        """)
+        cursor.execute(f'CREATE TRIGGER partition_mirror AFTER INSERT OR UPDATE OR DELETE ON "{table}" '
+                       f'FOR EACH ROW EXECUTE FUNCTION {function}()')
+        cursor.execute(f'CREATE TRIGGER partition_mirror_truncate AFTER TRUNCATE ON "{table}" '
+                       f'FOR EACH STATEMENT EXECUTE FUNCTION {function}_truncate()')
+
+
+def unprepare(table):
+    _check_vendor()
+    function = _mirror_function(table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TRIGGER IF EXISTS partition_mirror ON "{table}"')
+        cursor.execute(f'DROP TRIGGER IF EXISTS partition_mirror_truncate ON "{table}"')
+        cursor.execute(f"DROP FUNCTION IF EXISTS {function}()")
+        cursor.execute(f"DROP FUNCTION IF EXISTS {function}_truncate()")
+        cursor.execute(f'DROP TABLE IF EXISTS "{_shadow(table)}"')
+
+
+def backfill(table, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    _check_vendor()
+    shadow = _shadow(table)
+    with connection.cursor() as cursor:
+        if not _exists(cursor, shadow):
+            raise PartitionError(f"{table} has not been prepared.")
+        columns = _quoted(_columns(cursor, table))
+        # Rows above the high-water mark were written after prepare, so the trigger has them already
+        high = _fetch(cursor, f'SELECT coalesce(max(id), 0) FROM "{table}"')[0][0]
+
+    copied = 0
+    for start in range(0, high, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # FOR SHARE makes concurrent updates and deletes wait, so the trigger always runs after the copy
+            cursor.execute(f"""
+                INSERT INTO "{shadow}" ({columns})
+                SELECT {columns} FROM "{table}" WHERE id > %s AND id <= %s FOR SHARE
+                ON CONFLICT DO NOTHING
+            """, [start, start + batch_size])
+            copied += cursor.rowcount
+        if progress:
+            progress(min(start + batch_size, high), high)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"COMMENT ON TABLE \"{shadow}\" IS '{BACKFILLED}'")
+    return copied
+
+
+def _rename_constraint(cursor, table, old, new):
+    cursor.execute("""
+        SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s
+    """, [f'"{table}"', old])
+    if cursor.fetchone():
+        cursor.execute(f'ALTER TABLE "{table}" RENAME CONSTRAINT "{old}" TO "{new}"')
+
+
+def swap(table):
+    _check_vendor()
+    spec = TABLES[table]
+    shadow = _shadow(table)
+    legacy = _legacy(table)
+    if status(table) != "backfilled":
+        raise PartitionError(f"{table} must be prepared and backfilled before it is swapped.")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+        # Deferred foreign key checks still pending in this transaction would block the ALTERs below
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        if _columns(cursor, table) != _columns(cursor, shadow):
+            raise PartitionError(f"{table} has changed since it was prepared; run prepare again.")
+
+        cursor.execute(f'DROP TRIGGER partition_mirror ON "{table}"')
+        cursor.execute(f'DROP TRIGGER partition_mirror_truncate ON "{table}"')
+        for name, _, _ in spec["triggers"]:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name} ON "{table}"')
+        # Constraints referencing the old table would follow it when it is renamed
+        for referencing, name in _fetch(cursor, """
+            SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = %s::regclass
+        """, [f'"{table}"']):
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT "{name}"')
+
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        old_sequence = _fetch(cursor, "SELECT pg_get_serial_sequence(%s, 'id')", [f'"{legacy}"'])[0][0]
+        if old_sequence:
+            cursor.execute(f'ALTER SEQUENCE {old_sequence} RENAME TO "{legacy}_id_seq"')
+        _rename_constraint(cursor, legacy, f"{table}_pkey", f"{legacy}_pkey")
+        for name, _ in spec["unique"]:
+            _rename_constraint(cursor, legacy, name, f"{name}_legacy")
+        for name, _ in spec["indexes"] + spec["expression_indexes"]:
+            cursor.execute(f'ALTER INDEX IF EXISTS "{name}" RENAME TO "{name}_legacy"')
+
+        cursor.execute(f'ALTER TABLE "{shadow}" RENAME TO "{table}"')
+        cursor.execute(f"COMMENT ON TABLE \"{table}\" IS NULL")
+        _rename_constraint(cursor, table, f"{shadow}_pkey", f"{table}_pkey")
+        for name, _ in spec["unique"]:
+            _rename_constraint(cursor, table, f"{name}_p", name)
+        for name, _ in spec["indexes"] + spec["expression_indexes"]:
+            cursor.execute(f'ALTER INDEX "{name}_p" RENAME TO "{name}"')
+
+        # New ids continue from where the legacy table stopped
+        sequence = f"{table}_id_seq"
+        cursor.execute(f'CREATE SEQUENCE "{sequence}" OWNED BY "{table}"."id"')
+        cursor.execute(f"SELECT setval('\"{sequence}\"', (SELECT coalesce(max(id), 0) + 1 FROM \"{legacy}\"), false)")
+        cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN "id" SET DEFAULT nextval(\'"{sequence}"\')')
+
+        for name, function, events in spec["triggers"]:
+            if _fetch(cursor, "SELECT to_regprocedure(%s) IS NOT NULL", [function])[0][0]:
+                cursor.execute(f'CREATE TRIGGER {name} {events} ON "{table}" FOR EACH ROW EXECUTE FUNCTION {function}')
+
+        function = _mirror_function(table)
+        cursor.execute(f"DROP FUNCTION {function}()")
+        cursor.execute(f"DROP FUNCTION {function}_truncate()")
+
+
+def drop_legacy(table):
+    _check_vendor()
+    with connection.cursor() as cursor:
+        if not _exists(cursor, _legacy(table)):
+            raise PartitionError(f"{table} has no legacy table to drop.")
+        cursor.execute(f'DROP TABLE "{_legacy(table)}"')
@@ -0,0 +1,46 @@
+from functools import wraps
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from .models import RoleEnum
+
+# Each role lists only what it adds; it inherits everything from the roles before it
+ROLE_GRANTS = (
+    (RoleEnum.USER, {"comment", "vote"}),
+    (RoleEnum.MODERATOR, {"manage_movies", "moderate_content", "view_users", "assign_roles"}),
+    (RoleEnum.ADMIN, {"delete_users", "assign_admin"}),
+)
+
+
+def build_capability_map(grants):
+    capabilities = {}
+    inherited = frozenset()
+    for role, added in grants:
+        inherited = inherited | frozenset(added)
+        capabilities[str(role)] = inherited
+    return capabilities
+
+
+CAPABILITIES = build_capability_map(ROLE_GRANTS)
+ALL_CAPABILITIES = frozenset().union(*CAPABILITIES.values())
+
+
+def has_capability(user, capability):
+    if capability not in ALL_CAPABILITIES:
+        raise ValueError(f"Unknown capability: {capability}")
+    return user.is_authenticated and capability in CAPABILITIES.get(user.role, ())
+
+
+def capability_required(capability):
+    if capability not in ALL_CAPABILITIES:
+        raise ValueError(f"Unknown capability: {capability}")
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            if not has_capability(request.user, capability):
+                raise PermissionDenied()
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,79 @@
+import random
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from . import auth
+from .models import Movie
+
+VIEW_COUNT_PREFIX = "views:"
+FLUSH_CHUNK_SIZE = 500
+
+
+def _view_key(movie_id):
+    return f"{VIEW_COUNT_PREFIX}{movie_id}"
+
+
+def record_view(movie_id):
+    rate = settings.VIEW_SAMPLE_RATE
+    if rate < 1 or (rate > 1 and random.random() >= 1 / rate):
+        return
+    if not auth.cache_is_shared():
+        # run_worker flushes from its own cache and would never see this process's counters
+        Movie.objects.filter(id=movie_id).update(view_count=F("view_count") + rate)
+        return
+    key = _view_key(movie_id)
+    try:
+        cache.incr(key, rate)
+    except ValueError:
+        if not cache.add(key, rate, None):
+            cache.incr(key, rate)
+
+
+def counts_views(view_func):
+    @wraps(view_func)
+    def _wrapped_view(request, movie_id, *args, **kwargs):
+        response = view_func(request, movie_id, *args, **kwargs)
+        if request.method == "GET" and response.status_code in (200, 304) \
+                and not getattr(request, "is_cache_warmup", False):
+            record_view(movie_id)
+        return response
+    return _wrapped_view
+
+
+def _pending_counts(movie_ids):
+    keys = {_view_key(movie_id): movie_id for movie_id in movie_ids}
+    return {keys[key]: count for key, count in cache.get_many(keys).items() if count}
+
+
+def flush_view_counts():
+    flushed = 0
+    chunk = []
+    movie_ids = Movie.objects.order_by("id").values_list("id", flat=True).iterator(chunk_size=FLUSH_CHUNK_SIZE)
+    for movie_id in movie_ids:
+        chunk.append(movie_id)
+        if len(chunk) == FLUSH_CHUNK_SIZE:
+            flushed += _flush_chunk(chunk)
+            chunk = []
+    if chunk:
+        flushed += _flush_chunk(chunk)
+    return flushed
+
+
+def _flush_chunk(movie_ids):
+    pending = _pending_counts(movie_ids)
+    with transaction.atomic():
+        for movie_id, count in pending.items():
+            Movie.objects.filter(id=movie_id).update(view_count=F("view_count") + count)
+    # Views recorded while flushing stay in the cache for the next run
+    for movie_id, count in pending.items():
+        try:
+            cache.decr(_view_key(movie_id), count)
+        except ValueError:
+            pass
+    return sum(pending.values())
+
+
+def top_movie_ids(limit):
+    return list(Movie.objects.order_by("-view_count", "-rating").values_list("id", flat=True)[:limit])
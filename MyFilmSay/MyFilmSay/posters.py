@@ -0,0 +1,121 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from .caching import touch_movie
+from .catalogue import bump_catalogue_version
+from .models import Movie
+
+# Variant -> width in pixels; each is stored in every format the local Pillow can write
+POSTER_VARIANTS = {"thumb": 154, "card": 342, "hero": 780}
+POSTER_FORMATS = (
+    ("avif", "AVIF", "image/avif"),
+    ("webp", "WEBP", "image/webp"),
+    ("jpg", "JPEG", "image/jpeg"),
+)
+POSTER_QUALITY = 70
+FETCH_TIMEOUT = 10
+POSTER_NAME_RE = re.compile(r"^[0-9a-f]{32}\.(avif|webp|jpg)$")
+CONTENT_TYPES = {extension: mime for extension, _, mime in POSTER_FORMATS}
+
+
+class PosterError(Exception):
+    pass
+
+
+def fetch_poster(url):
+    import requests
+
+    # img_url is editable by moderators, so only the image host is ever fetched, and without redirects
+    if not any(url.startswith(prefix) for prefix in settings.POSTER_SOURCE_PREFIXES):
+        raise PosterError(f"Posters are only fetched from {', '.join(settings.POSTER_SOURCE_PREFIXES)}")
+    with requests.get(url, stream=True, timeout=FETCH_TIMEOUT, allow_redirects=False) as response:
+        response.raise_for_status()
+        if response.status_code != 200:
+            raise PosterError(f"Poster at {url} answered {response.status_code}")
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data.extend(chunk)
+            if len(data) > settings.POSTER_MAX_BYTES:
+                raise PosterError(f"Poster at {url} is larger than {settings.POSTER_MAX_BYTES} bytes")
+    return bytes(data)
+
+
+def poster_path(name):
+    if not POSTER_NAME_RE.match(name):
+        return None
+    return Path(settings.POSTER_ROOT) / name[:2] / name
+
+
+def poster_names(variants):
+    return {name for formats in (variants or {}).values() for name in formats.values()}
+
+
+def discard_posters(variants):
+    # Files are shared by content, so any name another movie still uses is kept
+    names = poster_names(variants)
+    if names:
+        for poster in Movie.all_objects.filter(poster__isnull=False).values_list("poster", flat=True).iterator():
+            names -= poster_names(poster)
+            if not names:
+                break
+    for name in names:
+        poster_path(name).unlink(missing_ok=True)
+    return len(names)
+
+
+def _write_once(data, extension):
+    # Content-addressed: an existing file with this name already holds these bytes
+    name = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+    path = poster_path(name)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp, path)
+    return name
+
+
+def store_poster(data):
+    from PIL import Image, UnidentifiedImageError, features
+
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            image = original.convert("RGB")
+    except (UnidentifiedImageError, OSError) as e:
+        raise PosterError(f"Not a usable image: {e}")
+
+    variants = {}
+    for variant, width in POSTER_VARIANTS.items():
+        width = min(width, image.width)
+        resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        variants[variant] = {}
+        for extension, pil_format, _ in POSTER_FORMATS:
+            if pil_format != "JPEG" and not features.check(extension):
+                continue
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, quality=POSTER_QUALITY)
+            variants[variant][extension] = _write_once(buffer.getvalue(), extension)
+    return variants
+
+
+def cache_movie_poster(movie_id):
+    movie = Movie.objects.filter(id=movie_id).values("img_url", "poster").first()
+    if movie is None or not movie["img_url"]:
+        return None
+    variants = store_poster(fetch_poster(movie["img_url"]))
+    with transaction.atomic():
+        # Only if the URL is still the one that was fetched
+        updated = Movie.objects.filter(id=movie_id, img_url=movie["img_url"]).update(poster=variants)
+        if updated:
+            touch_movie(movie_id)
+    if updated:
+        bump_catalogue_version()
+        if movie["poster"] and movie["poster"] != variants:
+            discard_posters(movie["poster"])
+    return variants
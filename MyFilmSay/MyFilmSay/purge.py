@@ -0,0 +1,225 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .auth import forget_users
+from .catalogue import bump_catalogue_version
+from .duplicates import forget_documents
+from .models import Movie, User, Comment, CommentReply, Vote
+from .posters import discard_posters
+from .tasks import enqueue, report_progress
+
+
+def _vote_count(field, vote_type):
+    votes = Vote.objects.filter(**{field: OuterRef("pk"), "vote_type": vote_type}) \
+        .values(field).annotate(total=Count("id")).values("total")
+    return Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+
+
+def _recount(queryset, field, movie_path):
+    # Batches by id, each in its own short transaction; only rows whose stored counts are wrong are
+    # written, and only their movies' pages are invalidated
+    changed = 0
+    last_id = 0
+    while True:
+        batch = queryset.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)
+        ids = list(batch[:settings.PURGE_BATCH_SIZE])
+        if not ids:
+            return changed
+        last_id = ids[-1]
+        with transaction.atomic():
+            stale = queryset.filter(id__in=ids).annotate(
+                likes=_vote_count(field, "like"),
+                dislikes=_vote_count(field, "dislike"),
+            ).exclude(likes_count=F("likes"), dislikes_count=F("dislikes"))
+            rows = list(stale.values_list("id", movie_path))
+            if not rows:
+                continue
+            queryset.filter(id__in=[row_id for row_id, _ in rows]).update(
+                likes_count=_vote_count(field, "like"),
+                dislikes_count=_vote_count(field, "dislike"),
+            )
+            _touch_movies(Movie.all_objects.filter(id__in={movie_id for _, movie_id in rows}))
+            changed += len(rows)
+
+
+def recount_vote_counters(comment_ids=None, reply_ids=None):
+    comments = Comment.all_objects.all()
+    replies = CommentReply.all_objects.all()
+    if comment_ids is not None:
+        comments = comments.filter(id__in=comment_ids)
+    if reply_ids is not None:
+        replies = replies.filter(id__in=reply_ids)
+    return _recount(comments, "comment", "movie_id"), _recount(replies, "reply", "comment__movie_id")
+
+
+def _touch_movies(movies):
+    movies.update(activity_version=F("activity_version") + 1, last_activity=timezone.now())
+
+
+def _hide(queryset):
+    # Comments and replies under a soft-deleted user, movie or comment are marked deleted with it,
+    # so the default managers never join to the parents to find out
+    queryset.filter(is_deleted=False).update(is_deleted=True, deleted_at=timezone.now())
+
+
+def soft_delete_comments(comment_ids):
+    comment_ids = list(comment_ids)
+    with transaction.atomic():
+        Comment.all_objects.filter(id__in=comment_ids).update(is_deleted=True, deleted_at=timezone.now())
+        _hide(CommentReply.all_objects.filter(comment_id__in=comment_ids))
+        movie_ids = Comment.all_objects.filter(id__in=comment_ids).values("movie_id")
+        _touch_movies(Movie.all_objects.filter(id__in=movie_ids))
+        return [
+            enqueue("purge_comment", payload={"comment_id": comment_id}, unique_key=f"purge:comment:{comment_id}")
+            for comment_id in comment_ids
+        ]
+
+
+def soft_delete_comment(comment):
+    return soft_delete_comments([comment.id])[0]
+
+
+def soft_delete_replies(reply_ids):
+    first_id = reply_ids[0]
+    reply_ids = list(reply_ids)
+    level = list(reply_ids)
+    while level:
+        level = list(CommentReply.all_objects.filter(parent_id__in=level).values_list("id", flat=True))
+        reply_ids.extend(level)
+
+    with transaction.atomic():
+        CommentReply.all_objects.filter(id__in=reply_ids).update(is_deleted=True, deleted_at=timezone.now())
+        movie_ids = CommentReply.all_objects.filter(id__in=reply_ids).values("comment__movie_id")
+        _touch_movies(Movie.all_objects.filter(id__in=movie_ids))
+        return enqueue("purge_replies", payload={"reply_ids": reply_ids}, unique_key=f"purge:reply:{first_id}")
+
+
+def soft_delete_reply(reply):
+    return soft_delete_replies([reply.id])
+
+
+def soft_delete_movie(movie):
+    with transaction.atomic():
+        Movie.all_objects.filter(id=movie.id).update(is_deleted=True, deleted_at=timezone.now())
+        _hide(CommentReply.all_objects.filter(comment__movie_id=movie.id))
+        _hide(Comment.all_objects.filter(movie_id=movie.id))
+        task = enqueue("purge_movie", payload={"movie_id": movie.id}, unique_key=f"purge:movie:{movie.id}")
+    bump_catalogue_version()
+    return task
+
+
+def soft_delete_users(user_ids):
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        User.all_objects.filter(id__in=user_ids).update(is_deleted=True, deleted_at=timezone.now())
+        forget_users(user_ids)
+        _touch_movies(Movie.all_objects.filter(
+            Q(id__in=Comment.all_objects.filter(author_id__in=user_ids).values("movie_id"))
+            | Q(id__in=CommentReply.all_objects.filter(author_id__in=user_ids).values("comment__movie_id"))
+        ))
+        _hide(CommentReply.all_objects.filter(Q(author_id__in=user_ids) | Q(comment__author_id__in=user_ids)))
+        _hide(Comment.all_objects.filter(author_id__in=user_ids))
+        return [
+            enqueue("purge_user", payload={"user_id": user_id}, unique_key=f"purge:user:{user_id}")
+            for user_id in user_ids
+        ]
+
+
+def soft_delete_user(user):
+    return soft_delete_users([user.id])[0]
+
+
+def _forget_comments(comments):
+    forget_documents(comment_ids=comments.values_list("id", flat=True))
+
+
+def _forget_replies(replies):
+    forget_documents(reply_ids=replies.values_list("id", flat=True))
+
+
+class Purge:
+    # Each step is a queryset, or a (queryset, callback) pair whose callback sees every batch before it is deleted
+    def __init__(self, steps):
+        self.steps = [step if isinstance(step, tuple) else (step, None) for step in steps]
+        self.done = 0
+        self.total = sum(queryset.count() for queryset, _ in self.steps)
+
+    def run(self):
+        report_progress(self.done, self.total)
+        for queryset, on_batch in self.steps:
+            while True:
+                ids = list(queryset.values_list("pk", flat=True)[:settings.PURGE_BATCH_SIZE])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    batch = queryset.model._base_manager.filter(pk__in=ids)
+                    if on_batch is not None:
+                        on_batch(batch)
+                    batch.delete()
+                self.done += len(ids)
+                report_progress(self.done, self.total)
+        return self.done
+
+
+def purge_comment(comment_id):
+    deleted = Purge([
+        Vote.objects.filter(reply__comment_id=comment_id),
+        Vote.objects.filter(comment_id=comment_id),
+        (CommentReply.all_objects.filter(comment_id=comment_id), _forget_replies),
+        (Comment.all_objects.filter(id=comment_id), _forget_comments),
+    ]).run()
+    return {"deleted": deleted}
+
+
+def purge_replies(reply_ids):
+    deleted = Purge([
+        Vote.objects.filter(reply_id__in=reply_ids),
+        # Children first, so the self-referencing CASCADE has nothing left to collect
+        (CommentReply.all_objects.filter(id__in=reply_ids).order_by("-id"), _forget_replies),
+    ]).run()
+    return {"deleted": deleted}
+
+
+def purge_movie(movie_id):
+    poster = Movie.all_objects.filter(id=movie_id).values_list("poster", flat=True).first()
+    deleted = Purge([
+        Vote.objects.filter(reply__comment__movie_id=movie_id),
+        Vote.objects.filter(comment__movie_id=movie_id),
+        (CommentReply.all_objects.filter(comment__movie_id=movie_id).order_by("-id"), _forget_replies),
+        (Comment.all_objects.filter(movie_id=movie_id).order_by("-id"), _forget_comments),
+        Movie.all_objects.filter(id=movie_id),
+    ]).run()
+    bump_catalogue_version()
+    discard_posters(poster)
+    return {"deleted": deleted}
+
+
+def purge_user(user_id):
+    affected = {"comments": set(), "replies": set()}
+
+    def remember_targets(votes):
+        for comment_id, reply_id in votes.values_list("comment_id", "reply_id"):
+            if comment_id:
+                affected["comments"].add(comment_id)
+            if reply_id:
+                affected["replies"].add(reply_id)
+
+    own_comments = Comment.all_objects.filter(author_id=user_id)
+    own_replies = CommentReply.all_objects.filter(Q(author_id=user_id) | Q(comment__author_id=user_id))
+
+    # The user's own votes go first, so counters on other people's content can be fixed afterwards
+    deleted = Purge([
+        (Vote.objects.filter(user_id=user_id), remember_targets),
+        Vote.objects.filter(reply__in=own_replies),
+        Vote.objects.filter(comment__in=own_comments),
+        (own_replies.order_by("-id"), _forget_replies),
+        (own_comments.order_by("-id"), _forget_comments),
+        User.all_objects.filter(id=user_id),
+    ]).run()
+
+    comment_ids = list(affected["comments"])
+    reply_ids = list(affected["replies"])
+    recount_vote_counters(comment_ids=comment_ids, reply_ids=reply_ids)
+    return {"deleted": deleted, "recounted": len(comment_ids) + len(reply_ids)}
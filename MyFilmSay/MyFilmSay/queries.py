@@ -0,0 +1,45 @@
+from django.db.models import Prefetch, Q
+from .models import Comment, CommentReply, Movie, Vote
+
+# The querysets behind the busiest pages. The views and the query plan harness (queryplans.py) both
+# build them here, so the plans checked in query_plans.json are the ones the pages actually run.
+
+
+def movie_list(ordering):
+    # get_all_movies when no catalogue snapshot is mapped, and the snapshot's own sort orders
+    return Movie.objects.order_by(ordering)
+
+
+def movie_search(query):
+    # search when no catalogue snapshot is mapped
+    return Movie.objects.filter(title__icontains=query)
+
+
+def comment_replies():
+    return CommentReply.objects.select_related("author")
+
+
+def comment_page(movie_id, ordering, offset, limit):
+    return Comment.objects.filter(movie_id=movie_id) \
+        .select_related("author") \
+        .prefetch_related(Prefetch("replies_set", queryset=comment_replies())) \
+        .order_by(ordering)[offset:offset + limit]
+
+
+def movie_votes(user_id, movie_id):
+    return Vote.objects.filter(user_id=user_id) \
+        .filter(Q(comment__movie_id=movie_id) | Q(reply__comment__movie_id=movie_id)) \
+        .values_list("comment_id", "reply_id", "vote_type")
+
+
+def locked_votes(user_id, field, ids):
+    return Vote.objects.select_for_update().filter(user_id=user_id, **{f"{field}_id__in": ids}) \
+        .values_list(f"{field}_id", "vote_type")
+
+
+def profile_comments(user_id):
+    return Comment.objects.filter(author_id=user_id).select_related("movie")
+
+
+def profile_replies(user_id):
+    return CommentReply.objects.filter(author_id=user_id).select_related("comment__movie")
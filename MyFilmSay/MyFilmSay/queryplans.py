@@ -0,0 +1,282 @@
+import json
+import re
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+from .models import Comment, CommentReply, Movie, User, Vote
+from .queries import (comment_page, comment_replies, locked_votes, movie_list, movie_search, movie_votes,
+                      profile_comments, profile_replies)
+from .views import COMMENTS_PER_PAGE
+
+SNAPSHOT_PATH = Path(__file__).resolve().parent / "query_plans.json"
+SEARCH_TERM = "the"
+
+# Worst to best; a table moving right-to-left in this list is a regression
+ACCESS_LEVELS = ("seq", "full-index", "index")
+# Postgres row estimates only count as a regression past both of these
+ROW_GROWTH = 10
+ROW_FLOOR = 1000
+
+HOT_QUERIES = {}
+
+
+class PlanError(Exception):
+    pass
+
+
+def hot_query(name):
+    def register(func):
+        HOT_QUERIES[name] = func
+        return func
+    return register
+
+
+@hot_query("show_movie.comments")
+def _show_movie_comments(sample):
+    return comment_page(sample["movie_id"], "-id", 0, COMMENTS_PER_PAGE)
+
+
+@hot_query("show_movie.replies")
+def _show_movie_replies(sample):
+    # The prefetch behind comment_page
+    return comment_replies().filter(comment_id__in=sample["comment_ids"])
+
+
+@hot_query("show_movie.vote_state")
+def _show_movie_vote_state(sample):
+    return movie_votes(sample["user_id"], sample["movie_id"])
+
+
+@hot_query("load_comments")
+def _load_comments(sample):
+    return comment_page(sample["movie_id"], "-timestamp", sample["offset"], COMMENTS_PER_PAGE)
+
+
+# get_all_movies and search read the catalogue snapshot when one is mapped; these are the database
+# queries they fall back to, and the ones the snapshot is built from
+@hot_query("movie_search")
+def _search(sample):
+    return movie_search(SEARCH_TERM)
+
+
+@hot_query("movie_list.title")
+def _movies_by_title(sample):
+    return movie_list("title")
+
+
+@hot_query("movie_list.rating")
+def _movies_by_rating(sample):
+    return movie_list("-rating")
+
+
+@hot_query("movie_list.date")
+def _movies_by_date(sample):
+    return movie_list("-date")
+
+
+@hot_query("user_profile.comments")
+def _profile_comments(sample):
+    return profile_comments(sample["user_id"])
+
+
+@hot_query("user_profile.replies")
+def _profile_replies(sample):
+    return profile_replies(sample["user_id"])
+
+
+@hot_query("vote")
+def _vote_lookup(sample):
+    return locked_votes(sample["user_id"], "comment", sample["comment_ids"])
+
+
+def sample_params():
+    # The busiest movie and author, so the plans are the ones their pages actually get
+    movie_id = Movie.objects.annotate(total=Count("comments")).order_by("-total", "id") \
+        .values_list("id", flat=True).first()
+    user_id = User.objects.annotate(total=Count("comments")).order_by("-total", "id") \
+        .values_list("id", flat=True).first()
+    if movie_id is None or user_id is None:
+        raise PlanError("The database needs at least one movie and one user; run with --seed.")
+    comment_ids = list(Comment.objects.filter(movie_id=movie_id).order_by("-id")
+                       .values_list("id", flat=True)[:COMMENTS_PER_PAGE]) or [0]
+    return {"movie_id": movie_id, "user_id": user_id, "comment_ids": comment_ids, "offset": COMMENTS_PER_PAGE}
+
+
+def seed(movies=200, users=200, comments_per_movie=25, replies_per_comment=1):
+    # Synthetic rows with a realistic fan-out; meant to be rolled back once the plans are taken
+    now = timezone.now()
+    movie_rows = Movie.objects.bulk_create([
+        Movie(title=f"Plan seed movie {i}", date=str(1950 + i % 75), year=1950 + i % 75, body="",
+              rating=(i * 37) % 100 / 10)
+        for i in range(movies)
+    ])
+    user_rows = User.objects.bulk_create([
+        User(email=f"plan-seed-{i}@example.com", name=f"Plan seed {i}", password="!") for i in range(users)
+    ])
+    comment_rows = Comment.objects.bulk_create([
+        Comment(movie=movie, author=user_rows[(m * comments_per_movie + i) % users], text="Seeded comment",
+                text_plain="Seeded comment", timestamp=now - timedelta(minutes=m * comments_per_movie + i))
+        for m, movie in enumerate(movie_rows) for i in range(comments_per_movie)
+    ])
+    reply_rows = CommentReply.objects.bulk_create([
+        CommentReply(comment=comment, author=user_rows[(c + i + 1) % users], reply_text="Seeded reply",
+                     reply_plain="Seeded reply")
+        for c, comment in enumerate(comment_rows) for i in range(replies_per_comment)
+    ])
+    Vote.objects.bulk_create([
+        Vote(user=user_rows[(c + 2) % users], comment=comment, vote_type="like")
+        for c, comment in enumerate(comment_rows)
+    ] + [
+        Vote(user=user_rows[(r + 3) % users], reply=reply, vote_type="dislike")
+        for r, reply in enumerate(reply_rows)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def _relation(name):
+    # Hash partitions of one table ("<table>_p<n>") count as that table
+    return re.sub(r"_p\d+$", "", name)
+
+
+def _postgres_shape(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+    scans = []
+    sort = False
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop(0)
+        children = node.get("Plans", [])
+        nodes.extend(children)
+        node_type = node["Node Type"]
+        sort = sort or node_type in ("Sort", "Incremental Sort")
+        if "Relation Name" not in node:
+            continue
+        if node_type == "Seq Scan":
+            access, index = "seq", None
+        elif node_type == "Bitmap Heap Scan":
+            access = "index"
+            index = ",".join(child["Index Name"] for child in children if "Index Name" in child) or None
+        else:
+            access = "index" if "Index Cond" in node or node_type not in ("Index Scan", "Index Only Scan") \
+                else "full-index"
+            index = node.get("Index Name")
+        scans.append({"relation": _relation(node["Relation Name"]), "access": access, "index": index,
+                      "rows": node["Plan Rows"]})
+    return scans, sort
+
+
+SQLITE_STEP = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\S+)(?: AS \S+)?"
+                         r"(?: USING (?:COVERING )?(?:INDEX (\S+)|(INTEGER PRIMARY KEY|PRIMARY KEY)))?")
+
+
+def _sqlite_shape(sql, params, tables):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        details = [row[-1] for row in cursor.fetchall()]
+
+    scans = []
+    for detail in details:
+        match = SQLITE_STEP.match(detail)
+        if not match:
+            continue
+        verb, table, index, primary_key = match.groups()
+        if verb == "SEARCH":
+            access = "index"
+        else:
+            access = "full-index" if index or primary_key else "seq"
+        # Joined tables show up under their query alias (T6)
+        scans.append({"relation": _relation(tables.get(table, table)), "access": access,
+                      "index": index or (primary_key and "primary key"), "rows": None})
+    return scans, any(detail.startswith("USE TEMP B-TREE") for detail in details)
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == "postgresql":
+        scans, sort = _postgres_shape(sql, params)
+    elif connection.vendor == "sqlite":
+        tables = {alias: join.table_name for alias, join in queryset.query.alias_map.items()}
+        scans, sort = _sqlite_shape(sql, params, tables)
+    else:
+        raise PlanError(f"Plans are not supported on {connection.vendor}.")
+    return {"scans": scans, "sort": sort}
+
+
+def capture(names=None, sample=None):
+    # Run inside a transaction: the vote lookup is a SELECT ... FOR UPDATE
+    sample = sample or sample_params()
+    return {name: explain(HOT_QUERIES[name](sample)) for name in names or HOT_QUERIES}
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    if not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text()).get(connection.vendor, {})
+
+
+def save_snapshot(plans, path=SNAPSHOT_PATH):
+    snapshots = json.loads(Path(path).read_text()) if Path(path).exists() else {}
+    snapshots[connection.vendor] = plans
+    Path(path).write_text(json.dumps(snapshots, indent=2, sort_keys=True) + "\n")
+
+
+def _keyed(scans):
+    # The same table can appear more than once in a plan (joins back to itself)
+    seen = Counter()
+    keyed = {}
+    for scan in scans:
+        seen[scan["relation"]] += 1
+        key = scan["relation"] if seen[scan["relation"]] == 1 else f"{scan['relation']}#{seen[scan['relation']]}"
+        keyed[key] = scan
+    return keyed
+
+
+def _describe(scan):
+    return f"{scan['access']} ({scan['index']})" if scan["index"] else scan["access"]
+
+
+def diff_plans(baseline, current):
+    # {query name: [(is_regression, message)]} for every query whose plan shape changed
+    changes = {}
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current:
+            changes[name] = [(False, "no longer captured")]
+            continue
+        if name not in baseline:
+            changes[name] = [(False, "new query, no baseline")]
+            continue
+        before, after = _keyed(baseline[name]["scans"]), _keyed(current[name]["scans"])
+        lines = []
+        for key in sorted(set(before) | set(after)):
+            old, new = before.get(key), after.get(key)
+            if old is None:
+                lines.append((new["access"] == "seq", f"{key}: new {_describe(new)}"))
+            elif new is None:
+                lines.append((False, f"{key}: no longer read ({_describe(old)})"))
+            else:
+                if _describe(old) != _describe(new):
+                    worse = ACCESS_LEVELS.index(new["access"]) < ACCESS_LEVELS.index(old["access"])
+                    lines.append((worse, f"{key}: {_describe(old)} -> {_describe(new)}"))
+                if old["rows"] is not None and new["rows"] is not None and old["rows"] != new["rows"]:
+                    worse = new["rows"] > max(old["rows"] * ROW_GROWTH, ROW_FLOOR)
+                    if worse or new["rows"] > old["rows"] * 2 or new["rows"] * 2 < old["rows"]:
+                        lines.append((worse, f"{key}: estimated rows {old['rows']} -> {new['rows']}"))
+        if baseline[name]["sort"] != current[name]["sort"]:
+            lines.append((current[name]["sort"],
+                          "sort step added" if current[name]["sort"] else "sort step removed"))
+        if lines:
+            changes[name] = lines
+    return changes
+
+
+def regressions(changes):
+    return {name: [message for worse, message in lines if worse]
+            for name, lines in changes.items() if any(worse for worse, _ in lines)}
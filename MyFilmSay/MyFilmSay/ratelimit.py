@@ -0,0 +1,138 @@
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+from django.http import JsonResponse
+from django.shortcuts import render
+
+RATE_LIMIT_PREFIX = "rl:"
+LOCAL_MEMO_SIZE = 10000
+
+# Closed windows never change again and blocked clients stay blocked until their
+# Retry-After passes, so both can be answered from process memory.
+_closed_windows = {}
+_blocked_until = {}
+
+
+def clear_local_state():
+    _closed_windows.clear()
+    _blocked_until.clear()
+
+
+def _remember(memo, key, value):
+    if len(memo) >= LOCAL_MEMO_SIZE:
+        memo.clear()
+    memo[key] = value
+
+
+@register(Tags.caches)
+def check_rate_limit_cache(app_configs, **kwargs):
+    from .auth import cache_is_shared
+    if cache_is_shared(settings.RATE_LIMIT_CACHE):
+        return []
+    return [Warning(
+        f"RATE_LIMIT_CACHE ({settings.RATE_LIMIT_CACHE!r}) is local to each process.",
+        hint="Every worker counts its own window, so clients get the limit once per worker. "
+             "Point it at a shared backend such as Redis or Memcached.",
+        id="MyFilmSay.W001",
+    )]
+
+
+def client_ip(request):
+    header = settings.RATE_LIMIT_IP_HEADER
+    return request.META.get(header, request.META.get("REMOTE_ADDR", "")).split(",")[0].strip()
+
+
+def rate_identities(request, scope):
+    identities = []
+    if scope in ("user", "user_or_ip") and request.user.is_authenticated:
+        identities.append(f"u{request.user.id}")
+    if scope == "ip" or not identities:
+        identities.append(f"ip{client_ip(request)}")
+    return identities
+
+
+def _increment(cache, key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+def _previous_count(cache, key):
+    if key not in _closed_windows:
+        _remember(_closed_windows, key, cache.get(key, 0))
+    return _closed_windows[key]
+
+
+def check_rate(name, identity, limit, window, now=None):
+    now = time.time() if now is None else now
+    bucket_key = f"{RATE_LIMIT_PREFIX}{name}:{identity}"
+
+    blocked_until = _blocked_until.get(bucket_key)
+    if blocked_until is not None:
+        if blocked_until > now:
+            return math.ceil(blocked_until - now)
+        del _blocked_until[bucket_key]
+
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    current = int(now // window)
+    elapsed = (now % window) / window
+
+    count_key = f"{bucket_key}:{current}"
+    count = _increment(cache, count_key, window * 2)
+    if count <= limit * elapsed:
+        return 0
+
+    previous = _previous_count(cache, f"{bucket_key}:{current - 1}")
+    if previous * (1 - elapsed) + count <= limit:
+        return 0
+
+    # Rejected attempts are not counted, so a flood cannot push the window past its limit
+    try:
+        cache.decr(count_key)
+    except ValueError:
+        pass
+
+    if count <= limit:
+        wait = (1 - (limit - count) / previous) * window - (now % window)
+    else:
+        wait = window - (now % window) + max(0.0, 1 - (limit - 1) / (count - 1)) * window
+    wait = max(wait, 1)
+    _remember(_blocked_until, bucket_key, now + wait)
+    return math.ceil(wait)
+
+
+def too_many_requests(request, retry_after):
+    message = "Too many requests. Please slow down and try again later."
+    if request.content_type == "application/json" or request.headers.get("x-requested-with") == "XMLHttpRequest":
+        response = JsonResponse({"success": False, "message": message}, status=429)
+    else:
+        response = render(request, "error.html", {"message": message}, status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != "POST" or request.resolver_match is None:
+            return None
+        rule = settings.RATE_LIMITS.get(request.resolver_match.url_name)
+        if rule is None:
+            return None
+
+        scope, limit, window = rule
+        for identity in rate_identities(request, scope):
+            retry_after = check_rate(request.resolver_match.url_name, identity, limit, window)
+            if retry_after:
+                return too_many_requests(request, retry_after)
+        return None
@@ -0,0 +1,142 @@
+import re
+from django.db import NotSupportedError, connection
+from django.utils.html import escape
+from .models import Comment, CommentReply
+
+# comment_search is created by migration 0010; doc_id = 2 * id for comments, 2 * id + 1 for replies
+SEARCH_CONFIG = "english"
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+HEADLINE_OPTIONS = (f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, "
+                    "MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=\" … \"")
+
+
+def _keyset(after):
+    if after is None:
+        return "", []
+    rank, doc_id = after
+    return "WHERE rank < %s OR (rank = %s AND doc_id > %s)", [rank, rank, doc_id]
+
+
+def _postgres_rank(movie_id, query, after, limit):
+    keyset, params = _keyset(after)
+    sql = f"""
+        SELECT doc_id, rank FROM (
+            SELECT doc_id, ts_rank(document, query)::float8 AS rank
+            FROM comment_search, websearch_to_tsquery(%s::regconfig, %s) AS query
+            WHERE movie_id = %s AND document @@ query
+        ) AS ranked
+        {keyset}
+        ORDER BY rank DESC, doc_id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [SEARCH_CONFIG, query, movie_id, *params, limit])
+        return cursor.fetchall()
+
+
+def _postgres_headlines(query, comment_ids, reply_ids):
+    sql = """
+        SELECT id * 2, ts_headline(%s::regconfig, text_plain, websearch_to_tsquery(%s::regconfig, %s), %s)
+        FROM "MyFilmSay_comment" WHERE id = ANY(%s)
+        UNION ALL
+        SELECT id * 2 + 1, ts_headline(%s::regconfig, reply_plain, websearch_to_tsquery(%s::regconfig, %s), %s)
+        FROM "MyFilmSay_commentreply" WHERE id = ANY(%s)
+    """
+    params = [SEARCH_CONFIG, SEARCH_CONFIG, query, HEADLINE_OPTIONS]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, comment_ids, *params, reply_ids])
+        return dict(cursor.fetchall())
+
+
+def _fts5_query(query):
+    # Quoted terms are matched literally, so user input can't inject FTS5 operators
+    return " ".join(f'"{term}"' for term in re.findall(r"\w+", query))
+
+
+def _sqlite_rank(movie_id, query, after, limit):
+    keyset, params = _keyset(after)
+    sql = f"""
+        SELECT doc_id, rank FROM (
+            SELECT rowid AS doc_id, -bm25(comment_search) AS rank
+            FROM comment_search
+            WHERE comment_search MATCH %s AND movie_id = %s
+        )
+        {keyset}
+        ORDER BY rank DESC, doc_id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_fts5_query(query), movie_id, *params, limit])
+        return cursor.fetchall()
+
+
+def _sqlite_headlines(query, comment_ids, reply_ids):
+    doc_ids = [i * 2 for i in comment_ids] + [i * 2 + 1 for i in reply_ids]
+    placeholders = ", ".join(["%s"] * len(doc_ids))
+    sql = f"""
+        SELECT rowid, snippet(comment_search, 0, %s, %s, ' … ', 24)
+        FROM comment_search
+        WHERE comment_search MATCH %s AND rowid IN ({placeholders})
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [HIGHLIGHT_START, HIGHLIGHT_STOP, _fts5_query(query), *doc_ids])
+        return dict(cursor.fetchall())
+
+
+BACKENDS = {
+    "postgresql": (_postgres_rank, _postgres_headlines),
+    "sqlite": (_sqlite_rank, _sqlite_headlines),
+}
+
+
+def highlight(headline):
+    # The headline is built from plain text, so it is escaped before the markers become <mark>
+    return escape(headline).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+
+
+def search_comments(movie_id, query, after=None, limit=20):
+    if connection.vendor not in BACKENDS:
+        raise NotSupportedError(f"Comment search is not available on {connection.vendor}")
+    rank_page, headlines_for = BACKENDS[connection.vendor]
+    if not query.strip() or (connection.vendor == "sqlite" and not _fts5_query(query)):
+        return [], None
+
+    ranked = rank_page(movie_id, query, after, limit + 1)
+    next_after = None
+    if len(ranked) > limit:
+        doc_id, rank = ranked[limit - 1]
+        next_after = [rank, doc_id]
+    ranked = ranked[:limit]
+
+    comment_ids = [doc_id // 2 for doc_id, _ in ranked if doc_id % 2 == 0]
+    reply_ids = [doc_id // 2 for doc_id, _ in ranked if doc_id % 2 == 1]
+    headlines = headlines_for(query, comment_ids, reply_ids) if ranked else {}
+
+    # Soft-deleted authors and parents stay indexed until purged; the managers hide them here
+    comments = {
+        row["id"]: row for row in Comment.objects.filter(id__in=comment_ids)
+        .values("id", "author_id", "author__name", "timestamp")
+    }
+    replies = {
+        row["id"]: row for row in CommentReply.objects.filter(id__in=reply_ids)
+        .values("id", "comment_id", "author_id", "author__name", "timestamp")
+    }
+
+    results = []
+    for doc_id, rank in ranked:
+        object_id = doc_id // 2
+        row = replies.get(object_id) if doc_id % 2 else comments.get(object_id)
+        if row is None:
+            continue
+        results.append({
+            "type": "reply" if doc_id % 2 else "comment",
+            "id": object_id,
+            "comment_id": row.get("comment_id", object_id),
+            "author_id": row["author_id"],
+            "author_name": row["author__name"],
+            "timestamp": row["timestamp"],
+            "rank": rank,
+            "headline": highlight(headlines.get(doc_id, "")),
+        })
+    return results, next_after
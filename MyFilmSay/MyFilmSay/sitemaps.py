@@ -0,0 +1,204 @@
+import hashlib
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.db.models import F, IntegerField, Max, Value
+from django.db.models.functions import Cast
+from django.urls import reverse
+from .catalogue import catalogue_version
+from .models import Movie
+from .state import bump_state_version, state_version
+
+# Shards are fixed id ranges, so a change to one movie only rebuilds the file covering its id.
+# Soft-deleted movies leave holes, which keeps every shard at or under the 50k-URL limit.
+# Catalogue changes (additions, edits, deletions) bump the catalogue version, which every file name
+# includes. Comments and votes only move last_activity; the periodic build_sitemaps job picks those
+# up, so requests keep serving the existing files in between. Versions live in the database, so a
+# rebuild by run_worker changes the file names every web worker looks for.
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+ITERATOR_CHUNK_SIZE = 2000
+INDEX_VERSION_KEY = "sitemap_version"
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _shard_key(shard):
+    return f"sitemap_version:{shard}"
+
+
+def shard_of(movie_id):
+    return (movie_id - 1) // settings.SITEMAP_SHARD_SIZE
+
+
+def shard_range(shard):
+    return shard * settings.SITEMAP_SHARD_SIZE + 1, (shard + 1) * settings.SITEMAP_SHARD_SIZE
+
+
+def invalidate_shards(shards):
+    for shard in shards:
+        bump_state_version(_shard_key(shard))
+    bump_state_version(INDEX_VERSION_KEY)
+
+
+def base_url(request=None):
+    # The canonical site URL when configured, so precomputed files match what crawlers are served
+    if settings.SITEMAP_BASE_URL or request is None:
+        return settings.SITEMAP_BASE_URL.rstrip("/")
+    return request.build_absolute_uri("/").rstrip("/")
+
+
+def _site_dir(base):
+    # Absolute URLs are baked into the files, so each host name gets its own set
+    return Path(settings.SITEMAP_ROOT) / hashlib.md5(base.encode()).hexdigest()[:12]
+
+
+def shard_version(shard):
+    return f"{catalogue_version()}.{state_version(_shard_key(shard))}"
+
+
+def index_version():
+    return f"{catalogue_version()}.{state_version(INDEX_VERSION_KEY)}"
+
+
+def _ns(moment):
+    # Exact, unlike a float timestamp, so a file's mtime compares equal to the activity it was built from
+    return (moment - EPOCH) // timedelta(microseconds=1) * 1000
+
+
+def _w3c(moment):
+    return moment.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _publish(path, prefix, write):
+    # Written to a temporary file and renamed, so a reader never sees half a sitemap;
+    # older versions of the same file are removed once the new one is in place
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            last_modified = write(out)
+        if last_modified is not None:
+            os.utime(tmp, ns=(time.time_ns(), _ns(last_modified)))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    for stale in path.parent.glob(f"{prefix}-*.xml"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return path
+
+
+def _write_shard(out, base, shard):
+    out.write(f'{XML_DECLARATION}<urlset xmlns="{SITEMAP_NS}">\n')
+    last_modified = None
+    rows = Movie.objects.filter(id__range=shard_range(shard)).order_by("id").values_list("id", "last_activity")
+    for movie_id, last_activity in rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        out.write(f"<url><loc>{escape(base + reverse('show_movie', args=[movie_id]))}</loc>"
+                  f"<lastmod>{_w3c(last_activity)}</lastmod></url>\n")
+        last_modified = max(last_modified or last_activity, last_activity)
+    out.write("</urlset>\n")
+    return last_modified
+
+
+def shard_summary():
+    # [(shard, last activity)] for every shard holding at least one movie, in one grouped query
+    shard = Cast((F("id") - 1) / Value(settings.SITEMAP_SHARD_SIZE), IntegerField())
+    return list(Movie.objects.annotate(shard=shard).values("shard").order_by("shard")
+                .annotate(last=Max("last_activity")).values_list("shard", "last"))
+
+
+def _write_index(out, base):
+    out.write(f'{XML_DECLARATION}<sitemapindex xmlns="{SITEMAP_NS}">\n')
+    summary = shard_summary()
+    for shard, last_activity in summary:
+        out.write(f"<sitemap><loc>{escape(base + reverse('sitemap_shard', args=[shard]))}</loc>"
+                  f"<lastmod>{_w3c(last_activity)}</lastmod></sitemap>\n")
+    out.write("</sitemapindex>\n")
+    return max((last for _, last in summary), default=None)
+
+
+def _shard_path(base, shard):
+    return _site_dir(base) / f"sitemap-{shard}-{shard_version(shard)}.xml"
+
+
+def shard_file(base, shard):
+    path = _shard_path(base, shard)
+    if path.exists():
+        return path
+    if not Movie.objects.filter(id__range=shard_range(shard)).exists():
+        return None
+    return _publish(path, f"sitemap-{shard}", lambda out: _write_shard(out, base, shard))
+
+
+def index_file(base):
+    path = _site_dir(base) / f"index-{index_version()}.xml"
+    if path.exists():
+        return path
+    return _publish(path, "index", lambda out: _write_index(out, base))
+
+
+def _behind(path, last_activity):
+    # The file's mtime is the newest last_activity written into it
+    try:
+        return path.stat().st_mtime_ns < _ns(last_activity)
+    except FileNotFoundError:
+        return False
+
+
+def build_all(base):
+    summary = shard_summary()
+    behind = [shard for shard, last_activity in summary if _behind(_shard_path(base, shard), last_activity)]
+    if behind:
+        invalidate_shards(behind)
+    built = [index_file(base)]
+    for shard, _ in summary:
+        built.append(shard_file(base, shard))
+    return built
+
+
+def _open(build):
+    path = build()
+    try:
+        return path and path.open("rb")
+    except FileNotFoundError:
+        # A newer version was published, and this one removed, between finding and opening it
+        path = build()
+        return path and path.open("rb")
+
+
+def open_index(base):
+    return _open(lambda: index_file(base))
+
+
+def open_shard(base, shard):
+    return _open(lambda: shard_file(base, shard))
+
+
+def _file_modified(path):
+    if path is None:
+        return None
+    try:
+        return datetime.fromtimestamp(path.stat().st_mtime, tz=dt_timezone.utc)
+    except FileNotFoundError:
+        return None
+
+
+def sitemap_index_etag(request):
+    return f"sitemap-index-{index_version()}-{_site_dir(base_url(request)).name}"
+
+
+def sitemap_index_last_modified(request):
+    return _file_modified(index_file(base_url(request)))
+
+
+def sitemap_shard_etag(request, shard):
+    return f"sitemap-{shard}-{shard_version(shard)}-{_site_dir(base_url(request)).name}"
+
+
+def sitemap_shard_last_modified(request, shard):
+    return _file_modified(shard_file(base_url(request), shard))
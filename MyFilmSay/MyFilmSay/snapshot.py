@@ -0,0 +1,314 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Movie, TaskStatusEnum
+from .queries import movie_list
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+# A read-only copy of the movie metadata in one file: a JSON header followed by 8-byte aligned
+# columns (ids, numbers, UTF-8 string blobs with offsets, null flags and precomputed sort orders).
+# Every worker maps the same file, so the pages are held once in the OS page cache however many
+# processes read them. A new version is written to a temporary file and renamed over SNAPSHOT_NAME;
+# workers notice by its inode changing. A movie change removes the file, sending every worker to the
+# database, and queues the publish_snapshot task to write the next one.
+MAGIC = b"MFSCAT01"
+SNAPSHOT_NAME = "catalogue.bin"
+STRING_FIELDS = ("title", "date", "body", "img_url", "director", "writers", "genres", "poster")
+NUMBER_FIELDS = (("rating", "d"), ("year", "q"))
+FIELDS = ("id", *STRING_FIELDS, *(field for field, _ in NUMBER_FIELDS))
+# The orderings get_all_movies uses, taken from the database so collation and NULL placement match
+ORDERINGS = ("title", "-rating", "-date")
+NUMBER_COLUMNS = {field for field, _ in NUMBER_FIELDS}
+BUILD_TASK = "publish_snapshot"
+ITERATOR_CHUNK_SIZE = 2000
+
+_lock = threading.Lock()
+_current = None
+_build_requested = False
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class MovieRecord:
+    # Fields are decoded from the mapped file the first time they are read, so a listing never
+    # decodes the bodies it does not show
+    def __init__(self, snapshot, row):
+        self._snapshot = snapshot
+        self._row = row
+
+    def __getattr__(self, name):
+        if name not in FIELDS:
+            raise AttributeError(name)
+        value = self._snapshot.field(name, self._row)
+        setattr(self, name, value)
+        return value
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.title
+
+
+def request_build():
+    build = enqueue(BUILD_TASK, unique_key=BUILD_TASK)
+    if build.status == TaskStatusEnum.RUNNING:
+        # It may have read the rows before this change, so another build follows it
+        enqueue(BUILD_TASK, unique_key=f"{BUILD_TASK}:again")
+
+
+def retire_snapshot():
+    snapshot_path().unlink(missing_ok=True)
+    request_build()
+
+
+def invalidate_snapshot():
+    if settings.CATALOGUE_SNAPSHOT:
+        transaction.on_commit(retire_snapshot)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def _invalidate_saved_movie(sender, instance, **kwargs):
+    invalidate_snapshot()
+
+
+def snapshot_path():
+    return Path(settings.CATALOGUE_SNAPSHOT_ROOT) / SNAPSHOT_NAME
+
+
+def _encode(value):
+    return (json.dumps(value) if isinstance(value, dict) else str(value)).encode()
+
+
+def _collect():
+    ids = array("q")
+    numbers = {field: (array(typecode), bytearray()) for field, typecode in NUMBER_FIELDS}
+    strings = {field: (array("q", [0]), bytearray(), bytearray()) for field in (*STRING_FIELDS, "title.folded")}
+
+    rows = Movie.objects.order_by("id").values_list("id", *STRING_FIELDS, *(field for field, _ in NUMBER_FIELDS))
+    for row in rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        ids.append(row[0])
+        values = dict(zip(STRING_FIELDS, row[1:]))
+        values["title.folded"] = values["title"].lower()
+        for field, (offsets, data, nulls) in strings.items():
+            value = values[field]
+            if value is not None:
+                data += _encode(value)
+            offsets.append(len(data))
+            nulls.append(value is None)
+        for (field, _), value in zip(NUMBER_FIELDS, row[1 + len(STRING_FIELDS):]):
+            column, nulls = numbers[field]
+            column.append(value if value is not None else 0)
+            nulls.append(value is None)
+
+    row_of = {movie_id: row for row, movie_id in enumerate(ids)}
+    sections = [("id", ids)]
+    for field, (column, nulls) in numbers.items():
+        sections += [(field, column), (f"{field}.null", nulls)]
+    for field, (offsets, data, nulls) in strings.items():
+        sections += [(f"{field}.offsets", offsets), (f"{field}.data", data), (f"{field}.null", nulls)]
+    for ordering in ORDERINGS:
+        # Movies added since the first query are left out; their save queues another build
+        ordered = movie_list(ordering).values_list("id", flat=True)
+        sections.append((f"order:{ordering}", array("q", (row_of[i] for i in ordered.iterator() if i in row_of))))
+    return len(ids), sections
+
+
+def _pad(length):
+    return -length % 8
+
+
+def write_snapshot(path, version):
+    count, sections = _collect()
+    index = {}
+    offset = 0
+    for name, data in sections:
+        typecode = data.typecode if isinstance(data, array) else "B"
+        size = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        index[name] = [offset, size, typecode]
+        offset += size + _pad(size)
+    header = json.dumps({"version": version, "count": count, "byteorder": sys.byteorder, "sections": index}).encode()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(MAGIC + struct.pack("<Q", len(header)) + header + b"\0" * _pad(len(header)))
+            for name, data in sections:
+                raw = data.tobytes() if isinstance(data, array) else bytes(data)
+                out.write(raw + b"\0" * _pad(len(raw)))
+        # Workers still mapping the previous file keep reading it until they next stat the path
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+class CatalogueSnapshot:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(path, "rb") as snapshot_file:
+            self.identity = _identity(os.fstat(snapshot_file.fileno()))
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{path} is not a catalogue snapshot")
+        (length,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self._map[start:start + length])
+        if header["byteorder"] != sys.byteorder:
+            raise SnapshotError(f"{path} was written on a {header['byteorder']}-endian machine")
+        self.version = header["version"]
+        self.count = header["count"]
+
+        base = start + length + _pad(length)
+        view = memoryview(self._map)
+        self._bounds = {}
+        self._columns = {}
+        for name, (offset, size, typecode) in header["sections"].items():
+            self._bounds[name] = (base + offset, base + offset + size)
+            self._columns[name] = view[base + offset:base + offset + size].cast(typecode)
+
+    @property
+    def size(self):
+        return len(self._map)
+
+    def _string(self, field, row):
+        if self._columns[f"{field}.null"][row]:
+            return None
+        offsets = self._columns[f"{field}.offsets"]
+        return str(self._columns[f"{field}.data"][offsets[row]:offsets[row + 1]], "utf-8")
+
+    def _number(self, field, row):
+        return None if self._columns[f"{field}.null"][row] else self._columns[field][row]
+
+    def field(self, name, row):
+        if name == "id":
+            return self._columns["id"][row]
+        if name in NUMBER_COLUMNS:
+            return self._number(name, row)
+        value = self._string(name, row)
+        return json.loads(value) if name == "poster" and value else value
+
+    def record(self, row):
+        return MovieRecord(self, row)
+
+    def get(self, movie_id):
+        ids = self._columns["id"]
+        row = bisect_left(ids, movie_id)
+        if row == len(ids) or ids[row] != movie_id:
+            return None
+        return self.record(row)
+
+    def ordered(self, ordering):
+        return [self.record(row) for row in self._columns[f"order:{ordering}"]]
+
+    def search(self, query):
+        # title__icontains over the lower-cased titles, scanned straight from the mapped file
+        needle = query.lower().encode()
+        start, end = self._bounds["title.folded.data"]
+        offsets = self._columns["title.folded.offsets"]
+        rows = []
+        position = self._map.find(needle, start, end) if needle else -1
+        while position != -1:
+            row = bisect_right(offsets, position - start) - 1
+            if position - start + len(needle) <= offsets[row + 1]:
+                rows.append(row)
+                position = self._map.find(needle, start + offsets[row + 1], end)
+            else:
+                position = self._map.find(needle, position + 1, end)
+        return [self.record(row) for row in rows]
+
+
+def publish_snapshot():
+    return write_snapshot(snapshot_path(), uuid.uuid4().hex)
+
+
+def _identity(stat):
+    # os.replace gives every published file a new inode
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def current_snapshot():
+    # None means "ask the database": snapshots are off, or none is published right now
+    global _current, _build_requested
+    if not settings.CATALOGUE_SNAPSHOT:
+        return None
+    path = snapshot_path()
+    try:
+        identity = _identity(path.stat())
+    except FileNotFoundError:
+        if not _build_requested:
+            # Once per process; a movie change queues the build itself
+            _build_requested = True
+            request_build()
+        return None
+    loaded = _current
+    if loaded is not None and loaded.identity == identity:
+        return loaded
+
+    with _lock:
+        if _current is not None and _current.identity == identity:
+            return _current
+        try:
+            _current = CatalogueSnapshot(path)
+        except (OSError, SnapshotError) as e:
+            logger.error(f"Catalogue snapshot {path} unavailable: {str(e)}", exc_info=True)
+            return None
+        _build_requested = False
+    memory = resident_memory()
+    logger.info(f"Mapped catalogue snapshot {_current.version} ({_current.count} movies, {_current.size} bytes); "
+                f"worker {memory['pid']} RSS {memory['rss_kb']} kB, {memory['rss_file_kb']} kB file-backed")
+    return _current
+
+
+def resident_memory():
+    # Linux /proc figures; mapped snapshot pages show up as file-backed and are shared between workers
+    fields = {}
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        import resource
+        # Peak rather than current, but the best portable figure
+        fields["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "pid": os.getpid(),
+        "rss_kb": fields.get("VmRSS"),
+        "rss_anon_kb": fields.get("RssAnon"),
+        "rss_file_kb": fields.get("RssFile"),
+        "rss_shmem_kb": fields.get("RssShmem"),
+    }
+
+
+def snapshot_status():
+    snapshot = current_snapshot()
+    return {
+        "enabled": settings.CATALOGUE_SNAPSHOT,
+        "version": snapshot.version if snapshot else None,
+        "movies": snapshot.count if snapshot else None,
+        "bytes": snapshot.size if snapshot else None,
+        **resident_memory(),
+    }
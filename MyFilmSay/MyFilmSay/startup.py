@@ -0,0 +1,44 @@
+import re
+from importlib import import_module
+from django.core.cache import caches
+from django.db import connections
+
+# Imported on first use by the code that needs them; a preloading master pulls them in before forking
+LAZY_MODULES = ("numpy", "requests", "markdown", "PIL.Image")
+PRELOAD_TEMPLATES = ("index.html", "browse.html", "movie.html", "partials/comment_list.html", "search_results.html")
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def preload():
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    for name in LAZY_MODULES:
+        try:
+            import_module(name)
+        except ImportError:
+            pass
+    for name in PRELOAD_TEMPLATES:
+        get_template(name)
+    # Connections opened while warming up must not be shared with the forked workers
+    connections.close_all()
+    for cache in caches.all(initialized_only=True):
+        cache.close()
+
+
+def parse_importtime(output):
+    # Lines of python -X importtime: "import time: <self us> | <cumulative us> | <indent><module>"
+    modules = []
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append({
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": len(indent) // 2,
+            })
+    return modules
@@ -0,0 +1,25 @@
+import time
+from .models import SharedState
+
+
+def read_state(key, default=None):
+    value = SharedState.objects.filter(key=key).values_list("value", flat=True).first()
+    return default if value is None else value
+
+
+def write_state(key, value):
+    if not SharedState.objects.filter(key=key).update(value=value):
+        _, created = SharedState.objects.get_or_create(key=key, defaults={"value": value})
+        if not created:
+            SharedState.objects.filter(key=key).update(value=value)
+
+
+def state_version(key):
+    return read_state(key, 0)
+
+
+def bump_state_version(key):
+    # A timestamp rather than an increment, so concurrent bumps need no lock and still change it
+    version = time.time_ns()
+    write_state(key, version)
+    return version
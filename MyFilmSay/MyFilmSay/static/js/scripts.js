@@ -19,40 +19,70 @@ function initializeReplyToggle() {
     });
 }
 
-function initializeVoteButtons() {
-    document.querySelectorAll('.vote-button').forEach(button => {
-        button.addEventListener('click', function () {
-            const commentId = this.dataset.commentId;
-            const voteType = this.dataset.voteType;
-            const csrftoken = getCookie('csrftoken');
-
-            fetch('/vote/', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': csrftoken
-                },
-                body: JSON.stringify({
-                    comment_id: commentId,
-                    vote_type: voteType
-                })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    const commentElement = this.closest('.comment, .reply');
-                    const likeButton = commentElement.querySelector(`.vote-button[data-comment-id="${commentId}"][data-vote-type="like"]`);
-                    const dislikeButton = commentElement.querySelector(`.vote-button[data-comment-id="${commentId}"][data-vote-type="dislike"]`);
+const VOTE_BATCH_DELAY = 400;
+const VOTE_BATCH_LIMIT = 50;
+let pendingVotes = [];
+let voteTimer = null;
 
-                    if (likeButton) likeButton.innerHTML = `Like (${data.likes})`;
-                    if (dislikeButton) dislikeButton.innerHTML = `Dislike (${data.dislikes})`;
-                } else {
-                    alert(data.message);
-                }
-            })
-            .catch(error => console.error('Error:', error));
+function initializeVoteButtons() {
+    // Delegated, so buttons in comments added by "Load more" work too
+    document.addEventListener('click', function (event) {
+        const button = event.target.closest('.vote-button');
+        if (!button) return;
+        pendingVotes.push({
+            comment_id: button.dataset.commentId,
+            vote_type: button.dataset.voteType
         });
+        clearTimeout(voteTimer);
+        if (pendingVotes.length >= VOTE_BATCH_LIMIT) {
+            flushVotes();
+        } else {
+            voteTimer = setTimeout(flushVotes, VOTE_BATCH_DELAY);
+        }
     });
+    window.addEventListener('pagehide', flushVotes);
+}
+
+function flushVotes() {
+    clearTimeout(voteTimer);
+    if (pendingVotes.length === 0) return;
+    const votes = pendingVotes;
+    pendingVotes = [];
+
+    fetch('/vote/batch/', {
+        method: 'POST',
+        keepalive: true,
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: JSON.stringify({ votes: votes })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            Object.entries(data.counts).forEach(([commentId, counts]) => updateVoteButtons(commentId, counts));
+        } else {
+            alert(data.message);
+        }
+    })
+    .catch(error => console.error('Error:', error));
+}
+
+function updateVoteButtons(commentId, counts) {
+    const likeButton = document.querySelector(`.vote-button[data-comment-id="${commentId}"][data-vote-type="like"]`);
+    const dislikeButton = document.querySelector(`.vote-button[data-comment-id="${commentId}"][data-vote-type="dislike"]`);
+
+    if (likeButton) {
+        likeButton.innerHTML = `Like (${counts.likes})`;
+        likeButton.classList.toggle('active', counts.vote === 'like');
+        likeButton.setAttribute('aria-pressed', counts.vote === 'like');
+    }
+    if (dislikeButton) {
+        dislikeButton.innerHTML = `Dislike (${counts.dislikes})`;
+        dislikeButton.classList.toggle('active', counts.vote === 'dislike');
+        dislikeButton.setAttribute('aria-pressed', counts.vote === 'dislike');
+    }
 }
 
 function initializeDeleteButtons() {
@@ -270,7 +300,7 @@ document.addEventListener('click', function(e) {
         .then(res => res.json())
         .then(data => {
             if (data.success) {
-                document.querySelector(`.comment-display-${commentId}`).innerHTML = newText;
+                document.querySelector(`.comment-display-${commentId}`).innerHTML = data.html;
                 document.querySelector(`.comment-display-${commentId}`).style.display = 'block';
                 document.querySelector(`.edit-form-${commentId}`).style.display = 'none';
             } else {
@@ -308,7 +338,7 @@ document.addEventListener('click', function(e) {
         .then(res => res.json())
         .then(data => {
             if (data.success) {
-                document.querySelector(`.comment-display-${replyId}`).innerHTML = newText;
+                document.querySelector(`.comment-display-${replyId}`).innerHTML = data.html;
                 document.querySelector(`.comment-display-${replyId}`).style.display = 'block';
                 document.querySelector(`.edit-form-${replyId}`).style.display = 'none';
             } else {
@@ -0,0 +1,170 @@
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Task, TaskStatusEnum
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+PERIODIC_TASKS = {}
+
+_current = threading.local()
+
+
+class PermanentTaskError(Exception):
+    pass
+
+
+def task(name, max_attempts=3, retry_delay=30, every=None):
+    def decorator(func):
+        TASKS[name] = {"func": func, "max_attempts": max_attempts, "retry_delay": retry_delay}
+        if every:
+            PERIODIC_TASKS[name] = every
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, run_at=None, unique_key=None, created_by=None):
+    if name not in TASKS:
+        raise KeyError(f"Unknown task: {name}")
+    try:
+        with transaction.atomic():
+            return Task.objects.create(
+                name=name,
+                payload=payload or {},
+                run_at=run_at or timezone.now(),
+                unique_key=unique_key,
+                max_attempts=TASKS[name]["max_attempts"],
+                created_by=created_by,
+            )
+    except IntegrityError:
+        existing = Task.objects.filter(
+            unique_key=unique_key, status__in=[TaskStatusEnum.QUEUED, TaskStatusEnum.RUNNING]
+        ).first()
+        if existing is None:
+            raise
+        return existing
+
+
+def schedule_periodic_tasks():
+    for name, every in PERIODIC_TASKS.items():
+        enqueue(name, run_at=timezone.now(), unique_key=f"periodic:{name}")
+
+
+def requeue_stale_tasks():
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Task.objects.filter(status=TaskStatusEnum.RUNNING, locked_at__lt=cutoff) \
+        .update(status=TaskStatusEnum.QUEUED, locked_by="", locked_at=None)
+
+
+def claim_tasks(worker_id, limit=1):
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=TaskStatusEnum.QUEUED, run_at__lte=now)
+            .order_by("run_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Task.objects.filter(id__in=ids).update(
+            status=TaskStatusEnum.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(Task.objects.filter(id__in=ids).order_by("run_at"))
+
+
+class _Heartbeat(threading.Thread):
+    # Keeps locked_at fresh while a long task runs, so requeue_stale_tasks only reclaims tasks whose
+    # worker died and a purge is never started a second time beside a live run
+    def __init__(self, task_obj):
+        super().__init__(name=f"heartbeat-{task_obj.id}", daemon=True)
+        self.task_obj = task_obj
+        self.stopping = threading.Event()
+
+    def run(self):
+        interval = settings.TASK_LOCK_TIMEOUT / 3
+        try:
+            while not self.stopping.wait(interval):
+                Task.objects.filter(id=self.task_obj.id, status=TaskStatusEnum.RUNNING,
+                                    locked_by=self.task_obj.locked_by).update(locked_at=timezone.now())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+def _finish(task_obj, **fields):
+    fields.setdefault("finished_at", timezone.now())
+    fields.update(locked_by="", locked_at=None)
+    Task.objects.filter(id=task_obj.id).update(**fields)
+
+
+def report_progress(done, total=None):
+    task_id = getattr(_current, "task_id", None)
+    if task_id is not None:
+        Task.objects.filter(id=task_id).update(progress={"done": done, "total": total})
+
+
+def _execute(task_obj, spec):
+    _current.task_id = task_obj.id
+    heartbeat = _Heartbeat(task_obj)
+    heartbeat.start()
+    try:
+        result = spec["func"](**task_obj.payload)
+    except PermanentTaskError as e:
+        _finish(task_obj, status=TaskStatusEnum.FAILED, error=str(e))
+        return False
+    except Exception as e:
+        logger.error(f"Task {task_obj.name} #{task_obj.id} failed: {str(e)}", exc_info=True)
+        if task_obj.attempts < task_obj.max_attempts:
+            delay = spec["retry_delay"] * task_obj.attempts
+            _finish(task_obj, status=TaskStatusEnum.QUEUED, error=str(e), finished_at=None,
+                    run_at=timezone.now() + timedelta(seconds=delay))
+        else:
+            _finish(task_obj, status=TaskStatusEnum.FAILED, error=str(e))
+        return False
+    finally:
+        heartbeat.stop()
+        _current.task_id = None
+
+    _finish(task_obj, status=TaskStatusEnum.DONE, result=result, error="")
+    return True
+
+
+def run_task(task_obj):
+    spec = TASKS.get(task_obj.name)
+    if spec is None:
+        _finish(task_obj, status=TaskStatusEnum.FAILED, error=f"Unknown task: {task_obj.name}")
+        return False
+
+    succeeded = _execute(task_obj, spec)
+    if task_obj.name in PERIODIC_TASKS:
+        # A retry keeps the periodic unique_key, so this is a no-op until the run settles
+        enqueue(
+            task_obj.name,
+            run_at=timezone.now() + timedelta(seconds=PERIODIC_TASKS[task_obj.name]),
+            unique_key=f"periodic:{task_obj.name}",
+        )
+    return succeeded
+
+
+def run_pending(worker_id="inline", limit=100):
+    processed = 0
+    while processed < limit:
+        claimed = claim_tasks(worker_id)
+        if not claimed:
+            break
+        for task_obj in claimed:
+            run_task(task_obj)
+            processed += 1
+    return processed
@@ -0,0 +1,153 @@
+from functools import lru_cache
+from django import template
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from ..avatars import avatar_url as _avatar_url
+from ..images import VARIANT_FORMATS, image_variants
+from ..permissions import has_capability
+from ..posters import CONTENT_TYPES as POSTER_CONTENT_TYPES
+
+register = template.Library()
+
+_URL_SENTINEL = 987654321
+STARS = tuple(mark_safe("&#9733;" * filled + "&#9734;" * (10 - filled)) for filled in range(11))
+PLACEHOLDER_POSTER = "assets/img/placeholder.jpg"
+VOTE_BUTTONS = (
+    '<button type="button" class="btn btn-outline-success btn-sm mx-1 vote-button{like_active}" aria-pressed="{liked}" '
+    'data-comment-id="{target}" data-vote-type="like">Like ({likes})</button>'
+    '<button type="button" class="btn btn-outline-danger btn-sm mx-1 vote-button{dislike_active}" aria-pressed="{disliked}" '
+    'data-comment-id="{target}" data-vote-type="dislike">Dislike ({dislikes})</button>'
+)
+LOGIN_VOTE_LINKS = (
+    '<a href="{login}?next={next}" class="btn btn-outline-success btn-sm mx-1">Like ({likes})</a>'
+    '<a href="{login}?next={next}" class="btn btn-outline-danger btn-sm mx-1">Dislike ({dislikes})</a>'
+)
+
+
+@lru_cache(maxsize=None)
+def _url_parts(name):
+    return tuple(reverse(name, args=[_URL_SENTINEL]).rsplit(str(_URL_SENTINEL), 1))
+
+
+@lru_cache(maxsize=None)
+def _login_url():
+    return reverse("login")
+
+
+@register.simple_tag
+def id_url(name, object_id):
+    prefix, suffix = _url_parts(name)
+    return f"{prefix}{object_id}{suffix}"
+
+
+@register.simple_tag
+def star_rating(rating):
+    try:
+        filled = int(float(rating or 0))
+    except (TypeError, ValueError):
+        filled = 0
+    return STARS[max(0, min(10, filled))]
+
+
+@register.simple_tag(takes_context=True)
+def vote_buttons(context, target, obj):
+    likes = obj.likes_count or 0
+    dislikes = obj.dislikes_count or 0
+    if context["user"].is_authenticated:
+        user_vote = getattr(obj, "user_vote", None)
+        return format_html(
+            VOTE_BUTTONS, target=f"{target}-{obj.id}", likes=likes, dislikes=dislikes,
+            like_active=" active" if user_vote == "like" else "", liked=str(user_vote == "like").lower(),
+            dislike_active=" active" if user_vote == "dislike" else "", disliked=str(user_vote == "dislike").lower(),
+        )
+    return format_html(
+        LOGIN_VOTE_LINKS, login=_login_url(), next=context["request"].path,
+        likes=likes, dislikes=dislikes,
+    )
+
+
+@register.filter
+def can(user, capability):
+    return has_capability(user, capability)
+
+
+@register.simple_tag
+def profile_link(user):
+    return format_html('<a href="{}">{}</a>', id_url("user_profile", user.id), user.name)
+
+
+@register.simple_tag
+def responsive_image(path, alt="", css_class="", sizes="100vw"):
+    variants = image_variants(path)
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (mime, ", ".join(f"{static(variant)} {width}w" for width, variant in variants[fmt]), sizes)
+            for fmt, mime in VARIANT_FORMATS if fmt in variants
+        ),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        sources, static(path), alt, css_class,
+    )
+
+
+@register.simple_tag
+def background_image(path):
+    variants = image_variants(path)
+    fallback = static(path)
+    candidates = [
+        f"url('{static(variants[fmt][-1][1])}') type('{mime}')"
+        for fmt, mime in VARIANT_FORMATS if fmt in variants
+    ]
+    if not candidates:
+        return format_html("background-image: url('{}');", fallback)
+    candidates.append(f"url('{fallback}') type('image/jpeg')")
+    return format_html(
+        "background-image: url('{}'); background-image: image-set({});",
+        fallback, ", ".join(candidates),
+    )
+
+
+def _poster_urls(movie, variant):
+    # ext -> URL of the locally cached copy, best format first; empty until the poster job has run
+    names = (getattr(movie, "poster", None) or {}).get(variant, {})
+    return [(ext, reverse("poster", args=[names[ext]])) for ext in POSTER_CONTENT_TYPES if ext in names]
+
+
+@register.simple_tag
+def poster_image(movie, variant="card", alt="", css_class=""):
+    urls = _poster_urls(movie, variant)
+    if not urls:
+        if movie.img_url:
+            return format_html('<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+                               movie.img_url, alt, css_class)
+        return responsive_image(PLACEHOLDER_POSTER, alt=alt, css_class=css_class)
+    sources = format_html_join(
+        "", '<source type="{}" srcset="{}">', ((POSTER_CONTENT_TYPES[ext], url) for ext, url in urls[:-1])
+    )
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        sources, urls[-1][1], alt, css_class,
+    )
+
+
+@register.simple_tag
+def poster_background(movie, variant="card"):
+    urls = _poster_urls(movie, variant)
+    if not urls:
+        if movie.img_url:
+            return format_html("background-image: url('{}');", movie.img_url)
+        return background_image(PLACEHOLDER_POSTER)
+    candidates = ", ".join(f"url('{url}') type('{POSTER_CONTENT_TYPES[ext]}')" for ext, url in urls)
+    return format_html(
+        "background-image: url('{}'); background-image: image-set({});", urls[-1][1], candidates,
+    )
+
+
+@register.filter
+def avatar_url(name):
+    return _avatar_url(name)
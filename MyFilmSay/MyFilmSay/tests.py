@@ -1,6 +1,51 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipIf, skipUnless
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.template import engines
+from io import StringIO
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import User, RoleEnum
+from django.utils import timezone
+from .models import (User, RoleEnum, Movie, Genre, MovieCredit, CreditJobEnum, Comment, CommentReply, Vote,
+                     Task, TaskStatusEnum, MovieActivity, ContentSignature, SignatureBand,
+                     ArchivedThread)
+from .auth import CachedModelBackend
+from .forms import CreateMovieForm
+from .catalogue import bump_catalogue_version, sync_movie_relations, facet_counts, filter_movies
+from .avatars import avatar_url, avatar_initials, load_avatar, render_avatar
+from .ratelimit import check_rate, check_rate_limit_cache, clear_local_state
+from .tasks import TASKS, enqueue, requeue_stale_tasks, run_pending
+from .popularity import flush_view_counts
+from .permissions import CAPABILITIES, has_capability
+from . import moderation
+from .markup import render_markup
+from .purge import purge_movie, recount_vote_counters, soft_delete_movie, soft_delete_reply
+from .trending import record_activity, refresh_trending, trending_movie_ids, trending_version
+from .posters import POSTER_VARIANTS, PosterError, cache_movie_poster
+from . import duplicates, partitioning
+from .archive import archive_threads, restore_thread, unpack
+from .startup import parse_importtime
+from . import tmdb
+from . import queryplans
+from . import sitemaps
+from .sitemaps import shard_of
+from .caching import touch_movie
+from .snapshot import FIELDS as SNAPSHOT_FIELDS, CatalogueSnapshot, current_snapshot, publish_snapshot
 
 class UserModelTest(TestCase):
     def test_user_creation(self):
@@ -86,3 +131,1545 @@ class AuthTestCase(TestCase):
         })
         self.assertEqual(response.status_code, 302)
         self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_user_cache_needs_a_shared_backend(self):
+        backend = CachedModelBackend()
+        cache.clear()
+        # The test LocMemCache is per process, so every lookup reads the row
+        with self.assertNumQueries(2):
+            backend.get_user(self.user.id)
+            backend.get_user(self.user.id)
+
+        with mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True):
+            backend.get_user(self.user.id)
+            with self.assertNumQueries(0):
+                self.assertEqual(backend.get_user(self.user.id), self.user)
+            self.user.is_active = False
+            self.user.save()
+            self.assertIsNone(backend.get_user(self.user.id))
+
+
+class CatalogueTestCase(TestCase):
+    def setUp(self):
+        self.alien = Movie.objects.create(
+            title="Alien", date="1979", body="", rating=8.5,
+            director="Ridley Scott", writers="Dan O'Bannon", genres="Horror, Science Fiction"
+        )
+        self.blade_runner = Movie.objects.create(
+            title="Blade Runner", date="1982", body="", rating=7.9,
+            director="Ridley Scott", writers="Hampton Fancher, David Peoples", genres="Science Fiction"
+        )
+        sync_movie_relations(self.alien)
+        sync_movie_relations(self.blade_runner)
+
+    def test_sync_movie_relations(self):
+        self.assertEqual(Genre.objects.count(), 2)
+        self.assertEqual(self.alien.year, 1979)
+        self.assertEqual(
+            set(self.alien.genre_tags.values_list("slug", flat=True)),
+            {"horror", "science-fiction"}
+        )
+        director = MovieCredit.objects.get(movie=self.blade_runner, job=CreditJobEnum.DIRECTOR).person
+        self.assertEqual(set(director.movies.values_list("title", flat=True)), {"Alien", "Blade Runner"})
+
+    def test_sync_replaces_removed_genres(self):
+        self.alien.genres = "Horror"
+        self.alien.save()
+        sync_movie_relations(self.alien)
+        self.assertEqual(list(self.alien.genre_tags.values_list("slug", flat=True)), ["horror"])
+
+    def test_filter_and_facets(self):
+        self.assertEqual(list(filter_movies(genre="horror")), [self.alien])
+        self.assertEqual(list(filter_movies(decade=1980)), [self.blade_runner])
+
+        facets = facet_counts({"genre": "science-fiction", "decade": None, "rating": None, "person": None})
+        self.assertEqual({g["slug"]: g["count"] for g in facets["genres"]}, {"horror": 1, "science-fiction": 2})
+        self.assertEqual({d["decade"]: d["count"] for d in facets["decades"]}, {1970: 1, 1980: 1})
+        self.assertEqual({r["band"]: r["count"] for r in facets["ratings"]}, {8: 1, 7: 1})
+
+    def test_browse_views(self):
+        response = self.client.get(reverse('browse'), {"genre": "horror"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Alien")
+        self.assertNotContains(response, "Blade Runner")
+
+        response = self.client.get(reverse('browse_facets'), {"decade": 1970})
+        self.assertEqual(response.json()["ratings"], [{"band": 8, "count": 1}])
+
+    @mock.patch("MyFilmSay.views.BROWSE_PAGE_SIZE", 1)
+    def test_browse_is_paginated(self):
+        response = self.client.get(reverse('browse'), {"genre": "science-fiction", "page": 2})
+        self.assertContains(response, "Blade Runner")
+        self.assertNotContains(response, "Alien")
+        self.assertContains(response, "Page 2 of 2")
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(title="Alien", date="1979", body="", rating=8.5)
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+
+    def test_movie_page_not_modified_until_activity(self):
+        url = reverse('show_movie', args=[self.movie.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        comment = Comment.objects.create(text="Great", author=self.user, movie=self.movie, user_rating=9)
+        self.client.login(email="test@example.com", password="password123")
+        self.client.post(reverse('reply_comment', args=[comment.id]), {"reply_text": "Agreed"})
+        self.client.logout()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_authenticated_pages_are_private(self):
+        self.client.login(email="test@example.com", password="password123")
+        response = self.client.get(reverse('about'))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn(b"csrfmiddlewaretoken", self.client.get(reverse('seo')).content)
+
+    def test_new_csrf_cookie_changes_etag(self):
+        url = reverse('show_movie', args=[self.movie.id])
+        self.client.login(email="test@example.com", password="password123")
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "a" * 32
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "b" * 32
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_index_not_modified_until_catalogue_changes(self):
+        url = reverse('get_all_movies')
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {"sort_by": "rating"}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_catalogue_changes_from_another_process_reach_the_index(self):
+        url = reverse('get_all_movies')
+        etag = self.client.get(url)["ETag"]
+        # run_worker, with a LocMemCache of its own
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                                   "LOCATION": "run-worker"}}):
+            Movie.objects.create(title="Aliens", date="1986", body="")
+            bump_catalogue_version()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), "Aliens")
+
+
+class StaticImageTagTestCase(TestCase):
+    template = "{% load film_tags %}{% background_image 'assets/img/about_banner.jpg' %}"
+
+    def test_background_image_without_variants(self):
+        with mock.patch("MyFilmSay.templatestags.film_tags.image_variants", return_value={}):
+            html = engines["django"].from_string(self.template).render({})
+        self.assertEqual(html, "background-image: url('/static/assets/img/about_banner.jpg');")
+
+    def test_background_image_and_srcset_with_variants(self):
+        variants = {
+            "webp": [[480, "assets/img/variants/about_banner-480.webp"],
+                     [960, "assets/img/variants/about_banner-960.webp"]],
+        }
+        with mock.patch("MyFilmSay.templatestags.film_tags.image_variants", return_value=variants):
+            html = engines["django"].from_string(self.template).render({})
+            picture = engines["django"].from_string(
+                "{% load film_tags %}{% responsive_image 'assets/img/placeholder.jpg' alt='Poster' %}"
+            ).render({})
+        self.assertIn("image-set(", html)
+        self.assertIn("about_banner-960.webp", html)
+        self.assertIn(
+            'srcset="/static/assets/img/variants/about_banner-480.webp 480w, '
+            '/static/assets/img/variants/about_banner-960.webp 960w"', picture
+        )
+
+
+class AvatarTestCase(TestCase):
+    def setUp(self):
+        self.avatar_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.avatar_root.cleanup)
+        self.settings_override = override_settings(AVATAR_ROOT=self.avatar_root.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        avatar_url.cache_clear()
+        cache.clear()
+
+    def test_initials_and_determinism(self):
+        self.assertEqual(avatar_initials("Ridley Scott"), "RS")
+        self.assertEqual(avatar_initials("Jan Maria Rokita"), "JR")
+        self.assertEqual(avatar_initials("cher"), "CH")
+        self.assertEqual(avatar_initials(""), "?")
+        self.assertEqual(render_avatar("Ridley Scott"), render_avatar("Ridley Scott"))
+        self.assertNotEqual(render_avatar("Ridley Scott")[0], render_avatar("Ridley Scot")[0])
+
+    def test_avatar_served_from_disk_after_cache_eviction(self):
+        url = avatar_url("Test <User>")
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn(b"TU", response.content)
+
+    def test_malformed_digest_is_not_looked_up(self):
+        avatar_url("Test User")
+        self.assertIsNone(load_avatar("../../settings"))
+        self.assertIsNone(load_avatar("ABCDEF0123456789"))
+        self.assertEqual(self.client.get("/avatar/..%2Fsecret.svg").status_code, 404)
+        self.assertEqual(list(Path(self.avatar_root.name).glob("*.tmp")), [])
+        self.assertEqual(self.client.get(reverse("avatar", args=["0" * 16])).status_code, 404)
+
+    def test_render_is_fast(self):
+        started = time.perf_counter()
+        for i in range(1000):
+            render_avatar(f"User {i}")
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+
+class CommentTemplateTagTestCase(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(title="Alien", date="1979", body="", rating=8.5)
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.comment = Comment.objects.create(
+            text="Great", author=self.user, movie=self.movie, user_rating=7.5, likes_count=3
+        )
+        CommentReply.objects.create(comment=self.comment, reply_text="Agreed", author=self.user)
+
+    def test_star_rating(self):
+        template = engines["django"].from_string("{% load film_tags %}{% star_rating rating %}")
+        self.assertEqual(template.render({"rating": 7.5}), "&#9733;" * 7 + "&#9734;" * 3)
+        self.assertEqual(template.render({"rating": None}), "&#9734;" * 10)
+        self.assertEqual(template.render({"rating": 12}), "&#9733;" * 10)
+
+    def test_comment_list_for_anonymous_user(self):
+        response = self.client.get(reverse('show_movie', args=[self.movie.id]))
+        profile_url = reverse('user_profile', args=[self.user.id])
+        self.assertContains(response, f'<a href="{profile_url}">Test User</a>', count=2)
+        self.assertContains(response, f'<a href="{reverse("login")}?next=/movie/{self.movie.id}" '
+                                      f'class="btn btn-outline-success btn-sm mx-1">Like (3)</a>')
+        self.assertNotContains(response, "vote-button")
+
+    def test_comment_list_for_authenticated_user(self):
+        self.client.login(email="test@example.com", password="password123")
+        response = self.client.get(reverse('load_comments', args=[self.movie.id]))
+        html = response.json()["html"]
+        self.assertIn(f'data-comment-id="comment-{self.comment.id}" data-vote-type="like">Like (3)</button>', html)
+        self.assertIn(f'action="{reverse("reply_comment", args=[self.comment.id])}"', html)
+        self.assertIn("Agreed", html)
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_state()
+        self.addCleanup(clear_local_state)
+
+    def test_sliding_window(self):
+        start = 6000.0
+        for i in range(3):
+            self.assertEqual(check_rate("test", "ip1", 3, 60, now=start + i), 0)
+        retry_after = check_rate("test", "ip1", 3, 60, now=start + 3)
+        self.assertGreater(retry_after, 0)
+        self.assertEqual(check_rate("test", "ip2", 3, 60, now=start + 3), 0)
+
+        # Half of the previous window still counts, so only part of the budget is back
+        clear_local_state()
+        self.assertEqual(check_rate("test", "ip1", 3, 60, now=start + 90), 0)
+        self.assertGreater(check_rate("test", "ip1", 3, 60, now=start + 91), 0)
+
+    @override_settings(RATE_LIMITS={"login": ("ip", 2, 60)})
+    def test_login_is_throttled(self):
+        for _ in range(2):
+            response = self.client.post(reverse('login'), {'email': 'x@example.com', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(reverse('login'), {'email': 'x@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+    @override_settings(RATE_LIMITS={"vote": ("user", 1, 60)})
+    def test_json_endpoints_get_json_429(self):
+        User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.client.login(email="test@example.com", password="password123")
+        self.client.post(reverse('vote'), "{}", content_type="application/json")
+        response = self.client.post(reverse('vote'), "{}", content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.json()["success"])
+
+    def test_per_process_cache_is_reported(self):
+        self.assertEqual([w.id for w in check_rate_limit_cache(None)], ["MyFilmSay.W001"])
+        with mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True):
+            self.assertEqual(check_rate_limit_cache(None), [])
+
+
+TMDB_MOVIE = {
+    "title": "Queued Movie", "date": "2001", "img_url": None, "body": "", "rating": 7.0,
+    "director": "Jane Doe", "writers": "", "genres": "Drama",
+}
+
+
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        self.client.login(email="admin@example.com", password="adminpassword")
+
+    @mock.patch("MyFilmSay.jobs.tmdb.fetch_movie", return_value=TMDB_MOVIE)
+    def test_find_movie_enqueues_import(self, fetch_movie):
+        response = self.client.get(reverse('find_movie', args=[42]))
+        self.assertEqual(response.status_code, 200)
+        fetch_movie.assert_not_called()
+        task = Task.objects.get()
+        self.assertEqual(task.payload, {"tmdb_id": 42})
+
+        # Clicking twice while the job is pending reuses it
+        self.client.get(reverse('find_movie', args=[42]))
+        self.assertEqual(Task.objects.count(), 1)
+
+        self.assertEqual(run_pending(), 1)
+        movie = Movie.objects.get(title="Queued Movie")
+        status = self.client.get(reverse('task_status', args=[task.id])).json()
+        self.assertEqual(status["status"], TaskStatusEnum.DONE)
+        self.assertEqual(status["result"]["redirect_url"], reverse('edit_movie', args=[movie.id]))
+        self.assertTrue(movie.genre_tags.filter(name="Drama").exists())
+
+    @mock.patch("MyFilmSay.jobs.tmdb.fetch_movie", side_effect=ConnectionError("offline"))
+    def test_failed_task_is_retried_then_failed(self, fetch_movie):
+        task = enqueue("import_tmdb_movie", payload={"tmdb_id": 7})
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatusEnum.QUEUED)
+        self.assertEqual(task.attempts, 1)
+        self.assertGreater(task.run_at, task.created_at)
+
+        for _ in range(task.max_attempts):
+            Task.objects.filter(id=task.id).update(run_at=task.created_at)
+            run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatusEnum.FAILED)
+        self.assertEqual(task.attempts, task.max_attempts)
+        self.assertEqual(task.error, "offline")
+
+    @mock.patch("MyFilmSay.jobs.tmdb.fetch_movie", return_value=TMDB_MOVIE)
+    def test_duplicate_import_fails_permanently(self, fetch_movie):
+        Movie.objects.create(title="Queued Movie")
+        task = enqueue("import_tmdb_movie", payload={"tmdb_id": 7})
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatusEnum.FAILED)
+        self.assertEqual(task.attempts, 1)
+
+    @mock.patch("MyFilmSay.jobs.tmdb.fetch_movie", return_value=TMDB_MOVIE)
+    def test_import_of_a_deleted_title_fails_permanently(self, fetch_movie):
+        Movie.objects.create(title="Queued Movie", is_deleted=True)
+        task = enqueue("import_tmdb_movie", payload={"tmdb_id": 7})
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatusEnum.FAILED)
+        self.assertIn("still being purged", task.error)
+
+    def test_task_status_is_private(self):
+        task = enqueue("import_tmdb_movie", payload={"tmdb_id": 7}, created_by=self.admin)
+        User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.client.login(email="test@example.com", password="password123")
+        self.assertEqual(self.client.get(reverse('task_status', args=[task.id])).status_code, 403)
+
+    def test_recount_vote_counters(self):
+        movie = Movie.objects.create(title="Counted")
+        comment = Comment.objects.create(text="Hi", author=self.admin, movie=movie, likes_count=5)
+        Vote.objects.create(user=self.admin, comment=comment, vote_type="like")
+        enqueue("recount_vote_counters")
+        run_pending()
+        comment.refresh_from_db()
+        self.assertEqual((comment.likes_count, comment.dislikes_count), (1, 0))
+        # Periodic tasks reschedule themselves
+        self.assertTrue(Task.objects.filter(name="recount_vote_counters", status=TaskStatusEnum.QUEUED).exists())
+
+    @override_settings(PURGE_BATCH_SIZE=1)
+    def test_recount_only_touches_changed_rows(self):
+        stale_movie = Movie.objects.create(title="Stale")
+        fresh_movie = Movie.objects.create(title="Fresh")
+        stale = Comment.objects.create(text="Hi", author=self.admin, movie=stale_movie, likes_count=5)
+        Comment.objects.create(text="Hi", author=self.admin, movie=fresh_movie)
+        versions = dict(Movie.objects.values_list("id", "activity_version"))
+
+        self.assertEqual(recount_vote_counters(), (1, 0))
+        stale.refresh_from_db()
+        self.assertEqual(stale.likes_count, 0)
+        after = dict(Movie.objects.values_list("id", "activity_version"))
+        self.assertEqual(after[stale_movie.id], versions[stale_movie.id] + 1)
+        self.assertEqual(after[fresh_movie.id], versions[fresh_movie.id])
+
+
+class TaskHeartbeatTestCase(TransactionTestCase):
+    @override_settings(TASK_LOCK_TIMEOUT=0.3)
+    def test_running_task_is_not_reclaimed(self):
+        # A worker's loop calls requeue_stale_tasks between tasks; here it runs while this one is still busy
+        def slow():
+            time.sleep(0.6)
+            return requeue_stale_tasks()
+
+        with mock.patch.dict(TASKS, {"slow": {"func": slow, "max_attempts": 1, "retry_delay": 0}}):
+            task = enqueue("slow")
+            self.assertEqual(run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, TaskStatusEnum.DONE)
+        self.assertEqual(task.result, 0)
+        self.assertEqual(task.attempts, 1)
+
+
+class PopularityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.movie = Movie.objects.create(title="Popular", date="2000", body="Body")
+
+    @override_settings(VIEW_SAMPLE_RATE=1)
+    @mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True)
+    def test_views_are_buffered_then_flushed(self, cache_is_shared):
+        for _ in range(3):
+            self.client.get(reverse('show_movie', args=[self.movie.id]))
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.view_count, 0)
+
+        self.assertEqual(flush_view_counts(), 3)
+        self.assertEqual(flush_view_counts(), 0)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.view_count, 3)
+
+    @override_settings(VIEW_SAMPLE_RATE=2)
+    @mock.patch("MyFilmSay.popularity.random.random", return_value=0.1)
+    def test_views_are_written_through_with_a_per_process_cache(self, random):
+        for _ in range(3):
+            self.client.get(reverse('show_movie', args=[self.movie.id]))
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.view_count, 6)
+        self.assertEqual(flush_view_counts(), 0)
+
+    def test_anonymous_pages_are_served_from_the_page_cache(self):
+        url = reverse('show_movie', args=[self.movie.id])
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, "Popular")
+
+
+class WarmCacheTestCase(TransactionTestCase):
+    def test_warm_cache_renders_top_movies(self):
+        cache.clear()
+        Movie.objects.create(title="Cold", date="2000", body="Body", view_count=1)
+        hot = Movie.objects.create(title="Hot", date="2001", body="Body", view_count=10)
+        out = StringIO()
+        call_command("warm_cache", "--top", "1", "--workers", "2", stdout=out)
+        self.assertIn("Warmed 6/6 pages", out.getvalue())
+
+        # Only the ETag lookup is left for the first real visitor
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('show_movie', args=[hot.id]))
+        self.assertContains(response, "Hot")
+
+
+@override_settings(PURGE_BATCH_SIZE=2)
+class SoftDeleteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.movie = Movie.objects.create(title="Doomed", date="2000", body="Body")
+        self.comment = Comment.objects.create(text="Bye", author=self.user, movie=self.movie)
+        self.other = Comment.objects.create(text="Stays", author=self.admin, movie=self.movie)
+        for i in range(3):
+            reply = CommentReply.objects.create(comment=self.comment, reply_text=f"r{i}", author=self.admin)
+            Vote.objects.create(user=self.user, reply=reply, vote_type="like")
+        Vote.objects.create(user=self.user, comment=self.other, vote_type="like")
+        self.other.likes_count = 1
+        self.other.save()
+        self.client.login(email="admin@example.com", password="adminpassword")
+
+    def test_deleted_comment_is_hidden_then_purged(self):
+        response = self.client.post(reverse('delete_comment', args=[self.comment.id]))
+        self.assertTrue(response.json()["success"])
+        self.assertFalse(Comment.objects.filter(id=self.comment.id).exists())
+        self.assertEqual(CommentReply.objects.count(), 0)
+        self.assertEqual(CommentReply.all_objects.count(), 3)
+
+        run_pending()
+        task = Task.objects.get(name="purge_comment")
+        self.assertEqual(task.status, TaskStatusEnum.DONE)
+        self.assertEqual(task.progress, {"done": 7, "total": 7})
+        self.assertFalse(Comment.all_objects.filter(id=self.comment.id).exists())
+        self.assertEqual(Vote.objects.filter(reply__isnull=False).count(), 0)
+
+    def test_deleted_user_is_purged_and_counters_fixed(self):
+        self.client.get(reverse('delete_user', args=[self.user.id]))
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertEqual(list(Comment.objects.all()), [self.other])
+        # Replies to the user's comments go with them, without the manager joining to the parents
+        self.assertEqual(CommentReply.objects.count(), 0)
+        self.assertNotIn("JOIN", str(CommentReply.objects.all().query))
+        self.assertFalse(self.client.login(email="test@example.com", password="password123"))
+
+        run_pending()
+        self.assertFalse(User.all_objects.filter(id=self.user.id).exists())
+        self.assertEqual(Vote.objects.count(), 0)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.likes_count, 0)
+
+    def test_deleted_movie_is_hidden_then_purged(self):
+        self.client.get(reverse('delete_movie', args=[self.movie.id]))
+        self.assertEqual(self.client.get(reverse('show_movie', args=[self.movie.id])).status_code, 404)
+        form = CreateMovieForm({"title": "Doomed", "date": "2000", "body": "Body"})
+        self.assertIn("still being purged", form.errors["title"][0])
+        run_pending()
+        self.assertEqual(Movie.all_objects.count(), 0)
+        self.assertEqual(Comment.all_objects.count(), 0)
+        self.assertTrue(CreateMovieForm({"title": "Doomed", "date": "2000", "body": "Body"}).is_valid())
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.movie = Movie.objects.create(title="Api Movie", date="1999", body="Body", rating=8.0)
+        self.comments = [
+            Comment.objects.create(text=f"c{i}", author=self.user, movie=self.movie) for i in range(5)
+        ]
+        CommentReply.objects.create(comment=self.comments[0], reply_text="r", author=self.user)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(reverse('api_movie_detail', args=[self.movie.id]), {"fields": "id,title"})
+        self.assertEqual(response.json(), {"id": self.movie.id, "title": "Api Movie"})
+        response = self.client.get(reverse('api_movie_list'), {"fields": "title,nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_comment_cursor_pagination(self):
+        url = reverse('api_movie_comments', args=[self.movie.id])
+        seen = []
+        params = {"limit": 2, "fields": "id,author_name"}
+        while url:
+            with self.assertNumQueries(3):
+                page = self.client.get(url, params).json()
+            seen.extend(row["id"] for row in page["results"])
+            url, params = page["next"], None
+        self.assertEqual(seen, [c.id for c in reversed(self.comments)])
+
+    def test_replies_and_gzip(self):
+        response = self.client.get(reverse('api_comment_replies', args=[self.comments[0].id]),
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('api_movie_comments', args=[self.movie.id]), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(self.client.get(reverse('api_movie_list'), {"cursor": "garbage"}).status_code, 400)
+
+
+class VoteBatchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.movie = Movie.objects.create(title="Voted", date="2000", body="Body")
+        self.comment = Comment.objects.create(text="Hi", author=self.user, movie=self.movie)
+        self.reply = CommentReply.objects.create(comment=self.comment, reply_text="Yo", author=self.user)
+        self.client.login(email="test@example.com", password="password123")
+
+    def post_votes(self, votes):
+        return self.client.post(reverse('vote_batch'), json.dumps({"votes": votes}), content_type="application/json")
+
+    def test_toggles_are_coalesced(self):
+        comment_key = f"comment-{self.comment.id}"
+        reply_key = f"reply-{self.reply.id}"
+        response = self.post_votes([
+            {"comment_id": comment_key, "vote_type": "like"},
+            {"comment_id": comment_key, "vote_type": "like"},
+            {"comment_id": comment_key, "vote_type": "dislike"},
+            {"comment_id": reply_key, "vote_type": "like"},
+        ])
+        self.assertEqual(response.json()["counts"], {
+            comment_key: {"likes": 0, "dislikes": 1, "vote": "dislike"},
+            reply_key: {"likes": 1, "dislikes": 0, "vote": "like"},
+        })
+        self.assertEqual(Vote.objects.get(comment=self.comment).vote_type, "dislike")
+
+        response = self.post_votes([
+            {"comment_id": comment_key, "vote_type": "like"},
+            {"comment_id": reply_key, "vote_type": "like"},
+        ])
+        self.assertEqual(response.json()["counts"][comment_key], {"likes": 1, "dislikes": 0, "vote": "like"})
+        self.assertFalse(Vote.objects.filter(reply=self.reply).exists())
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.activity_version, 2)
+
+    def test_single_vote_endpoint_still_works(self):
+        response = self.client.post(reverse('vote'), json.dumps({"comment_id": f"comment-{self.comment.id}",
+                                                                 "vote_type": "like"}),
+                                    content_type="application/json")
+        self.assertEqual(response.json(), {"success": True, "likes": 1, "dislikes": 0, "vote": "like"})
+
+        response = self.client.post(reverse('vote'), json.dumps({"comment_id": f"comment-0{self.comment.id}",
+                                                                 "vote_type": "like"}),
+                                    content_type="application/json")
+        self.assertEqual(response.json(), {"success": True, "likes": 0, "dislikes": 0, "vote": None})
+        response = self.client.post(reverse('vote'), json.dumps({"comment_id": [self.comment.id], "vote_type": "like"}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.post_votes([{"comment_id": "comment-999", "vote_type": "like"}]).status_code, 404)
+        self.assertEqual(self.post_votes([{"comment_id": "movie-1", "vote_type": "like"}]).status_code, 400)
+        self.assertEqual(self.post_votes([{"comment_id": f"comment-{self.comment.id}", "vote_type": "meh"}]).status_code, 400)
+        self.assertFalse(Vote.objects.exists())
+
+
+class VoteStateTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.movie = Movie.objects.create(title="Stateful", date="2000", body="Body")
+        self.comments = [Comment.objects.create(text=f"c{i}", author=self.user, movie=self.movie) for i in range(4)]
+        for comment in self.comments:
+            CommentReply.objects.create(comment=comment, reply_text="r", author=self.user)
+        self.client.login(email="test@example.com", password="password123")
+
+    def vote(self, target, vote_type):
+        self.client.post(reverse('vote_batch'), json.dumps({"votes": [{"comment_id": target, "vote_type": vote_type}]}),
+                         content_type="application/json")
+
+    def test_active_state_is_rendered_from_one_cached_query(self):
+        liked = f"comment-{self.comments[0].id}"
+        disliked = f"reply-{self.comments[1].replies_set.get().id}"
+        self.vote(liked, "like")
+        self.vote(disliked, "dislike")
+
+        url = reverse('load_comments', args=[self.movie.id])
+        html = self.client.get(url).json()["html"]
+        self.assertIn(f'vote-button active" aria-pressed="true" data-comment-id="{liked}" data-vote-type="like"', html)
+        self.assertIn(f'vote-button active" aria-pressed="true" data-comment-id="{disliked}" data-vote-type="dislike"', html)
+        self.assertEqual(html.count(" active"), 2)
+
+        # Re-rendering uses the cached vote state: no Vote query
+        with mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True):
+            self.client.get(url, HTTP_IF_NONE_MATCH="stale")
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url, HTTP_IF_NONE_MATCH="stale")
+        self.assertFalse(any('"MyFilmSay_vote"' in q["sql"] for q in queries.captured_queries))
+
+    def test_state_is_not_cached_in_a_per_process_cache(self):
+        target = f"comment-{self.comments[3].id}"
+        url = reverse('load_comments', args=[self.movie.id])
+        self.client.get(url)
+        # Another worker records the vote; its cache delete never reaches this one
+        Vote.objects.create(user=self.user, comment=self.comments[3], vote_type="like")
+        self.assertIn(f'active" aria-pressed="true" data-comment-id="{target}"',
+                      self.client.get(url, HTTP_IF_NONE_MATCH="stale").json()["html"])
+
+    def test_voting_invalidates_the_state(self):
+        target = f"comment-{self.comments[2].id}"
+        url = reverse('load_comments', args=[self.movie.id])
+        self.assertNotIn(" active", self.client.get(url).json()["html"])
+        self.vote(target, "like")
+        self.assertIn(" active", self.client.get(url).json()["html"])
+
+
+class AuthFastPathTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return [q["sql"] for q in queries.captured_queries if 'FROM "MyFilmSay_user"' in q["sql"]]
+
+    def test_old_hashes_are_upgraded_on_login(self):
+        User.objects.filter(id=self.user.id).update(password=make_password("password123", hasher="pbkdf2_sha256"))
+        response = self.client.post(reverse('login'), {'email': 'test@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("argon2$"))
+
+    @mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True)
+    def test_request_user_is_cached_and_invalidated(self, cache_is_shared):
+        self.client.login(email="admin@example.com", password="adminpassword")
+        url = reverse('about')
+        self.user_queries(url)
+        self.assertEqual(self.user_queries(url), [])
+
+        self.client.get(reverse('assign_role', args=[self.admin.id, RoleEnum.MODERATOR]))
+        self.assertNotEqual(self.user_queries(url), [])
+        self.assertEqual(self.user_queries(url), [])
+
+        self.admin.set_password("newpassword")
+        self.admin.save()
+        self.client.get(url)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+
+class PermissionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.moderator = User.objects.create_user(email="mod@example.com", name="Mod", password="password123",
+                                                  role=RoleEnum.MODERATOR)
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+
+    def test_capability_map(self):
+        self.assertLess(CAPABILITIES[RoleEnum.USER], CAPABILITIES[RoleEnum.MODERATOR])
+        self.assertLess(CAPABILITIES[RoleEnum.MODERATOR], CAPABILITIES[RoleEnum.ADMIN])
+        self.assertTrue(has_capability(self.moderator, "manage_movies"))
+        self.assertFalse(has_capability(self.moderator, "delete_users"))
+        with self.assertRaises(ValueError):
+            has_capability(self.user, "fly")
+
+    def test_regular_users_are_forbidden(self):
+        self.client.login(email="test@example.com", password="password123")
+        self.assertEqual(self.client.get(reverse('add_new_movie')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('users')).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('users')).status_code, 302)
+
+    @mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True)
+    def test_moderator_pages_check_permissions_without_queries(self, cache_is_shared):
+        self.client.login(email="mod@example.com", password="password123")
+        self.client.get(reverse('add_new_movie'))
+        # Only the session lookup is left: the user is cached and the role check is in memory
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('add_new_movie'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('users'))
+
+    def test_moderators_cannot_make_admins(self):
+        self.client.login(email="mod@example.com", password="password123")
+        self.client.get(reverse('assign_role', args=[self.user.id, RoleEnum.ADMIN]))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.role, RoleEnum.USER)
+
+    def test_moderators_cannot_demote_admins(self):
+        self.client.login(email="mod@example.com", password="password123")
+        admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword")
+        response = self.client.get(reverse('assign_role', args=[admin.id, RoleEnum.USER]))
+        self.assertEqual(response.status_code, 403)
+        admin.refresh_from_db()
+        self.assertEqual(admin.role, RoleEnum.ADMIN)
+
+
+class ModerationConsoleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="adminpassword", name="Admin")
+        self.moderator = User.objects.create_user(email="mod@example.com", name="Mod", password="password123",
+                                                  role=RoleEnum.MODERATOR)
+        self.movie = Movie.objects.create(title="Busy", date="2000", body="Body")
+        password = make_password("password123")
+        self.users = User.objects.bulk_create([
+            User(email=f"user{i}@example.com", name=f"User {i}", password=password) for i in range(60)
+        ])
+        for user in self.users[-3:]:
+            comment = Comment.objects.create(text=f"Spam from {user.name}", author=user, movie=self.movie)
+            CommentReply.objects.create(comment=comment, reply_text="Me too", author=user)
+
+    def test_user_list_is_paginated_with_annotated_counts(self):
+        self.client.login(email="mod@example.com", password="password123")
+        response = self.client.get(reverse('users'))
+        page = response.context["all_users"]
+        self.assertEqual(len(page), moderation.CONSOLE_PAGE_SIZE)
+        self.assertIsNotNone(response.context["next_before"])
+        spammer = next(u for u in page if u.id == self.users[-1].id)
+        self.assertEqual((spammer.comment_count, spammer.reply_count), (1, 1))
+
+        rest = self.client.get(reverse('users'), {"before": response.context["next_before"]}).context["all_users"]
+        self.assertEqual(len(page) + len(rest), User.objects.count())
+        self.assertIsNone(self.client.get(reverse('users'), {"q": "user1@"}).context["next_before"])
+
+    def test_user_page_query_count_does_not_grow_with_rows(self):
+        self.client.login(email="mod@example.com", password="password123")
+        self.client.get(reverse('users'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('users'))
+        self.assertLessEqual(len(queries), 3)
+        self.assertFalse(any("COUNT(*)" in query["sql"] and "LIMIT" not in query["sql"] for query in queries))
+
+    def test_bulk_ban_and_role_change(self):
+        self.client.login(email="mod@example.com", password="password123")
+        ids = [user.id for user in self.users[:2]] + [self.admin.id, self.moderator.id]
+        self.client.post(reverse('users'), {"action": "ban", "ids": ids})
+        self.assertEqual(User.objects.filter(is_active=False).count(), 2)
+        self.assertFalse(self.client.login(email="user0@example.com", password="password123"))
+
+        self.client.login(email="mod@example.com", password="password123")
+        self.client.post(reverse('users'), {"action": "role", "role": RoleEnum.ADMIN, "ids": ids})
+        self.assertEqual(User.objects.filter(role=RoleEnum.ADMIN).count(), 1)
+        self.client.post(reverse('users'), {"action": "purge", "ids": ids})
+        self.assertEqual(User.objects.filter(is_deleted=False).count(), 62)
+
+    def test_bulk_purge_users(self):
+        self.client.login(email="admin@example.com", password="adminpassword")
+        self.client.post(reverse('users'), {"action": "purge", "ids": [user.id for user in self.users[-3:]]})
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertEqual(Task.objects.filter(name="purge_user").count(), 3)
+
+    def test_comment_console_bulk_delete(self):
+        self.client.login(email="mod@example.com", password="password123")
+        response = self.client.get(reverse('moderate_comments'), {"q": "spam"})
+        self.assertEqual([c.reply_count for c in response.context["comments"]], [1, 1, 1])
+        ids = [comment.id for comment in response.context["comments"]][:2]
+        self.client.post(reverse('moderate_comments'), {"ids": ids})
+        self.assertEqual(Comment.objects.count(), 1)
+        run_pending()
+        self.assertEqual(Comment.all_objects.count(), 1)
+
+    def test_admin_changelists_load(self):
+        self.client.login(email="admin@example.com", password="adminpassword")
+        for model in ("user", "comment", "commentreply", "movie", "task", "movieactivity", "contentsignature",
+                      "signatureband", "archivedthread"):
+            response = self.client.get(reverse(f"admin:MyFilmSay_{model}_changelist"))
+            self.assertEqual(response.status_code, 200)
+
+    def test_admin_deletes_are_soft(self):
+        self.client.login(email="admin@example.com", password="adminpassword")
+        movie = Movie.objects.get()
+        reply = CommentReply.objects.first()
+        self.client.post(reverse("admin:MyFilmSay_commentreply_delete", args=[reply.id]), {"post": "yes"})
+        self.assertTrue(CommentReply.all_objects.get(id=reply.id).is_deleted)
+        self.client.post(reverse("admin:MyFilmSay_movie_delete", args=[movie.id]), {"post": "yes"})
+        self.assertTrue(Movie.all_objects.get(id=movie.id).is_deleted)
+        self.assertEqual(Task.objects.filter(name__in=["purge_movie", "purge_replies"]).count(), 2)
+
+        response = self.client.get(reverse("admin:MyFilmSay_movie_changelist"), {"is_deleted__exact": "1"})
+        self.assertEqual(list(response.context["cl"].result_list), [movie])
+
+
+class RenderedTextTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.movie = Movie.objects.create(title="Alien", date="1979", body="")
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.client.login(email="test@example.com", password="password123")
+
+    def test_render_markup_uses_an_allow_list(self):
+        html, plain = render_markup('**bold** <script>alert(1)</script><a href="javascript:x" onclick="y">z</a> 1 < 2')
+        self.assertIn("<strong>bold</strong>", html)
+        self.assertNotIn("script", html)
+        self.assertNotIn("javascript", html)
+        self.assertNotIn("onclick", html)
+        self.assertIn("1 &lt; 2", html)
+        self.assertEqual(plain, "bold z 1 < 2")
+
+    @override_settings(COMMENT_MARKDOWN=False)
+    def test_render_markup_without_markdown(self):
+        html, plain = render_markup("one\ntwo *three*")
+        self.assertEqual(html, "<p>one<br>two *three*</p>")
+        self.assertEqual(plain, "one\ntwo *three*")
+
+    def test_columns_are_written_on_create_and_edit(self):
+        self.client.post(reverse('show_movie', args=[self.movie.id]),
+                         {"comment_text": "_nice_ <img src=x onerror=y>", "user_rating": 7, "submit": "1"})
+        comment = Comment.objects.get()
+        self.assertEqual((comment.text_html, comment.text_plain), ("<p><em>nice</em> </p>", "nice"))
+
+        response = self.client.post(reverse('edit_comment', args=[comment.id]), json.dumps({"text": "**edited**"}),
+                                    content_type="application/json")
+        self.assertEqual(response.json()["html"], "<p><strong>edited</strong></p>")
+        comment.refresh_from_db()
+        comment.text = "changed in the admin"
+        comment.save()
+        self.assertEqual(comment.text_plain, "changed in the admin")
+        self.client.post(reverse('reply_comment', args=[comment.id]), {"reply_text": "a & b"})
+        self.assertEqual(CommentReply.objects.values_list("reply_html", "reply_plain").get(),
+                         ("<p>a &amp; b</p>", "a & b"))
+
+    def test_backfill_command(self):
+        comment = Comment.objects.create(text="*old*", author=self.user, movie=self.movie)
+        CommentReply.objects.create(comment=comment, reply_text="<b>reply</b>", author=self.user)
+        # As left by migration 0009 for rows written before it
+        Comment.objects.update(text_html="", text_plain="")
+        CommentReply.objects.update(reply_html="", reply_plain="")
+        response = self.client.get(reverse('show_movie', args=[self.movie.id]))
+        self.assertContains(response, "<em>old</em>")
+        self.assertNotContains(response, "<p><p>")
+        version = self.movie.activity_version
+        out = StringIO()
+        call_command("render_comments", "--batch-size", "1", stdout=out)
+        self.assertIn("Comment: rendered 1 rows", out.getvalue())
+        comment.refresh_from_db()
+        self.assertEqual(comment.text_html, "<p><em>old</em></p>")
+        self.assertEqual(CommentReply.objects.get().reply_plain, "reply")
+        self.movie.refresh_from_db()
+        self.assertGreater(self.movie.activity_version, version)
+
+
+class CommentSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.movie = Movie.objects.create(title="Alien", date="1979", body="")
+        self.other_movie = Movie.objects.create(title="Aliens", date="1986", body="")
+        self.comment = self.add_comment(self.movie, "The chestburster scene <still> scares me")
+        self.reply = CommentReply.objects.create(comment=self.comment, reply_text="Chestburster forever",
+                                                 author=self.user)
+        self.add_comment(self.movie, "Ripley is the best hero")
+        self.add_comment(self.other_movie, "Another chestburster here")
+
+    def add_comment(self, movie, text):
+        comment = Comment.objects.create(text=text, author=self.user, movie=movie)
+        # Kept raw, so the headline test sees markup-like text escaped
+        Comment.objects.filter(id=comment.id).update(text_plain=text)
+        return comment
+
+    def search(self, movie, **params):
+        return self.client.get(reverse('api_movie_comment_search', args=[movie.id]), params)
+
+    def test_results_are_scoped_ranked_and_highlighted(self):
+        data = self.search(self.movie, q="chestburster").json()
+        self.assertEqual({(row["type"], row["id"]) for row in data["results"]},
+                         {("comment", self.comment.id), ("reply", self.reply.id)})
+        self.assertEqual(sorted(data["results"], key=lambda row: -row["rank"]), data["results"])
+        comment = next(row for row in data["results"] if row["type"] == "comment")
+        self.assertIn("<mark>chestburster</mark>", comment["headline"])
+        self.assertIn("&lt;still&gt;", comment["headline"])
+        self.assertEqual(next(row for row in data["results"] if row["type"] == "reply")["comment_id"], self.comment.id)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.comment.text = "Nothing to see"
+        self.comment.save()
+        self.assertEqual([row["type"] for row in self.search(self.movie, q="chestburster").json()["results"]],
+                         ["reply"])
+        soft_delete_reply(self.reply)
+        self.assertEqual(self.search(self.movie, q="chestburster").json()["results"], [])
+        self.assertEqual(len(self.search(self.movie, q="ripley hero").json()["results"]), 1)
+
+    def test_cursor_pagination(self):
+        for i in range(5):
+            self.add_comment(self.movie, f"Ripley quote {i}")
+        seen = []
+        url = reverse('api_movie_comment_search', args=[self.movie.id]) + "?q=ripley&limit=2"
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(row["id"] for row in data["results"])
+            url = data["next"]
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+    def test_bad_queries(self):
+        self.assertEqual(self.search(self.movie).status_code, 400)
+        self.assertEqual(self.search(self.movie, q='"OR NEAR(').json()["results"], [])
+        self.assertEqual(self.search(self.movie, q="ripley", cursor="nope").status_code, 400)
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=12, TRENDING_WINDOW_HOURS=72, TRENDING_LIMIT=100)
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.quiet, self.old, self.hot = [
+            Movie.objects.create(title=title, date="2000", body="Body") for title in ("Quiet", "Old", "Hot")
+        ]
+
+    @mock.patch("MyFilmSay.auth.cache_is_shared", return_value=True)
+    def test_activity_is_bucketed_and_decayed(self, cache_is_shared):
+        # Buffered in the shared cache, so each flush files it under the bucket it runs in
+        now = timezone.now()
+        record_activity("comments", [self.old.id] * 10)
+        refresh_trending(now - timedelta(hours=48))
+        record_activity("votes", [self.hot.id] * 4)
+        result = refresh_trending(now)
+        self.assertEqual(result["flushed"], 4)
+        self.assertEqual(MovieActivity.objects.get(movie=self.old).comments, 10)
+
+        # 30 in weight two days ago has decayed below 4 in weight right now
+        self.assertEqual(trending_movie_ids(), [self.hot.id, self.old.id])
+        refresh_trending(now + timedelta(hours=60))
+        self.assertEqual(MovieActivity.objects.count(), 1)
+
+    def test_activity_reaches_the_worker_without_a_shared_cache(self):
+        record_activity("votes", [self.hot.id] * 2)
+        self.assertEqual(MovieActivity.objects.get(movie=self.hot).votes, 2)
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                                   "LOCATION": "run-worker"}}):
+            refresh_trending()
+        self.assertEqual(trending_movie_ids(), [self.hot.id])
+
+    def test_comments_replies_and_votes_are_recorded(self):
+        self.client.login(email="test@example.com", password="password123")
+        self.client.post(reverse('show_movie', args=[self.hot.id]),
+                         {"comment_text": "Wow", "user_rating": 7, "submit": "1"})
+        comment = Comment.objects.get()
+        self.client.post(reverse('reply_comment', args=[comment.id]), {"reply_text": "Yes"})
+        self.client.post(reverse('vote'), json.dumps({"comment_id": f"comment-{comment.id}", "vote_type": "like"}),
+                         content_type="application/json")
+        refresh_trending()
+        activity = MovieActivity.objects.get(movie=self.hot)
+        self.assertEqual((activity.comments, activity.replies, activity.votes), (1, 1, 1))
+
+    def test_index_serves_the_precomputed_list(self):
+        record_activity("replies", [self.hot.id, self.hot.id, self.old.id])
+        refresh_trending()
+        response = self.client.get(reverse('get_all_movies'), {"sort_by": "trending"})
+        self.assertEqual([movie.title for movie in response.context["all_movies"]], ["Hot", "Old", "Quiet"])
+        self.assertEqual([movie.title for movie in response.context["trending_movies"]], ["Hot", "Old"])
+
+        record_activity("replies", [self.quiet.id] * 5)
+        refresh_trending()
+        response = self.client.get(reverse('get_all_movies'))
+        self.assertEqual(response.context["trending_movies"][0].title, "Quiet")
+
+    def test_version_only_moves_with_the_ranking(self):
+        record_activity("votes", [self.hot.id])
+        refresh_trending()
+        version = trending_version()
+        record_activity("votes", [self.hot.id])
+        refresh_trending()
+        # Nothing to flush: the scores, the published ranking and the expiry
+        with self.assertNumQueries(3):
+            refresh_trending()
+        self.assertEqual(trending_version(), version)
+        self.assertEqual(MovieActivity.objects.get(movie=self.hot).votes, 2)
+
+        record_activity("comments", [self.old.id])
+        refresh_trending()
+        self.assertGreater(trending_version(), version)
+
+
+class PosterHandler(BaseHTTPRequestHandler):
+    body = b""
+    other_body = b""
+
+    def do_GET(self):
+        if self.path == "/redirect.png":
+            self.send_response(302)
+            self.send_header("Location", "/poster.png")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.end_headers()
+        self.wfile.write(self.other_body if self.path == "/other.png" else self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PosterTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 1500), (200, 30, 30)).save(buffer, "PNG")
+        PosterHandler.body = buffer.getvalue()
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 1500), (30, 30, 200)).save(buffer, "PNG")
+        PosterHandler.other_body = buffer.getvalue()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PosterHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.origin = f"http://127.0.0.1:{cls.server.server_port}/"
+        cls.url = cls.origin + "poster.png"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings_override = override_settings(POSTER_ROOT=self.root.name, POSTER_SOURCE_PREFIXES=[self.origin])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.movie = Movie.objects.create(title="Poster", date="2000", body="Body", img_url=self.url)
+
+    def test_variants_are_stored_content_addressed(self):
+        variants = cache_movie_poster(self.movie.id)
+        self.assertEqual(set(variants), set(POSTER_VARIANTS))
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster, variants)
+
+        from PIL import Image
+        jpg = variants["card"]["jpg"]
+        with Image.open(Path(self.root.name) / jpg[:2] / jpg) as image:
+            self.assertEqual(image.size, (342, 513))
+        # Same source bytes give the same names, so nothing new is written
+        files = sorted(Path(self.root.name).rglob("*.*"))
+        self.assertEqual(cache_movie_poster(self.movie.id), variants)
+        self.assertEqual(sorted(Path(self.root.name).rglob("*.*")), files)
+
+    def test_served_with_immutable_cache_headers(self):
+        name = cache_movie_poster(self.movie.id)["thumb"]["jpg"]
+        response = self.client.get(reverse('poster', args=[name]))
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get(reverse('poster', args=["settings.py"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('poster', args=["0" * 32 + ".jpg"])).status_code, 404)
+
+    def test_templates_prefer_the_local_copy(self):
+        render = engines["django"].from_string(
+            "{% load film_tags %}{% poster_image movie 'card' alt='P' %}|{% poster_background movie 'hero' %}"
+        ).render
+        self.assertIn(self.url, render({"movie": self.movie}))
+        cache_movie_poster(self.movie.id)
+        self.movie.refresh_from_db()
+        html = render({"movie": self.movie})
+        self.assertNotIn(self.url, html)
+        self.assertIn(reverse('poster', args=[self.movie.poster["card"]["jpg"]]), html)
+        self.assertIn("image-set(", html)
+
+    def test_oversized_posters_are_rejected(self):
+        with override_settings(POSTER_MAX_BYTES=1024):
+            with self.assertRaises(PosterError):
+                cache_movie_poster(self.movie.id)
+        self.movie.refresh_from_db()
+        self.assertIsNone(self.movie.poster)
+
+    def test_only_allowed_hosts_are_fetched(self):
+        for url in ("http://localhost:%d/poster.png" % self.server.server_port, self.origin + "redirect.png"):
+            Movie.objects.filter(id=self.movie.id).update(img_url=url)
+            with self.assertRaises(PosterError):
+                cache_movie_poster(self.movie.id)
+        self.movie.refresh_from_db()
+        self.assertIsNone(self.movie.poster)
+        self.assertEqual(list(Path(self.root.name).rglob("*.*")), [])
+
+    def test_superseded_variants_are_deleted(self):
+        old = cache_movie_poster(self.movie.id)
+        shared = Movie.objects.create(title="Shared", date="2000", body="Body", img_url=self.url)
+        cache_movie_poster(shared.id)
+
+        admin = User.objects.create_user(email="admin@example.com", name="Admin", password="password123",
+                                         role=RoleEnum.ADMIN)
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_movie', args=[self.movie.id]),
+                             {"title": "Poster", "date": "2000", "body": "Body", "img_url": self.origin + "other.png"})
+        run_pending()
+        self.movie.refresh_from_db()
+        self.assertNotEqual(self.movie.poster, old)
+        # Still used by the other movie
+        self.assertTrue((Path(self.root.name) / old["card"]["jpg"][:2] / old["card"]["jpg"]).exists())
+
+        purge_movie(shared.id)
+        self.assertFalse((Path(self.root.name) / old["card"]["jpg"][:2] / old["card"]["jpg"]).exists())
+        new = self.movie.poster["card"]["jpg"]
+        self.assertTrue((Path(self.root.name) / new[:2] / new).exists())
+
+    def test_backfill_command_and_url_change(self):
+        call_command("cache_posters", stdout=StringIO())
+        self.movie.refresh_from_db()
+        self.assertIsNotNone(self.movie.poster)
+
+        admin = User.objects.create_user(email="admin@example.com", name="Admin", password="password123",
+                                         role=RoleEnum.ADMIN)
+        self.client.force_login(admin)
+        self.client.post(reverse('edit_movie', args=[self.movie.id]),
+                         {"title": "Poster", "date": "2000", "body": "Body", "img_url": self.url + "?v=2"})
+        self.movie.refresh_from_db()
+        self.assertIsNone(self.movie.poster)
+        run_pending()
+        self.movie.refresh_from_db()
+        self.assertIsNotNone(self.movie.poster)
+
+
+SPAM = "Get free movie tickets now at the best site on the internet, just click the link in my profile"
+
+
+class DuplicateDetectionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.movies = [Movie.objects.create(title=f"Movie {i}", date="2000", body="") for i in range(3)]
+        password = make_password("password123")
+        self.spammers = User.objects.bulk_create([
+            User(email=f"spam{i}@example.com", name=f"Spam {i}", password=password) for i in range(3)
+        ])
+        self.moderator = User.objects.create_user(email="mod@example.com", name="Mod", password="password123",
+                                                  role=RoleEnum.MODERATOR)
+
+    def post(self, user, movie, text):
+        self.client.force_login(user)
+        return self.client.post(reverse('show_movie', args=[movie.id]),
+                                {"comment_text": text, "user_rating": 1, "submit": "1"})
+
+    def test_signatures_estimate_similarity(self):
+        original = duplicates.signature(SPAM)
+        self.assertEqual(original.shape, (duplicates.NUM_PERM,))
+        self.assertGreater((duplicates.signature(SPAM + " today") == original).mean(), 0.8)
+        self.assertLess((duplicates.signature("A slow and thoughtful film about grief, memory and the sea "
+                                              "that rewards patience") == original).mean(), 0.2)
+        self.assertIsNone(duplicates.signature("Great movie!"))
+
+    def test_copies_are_flagged_into_one_cluster(self):
+        for spammer, movie in zip(self.spammers, self.movies):
+            self.post(spammer, movie, SPAM + "!" * spammer.id)
+        self.post(self.spammers[0], self.movies[0], "Short and sweet.")
+        first = Comment.objects.order_by("id").first()
+        root = duplicates.comment_doc_id(first.id)
+        self.assertEqual(ContentSignature.objects.filter(duplicate_of=root).count(), 2)
+
+        clusters, _ = duplicates.cluster_page()
+        self.assertEqual([(cluster["root"], cluster["size"]) for cluster in clusters], [(root, 3)])
+        self.assertEqual(Comment.objects.count(), 4)
+
+    @override_settings(DUPLICATE_ACTION="reject")
+    def test_reject_mode_refuses_copies(self):
+        self.post(self.spammers[0], self.movies[0], SPAM)
+        self.post(self.spammers[1], self.movies[1], SPAM.upper())
+        self.client.post(reverse('reply_comment', args=[Comment.objects.get().id]), {"reply_text": SPAM})
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertFalse(CommentReply.objects.exists())
+
+    def test_batch_scan_and_cluster_moderation(self):
+        Comment.objects.bulk_create([
+            Comment(text=SPAM, text_plain=SPAM, author=spammer, movie=movie)
+            for spammer, movie in zip(self.spammers, self.movies)
+        ])
+        comment = Comment.objects.order_by("id").first()
+        CommentReply.objects.create(comment=comment, reply_text=SPAM, reply_plain=SPAM, author=self.spammers[1])
+        out = StringIO()
+        call_command("scan_duplicates", "--batch-size", "2", stdout=out)
+        self.assertIn("Scanned 4 posts, flagged 3 duplicates", out.getvalue())
+
+        self.client.force_login(self.moderator)
+        response = self.client.post(reverse('moderate_duplicates'),
+                                    {"root": duplicates.comment_doc_id(comment.id), "action": "ban"})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(CommentReply.objects.exists())
+        self.assertFalse(User.objects.filter(id__in=[spammer.id for spammer in self.spammers], is_active=True).exists())
+
+        run_pending()
+        self.assertFalse(ContentSignature.objects.exists())
+        self.assertFalse(SignatureBand.objects.exists())
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="test@example.com", name="Test User", password="password123")
+        self.old = timezone.now() - timedelta(days=800)
+        self.cold = Movie.objects.create(title="Cold", date="1950", body="")
+        self.warm = Movie.objects.create(title="Warm", date="2020", body="")
+        self.thread = Comment.objects.create(text="Old *news*", text_html="<p>Old <em>news</em></p>",
+                                             text_plain="Old news", author=self.user, movie=self.cold,
+                                             timestamp=self.old, likes_count=1)
+        self.reply = CommentReply.objects.create(comment=self.thread, reply_text="Agreed", reply_html="<p>Agreed</p>",
+                                                 reply_plain="Agreed", author=self.user, timestamp=self.old)
+        Vote.objects.create(user=self.user, comment=self.thread, vote_type="like")
+        Vote.objects.create(user=self.user, reply=self.reply, vote_type="dislike")
+        Comment.objects.create(text="Older", author=self.user, movie=self.warm, timestamp=self.old)
+        Comment.objects.create(text="Fresh", author=self.user, movie=self.warm)
+
+    def test_only_cold_threads_are_archived(self):
+        self.assertEqual(archive_threads(), 1)
+        self.assertFalse(Comment.all_objects.filter(movie=self.cold).exists())
+        self.assertFalse(CommentReply.all_objects.exists())
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(Comment.objects.filter(movie=self.warm).count(), 2)
+
+        archived = ArchivedThread.objects.get()
+        self.assertEqual((archived.comment_id, archived.reply_count), (self.thread.id, 1))
+        thread = unpack(archived.payload)
+        self.assertEqual(thread["comment"]["text"], "Old *news*")
+        self.assertEqual(len(thread["votes"]), 2)
+
+    def test_thread_loader_reads_the_archive(self):
+        archive_threads()
+        response = self.client.get(reverse('show_movie', args=[self.cold.id]))
+        self.assertContains(response, "Old <em>news</em>")
+        self.assertContains(response, "<p>Agreed</p>")
+        self.assertContains(response, "Archived")
+
+        for i in range(6):
+            Comment.objects.create(text=f"New {i}", author=self.user, movie=self.cold)
+        html = self.client.get(reverse('load_comments', args=[self.cold.id]), {"offset": 5}).json()["html"]
+        self.assertIn("New 0", html)
+        self.assertIn("Old <em>news</em>", html)
+        html = self.client.get(reverse('load_comments', args=[self.cold.id]), {"offset": 10}).json()["html"]
+        self.assertNotIn("Old <em>news</em>", html)
+
+    def test_restore_and_command(self):
+        out = StringIO()
+        call_command("archive_threads", "--dry-run", stdout=out)
+        self.assertIn("1 threads would be archived", out.getvalue())
+        call_command("archive_threads", stdout=out)
+        self.assertEqual(restore_thread(self.thread.id), 2)
+        self.assertFalse(ArchivedThread.objects.exists())
+        restored = Comment.objects.get(id=self.thread.id)
+        self.assertEqual((restored.text_html, restored.timestamp, restored.likes_count),
+                         (self.thread.text_html, self.thread.timestamp, 1))
+        self.assertEqual(CommentReply.objects.get().id, self.reply.id)
+        self.assertEqual(Vote.objects.count(), 2)
+
+    @skipIf(connection.vendor == "postgresql", "PartitioningTestCase covers PostgreSQL")
+    def test_partitioning_needs_postgres(self):
+        with self.assertRaisesMessage(CommandError, "needs PostgreSQL"):
+            call_command("partition_tables", "status", stdout=StringIO())
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL")
+class PartitioningTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", name="User", password="password123")
+        self.movie = Movie.objects.create(title="Movie", date="2000", body="")
+        self.comments = [Comment.objects.create(author=self.user, movie=self.movie, text=f"Comment {i}")
+                         for i in range(3)]
+        Vote.objects.create(user=self.user, comment=self.comments[0], vote_type="like")
+
+    def step(self, step, table, *args):
+        out = StringIO()
+        call_command("partition_tables", step, "--table", table, *args, stdout=out)
+        return out.getvalue()
+
+    def test_prepare_backfill_and_swap(self):
+        for table in partitioning.TABLES:
+            self.step("prepare", table)
+        # Written after prepare, so only the trigger copies them
+        late = Comment.objects.create(author=self.user, movie=self.movie, text="Late")
+        Comment.objects.filter(id=self.comments[1].id).update(text="Edited")
+        Comment.objects.filter(id=self.comments[2].id).delete()
+        expected = sorted(Comment.objects.values_list("id", "text"))
+
+        for table in partitioning.TABLES:
+            self.step("backfill", table, "--batch-size", "1")
+            self.assertEqual(self.step("status", table), f"{table}: backfilled\n")
+            self.step("swap", table)
+            self.assertEqual(self.step("status", table), f"{table}: partitioned, legacy kept\n")
+
+        self.assertEqual(sorted(Comment.objects.values_list("id", "text")), expected)
+        self.assertEqual(Vote.objects.get().comment_id, self.comments[0].id)
+        self.assertGreater(Comment.objects.create(author=self.user, movie=self.movie, text="New").id, late.id)
+        for table in partitioning.TABLES:
+            self.step("drop-legacy", table)
+            self.assertEqual(self.step("status", table), f"{table}: partitioned\n")
+
+    def test_unprepare(self):
+        self.step("prepare", "MyFilmSay_vote")
+        with self.assertRaisesMessage(CommandError, "already mirroring"):
+            self.step("prepare", "MyFilmSay_vote")
+        self.step("unprepare", "MyFilmSay_vote")
+        self.assertEqual(self.step("status", "MyFilmSay_vote"), "MyFilmSay_vote: not prepared\n")
+        with self.assertRaisesMessage(CommandError, "must be prepared and backfilled"):
+            self.step("swap", "MyFilmSay_vote")
+
+
+class StartupTestCase(TestCase):
+    def test_parse_importtime(self):
+        modules = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   MyFilmSay.tmdb\n"
+            "import time:      1500 |       2000 | MyFilmSay.views\n"
+        )
+        self.assertEqual(modules, [
+            {"module": "MyFilmSay.tmdb", "self_us": 120, "cumulative_us": 120, "depth": 1},
+            {"module": "MyFilmSay.views", "self_us": 1500, "cumulative_us": 2000, "depth": 0},
+        ])
+
+    def test_heavy_modules_load_on_first_use(self):
+        code = ("import sys, django; django.setup(); import demo.urls; "
+                "print(','.join(m for m in ('numpy', 'requests', 'markdown', 'PIL') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                env={**os.environ, "DJANGO_SETTINGS_MODULE": "demo.settings"})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_startup_profile_reports_and_enforces_budget(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "exceeds"):
+            call_command("startup_profile", "--json", "--limit", "3", "--max-ms", "0.01", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertGreater(report["total_ms"], 0)
+        self.assertEqual(len(report["slowest"]), 3)
+
+    def test_tmdb_errors_are_wrapped(self):
+        import requests
+        with mock.patch.object(tmdb, "_session") as session:
+            session.return_value.get.side_effect = requests.ConnectionError("offline")
+            with self.assertRaises(tmdb.TMDbError):
+                tmdb.search_movies("Alien")
+
+
+class QueryPlanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        queryplans.seed()
+
+    def test_hot_queries_keep_their_plans(self):
+        current = queryplans.capture()
+        baseline = queryplans.load_snapshot()
+        self.assertEqual(set(baseline), set(queryplans.HOT_QUERIES))
+        self.assertEqual(queryplans.regressions(queryplans.diff_plans(baseline, current)), {})
+
+    def test_diff_flags_only_worse_access(self):
+        def plan(access, index, rows=None, sort=False):
+            return {"scans": [{"relation": "MyFilmSay_comment", "access": access, "index": index, "rows": rows}],
+                    "sort": sort}
+
+        baseline = {"a": plan("index", "comment_movie_id_idx", 20), "b": plan("seq", None), "c": plan("index", "x")}
+        current = {"a": plan("seq", None, 50000), "b": plan("full-index", "y"), "c": plan("index", "x", sort=True)}
+        changes = queryplans.diff_plans(baseline, current)
+        self.assertEqual(queryplans.regressions(changes), {
+            "a": ["MyFilmSay_comment: index (comment_movie_id_idx) -> seq",
+                  "MyFilmSay_comment: estimated rows 20 -> 50000"],
+            "c": ["sort step added"],
+        })
+        self.assertEqual(changes["b"], [(False, "MyFilmSay_comment: seq -> full-index (y)")])
+
+    def test_command_prints_diff_and_fails_on_regression(self):
+        snapshot = json.loads(queryplans.SNAPSHOT_PATH.read_text())
+        snapshot["sqlite"]["movie_search"]["scans"][0].update(access="index", index="movie_title_idx")
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "plans.json"
+            path.write_text(json.dumps(snapshot))
+            out = StringIO()
+            with self.assertRaisesMessage(CommandError, "1 regressed"):
+                call_command("query_plans", "--snapshot", str(path), stdout=out)
+            self.assertIn("movie_search\n  ! MyFilmSay_movie: index (movie_title_idx) -> seq", out.getvalue())
+
+            call_command("query_plans", "--snapshot", str(path), "--update", "--query", "movie_search", stdout=StringIO())
+            self.assertEqual(json.loads(path.read_text())["sqlite"]["movie_search"]["scans"][0]["access"], "seq")
+
+
+@override_settings(SITEMAP_SHARD_SIZE=2, SITEMAP_BASE_URL="")
+class SitemapTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings_override = override_settings(SITEMAP_ROOT=self.root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.movies = [Movie.objects.create(title=f"Sitemap {i}", date="2000", body="Body") for i in range(5)]
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        body = b"".join(response.streaming_content).decode() if response.status_code == 200 else ""
+        return response, body
+
+    def test_index_points_at_shards_of_at_most_shard_size(self):
+        response, index = self.fetch(reverse("sitemap_index"))
+        self.assertEqual(response["Content-Type"], "application/xml")
+        shards = sorted({shard_of(movie.id) for movie in self.movies})
+        self.assertEqual(index.count("<sitemap>"), len(shards))
+
+        listed = []
+        for shard in shards:
+            self.assertIn(f"http://testserver{reverse('sitemap_shard', args=[shard])}", index)
+            _, body = self.fetch(reverse("sitemap_shard", args=[shard]))
+            self.assertLessEqual(body.count("<url>"), 2)
+            listed += [movie.id for movie in self.movies if reverse("show_movie", args=[movie.id]) + "<" in body]
+        self.assertEqual(sorted(listed), [movie.id for movie in self.movies])
+        self.assertEqual(self.client.get(reverse("sitemap_shard", args=[shards[-1] + 1])).status_code, 404)
+
+    def test_conditional_get_and_invalidation(self):
+        first, second = self.movies[0], self.movies[-1]
+        url, other_url = (reverse("sitemap_shard", args=[shard_of(movie.id)]) for movie in (first, second))
+        response, _ = self.fetch(url)
+        other, _ = self.fetch(other_url)
+        self.assertTrue(response.has_header("Last-Modified"))
+        self.assertEqual(self.fetch(url, HTTP_IF_NONE_MATCH=response["ETag"])[0].status_code, 304)
+
+        # Activity waits for the periodic build, and only the shard it happened in is rebuilt
+        touch_movie(first.id)
+        self.assertEqual(self.fetch(url, HTTP_IF_NONE_MATCH=response["ETag"])[0].status_code, 304)
+        # The build runs in run_worker, which has a cache of its own
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                                   "LOCATION": "run-worker"}}):
+            sitemaps.build_all("http://testserver")
+        self.assertEqual(self.fetch(url, HTTP_IF_NONE_MATCH=response["ETag"])[0].status_code, 200)
+        self.assertEqual(self.fetch(other_url, HTTP_IF_NONE_MATCH=other["ETag"])[0].status_code, 304)
+
+        soft_delete_movie(second)
+        _, body = self.fetch(other_url)
+        self.assertNotIn(reverse("show_movie", args=[second.id]) + "<", body)
+
+    def test_file_replaced_before_it_is_opened(self):
+        shard = shard_of(self.movies[0].id)
+        current = sitemaps.shard_file("http://testserver", shard)
+        gone = Path(self.root.name) / "gone.xml"
+        # Once for Last-Modified, then the view opens the stale path and looks again
+        with mock.patch.object(sitemaps, "shard_file", side_effect=[gone, gone, current]) as shard_file:
+            response, body = self.fetch(reverse("sitemap_shard", args=[shard]))
+        self.assertEqual((response.status_code, shard_file.call_count), (200, 3))
+        self.assertIn(reverse("show_movie", args=[self.movies[0].id]) + "<", body)
+
+    def test_build_command_precomputes_files(self):
+        call_command("build_sitemaps", "--base-url", "https://films.example/", stdout=StringIO())
+        files = sorted(Path(self.root.name).rglob("*.xml"))
+        self.assertEqual(len(files), 1 + len({shard_of(movie.id) for movie in self.movies}))
+
+        with override_settings(SITEMAP_BASE_URL="https://films.example"):
+            _, body = self.fetch(reverse("sitemap_shard", args=[shard_of(self.movies[0].id)]))
+        self.assertIn(f"<loc>https://films.example{reverse('show_movie', args=[self.movies[0].id])}</loc>", body)
+        self.assertEqual(sorted(Path(self.root.name).rglob("*.xml")), files)
+
+
+class CatalogueSnapshotTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(CATALOGUE_SNAPSHOT=True, CATALOGUE_SNAPSHOT_ROOT=root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Each test starts from a worker that has mapped nothing
+        self.enterContext(mock.patch("MyFilmSay.snapshot._current", None))
+        self.enterContext(mock.patch("MyFilmSay.snapshot._build_requested", False))
+        self.movies = [
+            Movie.objects.create(title="Amélie", date="2001", year=2001, body="Paris ✨", rating=8.3,
+                                 director="Jean-Pierre Jeunet", poster={"card": {"jpg": "a" * 32 + ".jpg"}}),
+            Movie.objects.create(title="Alien", date="1979", year=1979, body="Space", rating=8.5),
+            Movie.objects.create(title="Heat", date="1995", body="", rating=None, img_url=None),
+        ]
+
+    def test_records_and_orderings_match_the_database(self):
+        snapshot = CatalogueSnapshot(publish_snapshot())
+        for movie in Movie.objects.all():
+            record = snapshot.get(movie.id)
+            self.assertEqual({field: getattr(record, field) for field in SNAPSHOT_FIELDS},
+                             {field: getattr(movie, field) for field in SNAPSHOT_FIELDS})
+        self.assertIsNone(snapshot.get(max(movie.id for movie in self.movies) + 1))
+        for ordering in ("title", "-rating", "-date"):
+            self.assertEqual([record.id for record in snapshot.ordered(ordering)],
+                             list(Movie.objects.order_by(ordering).values_list("id", flat=True)))
+        for query in ("A", "li", "ÉL", "heat", "ienH", "zzz"):
+            self.assertEqual([record.id for record in snapshot.search(query)],
+                             [movie.id for movie in self.movies if query.lower() in movie.title.lower()])
+
+    def test_pages_read_movies_from_the_snapshot(self):
+        publish_snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(reverse('get_all_movies'), {"sort_by": "rating"}), "Amélie")
+            self.assertContains(self.client.get(reverse('search'), {"query": "ali"}), "Alien")
+            self.assertContains(self.client.get(reverse('show_movie', args=[self.movies[0].id])), "Jean-Pierre")
+        self.assertFalse(any('"MyFilmSay_movie"."body"' in query["sql"] for query in queries.captured_queries))
+
+    def test_movie_changes_publish_a_new_version(self):
+        # Nothing published yet: the database answers and a build is queued
+        self.assertIsNone(current_snapshot())
+        run_pending()
+        old = current_snapshot()
+        self.assertEqual(old.count, 3)
+
+        self.movies[1].title = "Aliens"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies[1].save()
+        self.assertIsNone(current_snapshot())
+        self.assertContains(self.client.get(reverse('show_movie', args=[self.movies[1].id])), "Aliens")
+        run_pending()
+        new = current_snapshot()
+        self.assertNotEqual(new.version, old.version)
+        self.assertEqual(new.get(self.movies[1].id).title, "Aliens")
+        # The old mapping stays readable for requests still holding it
+        self.assertEqual(old.get(self.movies[1].id).title, "Alien")
+
+    def test_records_decode_fields_on_first_access(self):
+        snapshot = CatalogueSnapshot(publish_snapshot())
+        with mock.patch.object(snapshot, "field", wraps=snapshot.field) as field:
+            records = snapshot.ordered("title")
+            self.assertEqual([record.title for record in records], ["Alien", "Amélie", "Heat"])
+            self.assertEqual(records[0].title, "Alien")
+        self.assertEqual(field.call_count, 3)
+
+    def test_status_reports_resident_memory(self):
+        out = StringIO()
+        call_command("catalogue_snapshot", "publish", stdout=out)
+        self.assertIn("3 movies", out.getvalue())
+        self.assertRegex(out.getvalue(), r"RSS \d+ kB")
@@ -0,0 +1,49 @@
+from functools import lru_cache
+from django.conf import settings
+
+API_URL = "https://api.themoviedb.org/3/search/movie"
+API_IMG_URL = "https://image.tmdb.org/t/p/w500"
+MOVIE_DB_INFO_URL = "https://api.themoviedb.org/3/movie"
+TIMEOUT = 10
+
+
+class TMDbError(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _session():
+    # requests is only imported, and its connection pool only built, once TMDb is actually called
+    import requests
+    return requests.Session()
+
+
+def _get(url, **params):
+    import requests
+
+    try:
+        response = _session().get(url, params={"api_key": settings.TMDB_API_KEY, **params}, timeout=TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        raise TMDbError(str(e)) from e
+    return response.json()
+
+
+def search_movies(title):
+    return _get(API_URL, query=title).get("results", [])
+
+
+def fetch_movie(tmdb_id):
+    data = _get(f"{MOVIE_DB_INFO_URL}/{tmdb_id}")
+    crew = _get(f"{MOVIE_DB_INFO_URL}/{tmdb_id}/credits").get("crew", [])
+
+    return {
+        "title": data.get("title", "Unknown Title"),
+        "date": data.get("release_date", "").split("-")[0] if data.get("release_date") else None,
+        "img_url": f"{API_IMG_URL}{data['poster_path']}" if data.get("poster_path") else None,
+        "body": data.get("overview", ""),
+        "rating": data.get("vote_average"),
+        "director": ", ".join([c["name"] for c in crew if c.get("job") == "Director"]),
+        "writers": ", ".join([c["name"] for c in crew if c.get("job") in ["Writer", "Screenplay"]]),
+        "genres": ", ".join([g["name"] for g in data.get("genres", [])]),
+    }
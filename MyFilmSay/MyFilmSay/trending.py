@@ -0,0 +1,148 @@
+import math
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from . import auth
+from .models import Movie, MovieActivity
+from .popularity import top_movie_ids
+from .state import read_state, write_state
+
+ACTIVITY_PREFIX = "activity:"
+TRENDING_KEY = "trending"
+FLUSH_CHUNK_SIZE = 500
+
+# Counter -> weight in the trending score
+WEIGHTS = {"comments": 3, "replies": 2, "votes": 1}
+
+
+def _activity_key(kind, movie_id):
+    return f"{ACTIVITY_PREFIX}{kind}:{movie_id}"
+
+
+def _dirty_key(chunk):
+    return f"{ACTIVITY_PREFIX}dirty:{chunk}"
+
+
+def record_activity(kind, movie_ids):
+    # movie_ids may repeat; each occurrence counts once
+    counts = Counter(movie_ids)
+    if not auth.cache_is_shared():
+        # run_worker flushes from its own cache and would never see this process's counters
+        _add_activity({movie_id: {kind: count} for movie_id, count in counts.items()}, current_bucket())
+        return
+    for movie_id, count in counts.items():
+        key = _activity_key(kind, movie_id)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+    # Flagged after the counters, so a flush that has just cleared the flag comes back for them
+    cache.set_many({_dirty_key(movie_id // FLUSH_CHUNK_SIZE): 1 for movie_id in counts}, None)
+
+
+def current_bucket(now=None):
+    return (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+
+def _add_activity(pending, bucket):
+    # pending: movie id -> {counter: increment}; returns the ids that still belong to live movies
+    live = set(Movie.objects.filter(id__in=pending).values_list("id", flat=True))
+    with transaction.atomic():
+        MovieActivity.objects.bulk_create(
+            [MovieActivity(movie_id=movie_id, bucket=bucket) for movie_id in live], ignore_conflicts=True
+        )
+        for movie_id, counts in pending.items():
+            if movie_id not in live:
+                continue
+            MovieActivity.objects.filter(movie_id=movie_id, bucket=bucket).update(
+                **{kind: F(kind) + count for kind, count in counts.items()}
+            )
+    return live
+
+
+def _flush_chunk(movie_ids, bucket):
+    keys = {_activity_key(kind, movie_id): (kind, movie_id) for movie_id in movie_ids for kind in WEIGHTS}
+    pending = defaultdict(dict)
+    for key, count in cache.get_many(keys).items():
+        if count:
+            kind, movie_id = keys[key]
+            pending[movie_id][kind] = count
+    if not pending:
+        return 0
+    live = _add_activity(pending, bucket)
+    # Activity recorded while flushing stays in the cache for the next run
+    for movie_id, counts in pending.items():
+        for kind, count in counts.items():
+            try:
+                cache.decr(_activity_key(kind, movie_id), count)
+            except ValueError:
+                pass
+    return sum(sum(counts.values()) for movie_id, counts in pending.items() if movie_id in live)
+
+
+def flush_activity(now=None):
+    # Only id ranges flagged by record_activity are read; counters of deleted movies are dropped
+    if not auth.cache_is_shared():
+        return 0
+    bucket = current_bucket(now)
+    top = Movie.all_objects.aggregate(top=Max("id"))["top"] or 0
+    dirty_keys = {_dirty_key(chunk): chunk for chunk in range(top // FLUSH_CHUNK_SIZE + 1)}
+    flushed = 0
+    for key in cache.get_many(dirty_keys):
+        cache.delete(key)
+        start = dirty_keys[key] * FLUSH_CHUNK_SIZE
+        flushed += _flush_chunk(range(start, start + FLUSH_CHUNK_SIZE), bucket)
+    return flushed
+
+
+def trending_scores(now=None):
+    now = now or timezone.now()
+    cutoff = current_bucket(now) - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+    decay = math.log(2) / settings.TRENDING_HALF_LIFE_HOURS
+    scores = defaultdict(float)
+    rows = MovieActivity.objects.filter(bucket__gt=cutoff, movie__is_deleted=False) \
+        .values_list("movie_id", "bucket", *WEIGHTS).iterator(chunk_size=FLUSH_CHUNK_SIZE)
+    for movie_id, bucket, *counts in rows:
+        # Measured from the middle of the hour, so the current bucket is not weighted above 1
+        age_hours = max((now - bucket).total_seconds() / 3600 - 0.5, 0)
+        activity = sum(weight * count for weight, count in zip(WEIGHTS.values(), counts))
+        scores[movie_id] += activity * math.exp(-decay * age_hours)
+    return scores
+
+
+def refresh_trending(now=None):
+    flushed = flush_activity(now)
+    scores = trending_scores(now)
+    ranked = sorted(scores, key=lambda movie_id: (-scores[movie_id], movie_id))[:settings.TRENDING_LIMIT]
+    # The version is part of the index ETag, so it only moves when the ranking does. Published in the
+    # database, since the web workers may not share run_worker's cache
+    previous = read_state(TRENDING_KEY)
+    if previous is None or previous["ids"] != ranked:
+        version = max(int(time.time()), previous["version"] + 1 if previous else 0)
+        write_state(TRENDING_KEY, {"version": version, "ids": ranked})
+
+    cutoff = current_bucket(now) - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+    expired, _ = MovieActivity.objects.filter(bucket__lte=cutoff).delete()
+    return {"flushed": flushed, "ranked": len(ranked), "expired": expired}
+
+
+def _trending():
+    return read_state(TRENDING_KEY) or {"version": 0, "ids": None}
+
+
+def trending_version():
+    return _trending()["version"]
+
+
+def trending_movie_ids(limit=None):
+    ids = _trending()["ids"]
+    if ids is None:
+        # Until the first refresh has run, the most viewed movies stand in
+        ids = top_movie_ids(settings.TRENDING_LIMIT)
+    return ids[:limit] if limit else ids
@@ -1,7 +1,12 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
+    path('api/movies/', api.movie_list, name='api_movie_list'),
+    path('api/movies/<int:movie_id>/', api.movie_detail, name='api_movie_detail'),
+    path('api/movies/<int:movie_id>/comments/', api.movie_comments, name='api_movie_comments'),
+    path('api/movies/<int:movie_id>/comments/search/', api.movie_comment_search, name='api_movie_comment_search'),
+    path('api/comments/<int:comment_id>/replies/', api.comment_replies, name='api_comment_replies'),
     path('', views.get_all_movies, name='get_all_movies'),
     path('register/', views.register, name='register'),
     path('login/', views.login_view, name='login'),
@@ -9,20 +14,31 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('delete_user/<int:user_id>/', views.delete_user, name='delete_user'),
     path('search/', views.search, name='search'),
+    path('browse/', views.browse, name='browse'),
+    path('browse/facets/', views.browse_facets, name='browse_facets'),
     path('movie/<int:movie_id>', views.show_movie, name='show_movie'),
     path('reply_comment/<int:comment_id>', views.reply_comment, name='reply_comment'),
     path('vote/', views.vote, name='vote'),
+    path('vote/batch/', views.vote_batch, name='vote_batch'),
     path('load_comments/<int:movie_id>/', views.load_comments, name='load_comments'),
     path("new-movie/", views.add_new_movie, name="add_new_movie"),
     path('find/<int:movie_id>/', views.find_movie, name='find_movie'),
+    path('tasks/<int:task_id>/', views.task_status, name='task_status'),
     path("edit-movie/<int:movie_id>/", views.edit_movie, name="edit_movie"),
     path("delete/<int:movie_id>", views.delete_movie, name="delete_movie"),
     path("users", views.users, name="users"),
+    path("moderation/comments", views.moderate_comments, name="moderate_comments"),
+    path("moderation/duplicates", views.moderate_duplicates, name="moderate_duplicates"),
+    path("moderation/catalogue-snapshot", views.catalogue_snapshot, name="catalogue_snapshot"),
     path("user/<int:user_id>", views.user_profile, name="user_profile"),
     path("delete_comment/<int:comment_id>", views.delete_comment, name="delete_comment"),
     path("delete_reply/<int:reply_id>", views.delete_reply, name="delete_reply"),
+    path("avatar/<str:digest>.svg", views.avatar, name="avatar"),
+    path("posters/<str:name>", views.poster, name="poster"),
     path("about", views.about, name="about"),
     path("seo", views.seo, name="seo"),
+    path("sitemap.xml", views.sitemap_index, name="sitemap_index"),
+    path("sitemap-<int:shard>.xml", views.sitemap_shard, name="sitemap_shard"),
     path('error/<str:message>/', views.error, name='error_with_message'),
     path('edit_comment/<int:comment_id>/', views.edit_comment, name='edit_comment'),
     path('edit_reply/<int:reply_id>/', views.edit_reply, name='edit_reply'),
@@ -1,40 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
-from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.hashers import make_password
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, Http404, FileResponse
 from django.views.decorators.http import require_http_methods, require_POST
-from .models import Movie, User, Comment, CommentReply, Vote, RoleEnum
+from .models import Movie, User, Comment, CommentReply, RoleEnum, Task, ArchivedThread
 from .forms import CreateMovieForm, RegisterForm, LoginForm, CommentForm, ReplyForm, FindMovieForm
 from django.urls import reverse
-import random
-from .utils import admin_only, admin_or_moderator_only
-import requests
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from .permissions import capability_required, has_capability
+from .catalogue import sync_movie_relations, parse_filters, filter_movies, facet_counts
+from .queries import movie_list, movie_search, comment_page, profile_comments, profile_replies
+from .avatars import load_avatar
+from .caching import (touch_movie, cacheable_page, movie_etag, movie_last_modified,
+                      catalogue_etag, static_page_etag)
+from .popularity import counts_views
+from .trending import record_activity, trending_movie_ids
+from .voting import apply_votes, attach_vote_state, parse_target, VoteError
+from .purge import soft_delete_comment, soft_delete_reply, soft_delete_movie, soft_delete_user
+from .moderation import (console_users, console_comments, console_page, bulk_user_action, bulk_delete_comments,
+                         bulk_delete_cluster, ModerationError)
+from .tasks import enqueue
+from .archive import archived_threads
+from .posters import poster_path, discard_posters, CONTENT_TYPES as POSTER_CONTENT_TYPES
+from . import sitemaps
+from .snapshot import current_snapshot, snapshot_status
+from . import duplicates, tmdb
 import json
 from django.utils.http import urlencode
-import os
-from dotenv import load_dotenv
 from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
-API_KEY = os.getenv("API_KEY_TMDb")
-API_URL = "https://api.themoviedb.org/3/search/movie"
-API_IMG_URL = "https://image.tmdb.org/t/p/w500"
-MOVIE_DB_INFO_URL = "https://api.themoviedb.org/3/movie"
 COMMENTS_PER_PAGE = 5
+CAROUSEL_SIZE = 3
+BROWSE_PAGE_SIZE = 24
+VOTE_BATCH_LIMIT = 50
+SORT_ORDERINGS = {'title': 'title', 'rating': '-rating', 'date': '-date'}
 
 
-def is_admin(user):
-    return user.is_authenticated and user.role == 'admin'
-
-
-@login_required
-@admin_only
+@capability_required("manage_movies")
 def add_movie(request):
     if request.method == "POST":
         form = CreateMovieForm(request.POST)
@@ -52,6 +60,9 @@ def register(request):
         form = RegisterForm(request.POST)
         if form.is_valid():
             email = form.cleaned_data['email']
+            if User.all_objects.filter(email=email, is_deleted=True).exists():
+                messages.warning(request, "An account with that email is still being deleted, please try again later.")
+                return redirect('register')
             if User.objects.filter(email=email).exists():
                 messages.warning(request, "You've already signed up with that email, log in instead!")
                 return redirect('login')
@@ -95,22 +106,26 @@ def login_view(request):
     return render(request, 'login.html', {'form': form})
 
 
-@login_required  # POPRAWKA: Dodano dekorator
+@capability_required("assign_roles")
 def assign_role(request, user_id, role):
-    if not (request.user.is_admin or request.user.is_moderator):
-        messages.error(request, "You do not have permission to assign role.")
-        return redirect(reverse('index'))
 
     user = get_object_or_404(User, pk=user_id)
+    # As in the moderation console, only admins may change another admin's role
+    if user.role == RoleEnum.ADMIN.value and not has_capability(request.user, "assign_admin"):
+        raise PermissionDenied()
 
     valid_roles = [RoleEnum.USER.value, RoleEnum.MODERATOR.value, RoleEnum.ADMIN.value]
     if role not in valid_roles:
         messages.error(request, "Invalid role.")
-        return redirect(reverse('index'))
+        return redirect(reverse('users'))
+
+    if role == RoleEnum.ADMIN.value and not has_capability(request.user, "assign_admin"):
+        messages.error(request, "You do not have permission to assign the admin role.")
+        return redirect(reverse('users'))
 
     if role == RoleEnum.ADMIN.value and request.user.id == user.id:
         messages.error(request, "You cannot assign the admin role to yourself.")
-        return redirect(reverse('index'))
+        return redirect(reverse('users'))
 
     with transaction.atomic():
         user.role = role
@@ -120,8 +135,7 @@ def assign_role(request, user_id, role):
     return redirect(reverse('users'))
 
 
-@login_required
-@user_passes_test(is_admin, login_url='index')
+@capability_required("delete_users")
 def delete_user(request, user_id):
     user = get_object_or_404(User, id=user_id)
 
@@ -129,8 +143,7 @@ def delete_user(request, user_id):
         messages.error(request, "You cannot delete your own account.")
         return redirect('users')
 
-    with transaction.atomic():
-        user.delete()
+    soft_delete_user(user)
 
     messages.success(request, f"User {user.name} has been deleted.")
     return redirect('users')
@@ -141,50 +154,74 @@ def logout_view(request):
     return redirect('get_all_movies')
 
 
+@cacheable_page(catalogue_etag)
 def get_all_movies(request):
-    sort_by = request.GET.get('sort_by', 'title')
-    if sort_by == 'rating':
-        all_movies = Movie.objects.order_by('-rating')
-    elif sort_by == 'date':
-        all_movies = Movie.objects.order_by('-date')
+    sort_by = request.GET.get('sort_by', 'title').strip()
+    ordering = SORT_ORDERINGS.get(sort_by, 'title')
+    catalogue = current_snapshot()
+    if catalogue is not None:
+        all_movies = catalogue.ordered(ordering)
     else:
-        all_movies = Movie.objects.order_by('title')
+        all_movies = list(movie_list(ordering))
+
+    trending_ids = trending_movie_ids()
+    if sort_by == 'trending':
+        positions = {movie_id: position for position, movie_id in enumerate(trending_ids)}
+        all_movies.sort(key=lambda movie: positions.get(movie.id, len(positions)))
 
-    all_movies = list(all_movies)
-    random_movies = random.sample(all_movies, 3) if len(all_movies) >= 3 else all_movies
+    by_id = {movie.id: movie for movie in all_movies}
+    trending_movies = [by_id[movie_id] for movie_id in trending_ids if movie_id in by_id][:CAROUSEL_SIZE]
     return render(request, 'index.html', {
         'all_movies': all_movies,
-        'random_movies': random_movies,
+        'trending_movies': trending_movies or all_movies[:CAROUSEL_SIZE],
         'current_sort': sort_by
     })
 
 
 def search(request):
-    if request.method == 'POST':
-        query = request.POST.get('query')
-        if query:
-            results = Movie.objects.filter(title__icontains=query)
-            return render(request, 'search_results.html', {'search_results': results, 'query': query})
+    query = request.POST.get('query') if request.method == 'POST' else request.GET.get('query')
+    if query:
+        catalogue = current_snapshot()
+        results = catalogue.search(query) if catalogue is not None else movie_search(query)
+        return render(request, 'search_results.html', {'search_results': results, 'query': query})
     return render(request, 'search_results.html', {'search_results': [], 'query': ''})
 
 
+def browse(request):
+    filters = parse_filters(request.GET)
+    movies = Paginator(filter_movies(**filters).order_by("title", "id"), BROWSE_PAGE_SIZE) \
+        .get_page(request.GET.get("page"))
+    return render(request, "browse.html", {
+        "movies": movies,
+        "facets": facet_counts(filters),
+        "filters": filters,
+    })
+
+
+def browse_facets(request):
+    return JsonResponse(facet_counts(parse_filters(request.GET)))
+
+
+@counts_views
+@cacheable_page(movie_etag, movie_last_modified)
 def show_movie(request, movie_id):
-    movie = get_object_or_404(Movie, id=movie_id)
+    catalogue = current_snapshot()
+    movie = catalogue.get(movie_id) if catalogue is not None else None
+    if movie is None:
+        movie = get_object_or_404(Movie, id=movie_id)
     offset = int(request.GET.get("offset", 0))
 
     comment_form = CommentForm(request.POST or None)
     reply_form = ReplyForm()
 
-    comments = Comment.objects.filter(movie_id=movie.id) \
-                   .select_related('author') \
-                   .prefetch_related('replies_set__author') \
-                   .order_by('-id')[offset:offset + COMMENTS_PER_PAGE]
+    comments = comment_page(movie.id, "-id", offset, COMMENTS_PER_PAGE)
+    comments = attach_vote_state(request.user, movie.id, comments)
 
     total_comments = Comment.objects.filter(movie_id=movie.id).count()
+    archived = _archived_page(movie.id, offset, len(comments), total_comments)
     current_user_id = request.user.id if request.user.is_authenticated else None
 
     rating_percentage = movie.rating * 10 if movie.rating else 0
-    star_range = range(1, 11)
 
     if request.method == "POST" and 'submit' in request.POST:
         if not request.user.is_authenticated:
@@ -195,14 +232,23 @@ def show_movie(request, movie_id):
             parent_id = comment_form.cleaned_data.get('parent_id')
             parent = Comment.objects.get(id=parent_id) if parent_id else None
 
+            comment = Comment(
+                text=comment_form.cleaned_data['comment_text'],
+                author=request.user,
+                movie_id=movie.id,
+                user_rating=comment_form.cleaned_data['user_rating'],
+                parent=parent
+            )
+            comment.render()
+            fingerprint = duplicates.fingerprint(comment.text_plain)
+            if duplicates.rejects(fingerprint):
+                messages.error(request, "This comment looks like a copy of one already posted.")
+                return redirect('show_movie', movie_id=movie_id)
             with transaction.atomic():
-                Comment.objects.create(
-                    text=comment_form.cleaned_data['comment_text'],
-                    author=request.user,
-                    movie=movie,
-                    user_rating=comment_form.cleaned_data['user_rating'],
-                    parent=parent
-                )
+                comment.save()
+                duplicates.index_document(duplicates.comment_doc_id(comment.id), fingerprint)
+                touch_movie(movie.id)
+            record_activity("comments", [movie.id])
 
             messages.success(request, "Comment added successfully!")
             return redirect('show_movie', movie_id=movie_id)
@@ -214,12 +260,12 @@ def show_movie(request, movie_id):
         "form": comment_form,
         "reply_form": reply_form,
         "comments": comments,
-        "total_comments": total_comments,
+        "archived": archived,
+        "total_comments": total_comments + ArchivedThread.objects.filter(movie_id=movie.id).count(),
         "current_user": request.user,
         "current_user_id": current_user_id,
         "rating_percentage": rating_percentage,
         "offset": offset,
-        "star_range": star_range,
     })
 
 
@@ -228,28 +274,29 @@ def reply_comment(request, comment_id):
     reply_form = ReplyForm(request.POST)
     if reply_form.is_valid():
         reply_text = reply_form.cleaned_data['reply_text']
+        new_reply = CommentReply(reply_text=reply_text, author=request.user)
+        new_reply.render()
         parent_reply_id = request.POST.get("parent_reply_id")
+        fingerprint = duplicates.fingerprint(new_reply.reply_plain)
+        if duplicates.rejects(fingerprint):
+            messages.error(request, "This reply looks like a copy of one already posted.")
+            return redirect(request.META.get("HTTP_REFERER", '/'))
 
         with transaction.atomic():
             if parent_reply_id:
-                parent_reply = get_object_or_404(CommentReply, id=parent_reply_id)
-                new_reply = CommentReply(
-                    parent_id=parent_reply.id,
-                    comment_id=parent_reply.comment.id,
-                    reply_text=reply_text,
-                    author=request.user,
-                )
-                movie_id = parent_reply.comment.movie.id
+                parent_reply = get_object_or_404(CommentReply.objects.select_related('comment'), id=parent_reply_id)
+                new_reply.parent_id = parent_reply.id
+                new_reply.comment_id = parent_reply.comment.id
+                movie_id = parent_reply.comment.movie_id
             else:
                 comment = get_object_or_404(Comment, id=comment_id)
-                new_reply = CommentReply(
-                    comment_id=comment.id,
-                    reply_text=reply_text,
-                    author=request.user,
-                )
-                movie_id = comment.movie.id
+                new_reply.comment_id = comment.id
+                movie_id = comment.movie_id
 
             new_reply.save()
+            duplicates.index_document(duplicates.reply_doc_id(new_reply.id), fingerprint)
+            touch_movie(movie_id)
+        record_activity("replies", [movie_id])
 
         messages.success(request, "Reply added successfully!")
         return redirect('show_movie', movie_id=movie_id)
@@ -270,85 +317,76 @@ def vote(request):
         if not comment_id or not vote_type:
             return JsonResponse({"success": False, "message": "Missing comment_id or vote_type"}, status=400)
 
-        with transaction.atomic():
-            if comment_id.startswith("reply-"):
-                actual_id = comment_id.replace("reply-", "")
-                target_instance = get_object_or_404(CommentReply, id=actual_id)
-                vote_filter = {"user": request.user, "reply": target_instance}
-            elif comment_id.startswith("comment-"):
-                actual_id = comment_id.replace("comment-", "")
-                target_instance = get_object_or_404(Comment, id=actual_id)
-                vote_filter = {"user": request.user, "comment": target_instance}
-            else:
-                return JsonResponse({"success": False, "message": "Invalid comment ID"}, status=400)
-
-            existing_vote = Vote.objects.filter(**vote_filter).first()
-
-            if existing_vote:
-                if existing_vote.vote_type == vote_type:
-                    existing_vote.delete()
-                    if vote_type == 'like':
-                        target_instance.likes_count = max(0, target_instance.likes_count - 1)
-                    elif vote_type == 'dislike':
-                        target_instance.dislikes_count = max(0, target_instance.dislikes_count - 1)
-                else:
-                    if existing_vote.vote_type == 'like':
-                        target_instance.likes_count = max(0, target_instance.likes_count - 1)
-                    elif existing_vote.vote_type == 'dislike':
-                        target_instance.dislikes_count = max(0, target_instance.dislikes_count - 1)
-
-                    existing_vote.vote_type = vote_type
-                    existing_vote.save()
-                    if vote_type == 'like':
-                        target_instance.likes_count += 1
-                    elif vote_type == 'dislike':
-                        target_instance.dislikes_count += 1
-            else:
-                Vote.objects.create(vote_type=vote_type, **vote_filter)
-                if vote_type == 'like':
-                    target_instance.likes_count += 1
-                elif vote_type == 'dislike':
-                    target_instance.dislikes_count += 1
+        kind, target_id = parse_target(comment_id)
+        counts = apply_votes(request.user, [{"comment_id": comment_id, "vote_type": vote_type}])
+        return JsonResponse({"success": True, **counts[f"{kind}-{target_id}"]})
 
-            target_instance.save()
+    except VoteError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=e.status)
+    except Exception as e:
+        logger.error(f"Error in /vote endpoint: {str(e)}", exc_info=True)
+        return JsonResponse({"success": False, "message": "Internal server error"}, status=500)
 
-        return JsonResponse({
-            "success": True,
-            "likes": target_instance.likes_count,
-            "dislikes": target_instance.dislikes_count
-        })
 
+@login_required
+@require_http_methods(["POST"])
+def vote_batch(request):
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        operations = data.get('votes') if isinstance(data, dict) else None
+
+        if not isinstance(operations, list) or not operations or not all(isinstance(op, dict) for op in operations):
+            return JsonResponse({"success": False, "message": "Missing votes"}, status=400)
+        if len(operations) > VOTE_BATCH_LIMIT:
+            return JsonResponse({
+                "success": False,
+                "message": f"At most {VOTE_BATCH_LIMIT} votes per batch."
+            }, status=400)
+
+        return JsonResponse({"success": True, "counts": apply_votes(request.user, operations)})
+
+    except VoteError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=e.status)
     except Exception as e:
-        logger.error(f"Error in /vote endpoint: {str(e)}", exc_info=True)
+        logger.error(f"Error in /vote/batch endpoint: {str(e)}", exc_info=True)
         return JsonResponse({"success": False, "message": "Internal server error"}, status=500)
 
 
+def _archived_page(movie_id, offset, shown, live=None):
+    # Archived threads carry on where the live comments run out, at the same offsets
+    if shown >= COMMENTS_PER_PAGE:
+        return []
+    if live is None:
+        live = Comment.objects.filter(movie_id=movie_id).count()
+    return archived_threads(movie_id, max(offset - live, 0), COMMENTS_PER_PAGE - shown)
+
+
+@cacheable_page(movie_etag, movie_last_modified)
 def load_comments(request, movie_id):
     offset = int(request.GET.get("offset", 0))
-    comments = Comment.objects.filter(movie_id=movie_id).select_related('author').order_by("-timestamp")[offset:offset + COMMENTS_PER_PAGE]
+    comments = comment_page(movie_id, "-timestamp", offset, COMMENTS_PER_PAGE)
+    comments = attach_vote_state(request.user, movie_id, comments)
+    archived = _archived_page(movie_id, offset, len(comments))
 
     html = render(request, "partials/comment_list.html", {
         "comments": comments,
+        "archived": archived,
         "user": request.user,
         "reply_form": ReplyForm(),
-        "star_range": range(1, 11),
     }).content.decode("utf-8")
     return JsonResponse({"html": html})
 
 
-@login_required
-@user_passes_test(admin_or_moderator_only)
+@capability_required("manage_movies")
 def add_new_movie(request):
     if request.method == "POST":
         form = FindMovieForm(request.POST)
         if form.is_valid():
             movie_title = form.cleaned_data["title"]
             try:
-                response = requests.get(API_URL, params={"api_key": API_KEY, "query": movie_title}, timeout=10)
-                response.raise_for_status()
-                data = response.json().get("results", [])
+                data = tmdb.search_movies(movie_title)
                 return render(request, "select.html", {"options": data})
-            except requests.RequestException as e:
+            except tmdb.TMDbError as e:
                 logger.error(f"Error fetching movies from API: {str(e)}", exc_info=True)
                 messages.error(request, "Error connecting to movie database. Please try again.")
                 return render(request, "make-movie.html", {"form": form})
@@ -357,99 +395,152 @@ def add_new_movie(request):
     return render(request, "make-movie.html", {"form": form})
 
 
-@login_required
-@user_passes_test(admin_or_moderator_only)
+@capability_required("manage_movies")
 def find_movie(request, movie_id):
     if not movie_id:
         params = urlencode({"message": "No movie ID provided."})
         return redirect(f"{reverse('error')}?{params}")
 
     try:
-        response = requests.get(
-            f"{MOVIE_DB_INFO_URL}/{movie_id}",
-            params={"api_key": API_KEY},
-            timeout=10
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        credits_response = requests.get(
-            f"{MOVIE_DB_INFO_URL}/{movie_id}/credits",
-            params={"api_key": API_KEY},
-            timeout=10
+        task = enqueue(
+            "import_tmdb_movie",
+            payload={"tmdb_id": movie_id},
+            unique_key=f"tmdb-import:{movie_id}",
+            created_by=request.user,
         )
-        credits_response.raise_for_status()
-        credits_data = credits_response.json()
-
-        director = ", ".join([crew["name"] for crew in credits_data.get("crew", []) if crew.get("job") == "Director"])
-        writers = ", ".join(
-            [crew["name"] for crew in credits_data.get("crew", []) if crew.get("job") in ["Writer", "Screenplay"]])
-        genres = ", ".join([g["name"] for g in data.get("genres", [])])
-
-        img_url = f"{API_IMG_URL}{data['poster_path']}" if data.get("poster_path") else None
-
-        with transaction.atomic():
-            new_movie = Movie(
-                title=data.get("title", "Unknown Title"),
-                date=data.get("release_date", "").split("-")[0] if data.get("release_date") else None,
-                img_url=img_url,
-                body=data.get("overview", ""),
-                rating=data.get("vote_average"),
-                director=director,
-                writers=writers,
-                genres=genres
-            )
-            new_movie.save()
-
-        return redirect("edit_movie", movie_id=new_movie.id)
-
-    except requests.RequestException as e:
-        logger.error(f"Error fetching movie from API: {str(e)}", exc_info=True)
-        params = urlencode({"message": "Error connecting to movie database"})
-        return redirect(f"{reverse('error')}?{params}")
+        return render(request, "import_status.html", {"task": task})
     except Exception as e:
-        # POPRAWKA: Proper logging
         logger.error(f"Unexpected error in find_movie: {str(e)}", exc_info=True)
         params = urlencode({"message": "An unexpected error occurred"})
         return redirect(f"{reverse('error')}?{params}")
 
 
 @login_required
-@user_passes_test(admin_or_moderator_only)
+def task_status(request, task_id):
+    task = get_object_or_404(Task, id=task_id)
+    if task.created_by_id != request.user.id and not has_capability(request.user, "moderate_content"):
+        return JsonResponse({"success": False, "message": "You do not have permission to view this task."}, status=403)
+
+    return JsonResponse({
+        "success": True,
+        "id": task.id,
+        "status": task.status,
+        "attempts": task.attempts,
+        "progress": task.progress,
+        "result": task.result,
+        "message": task.error,
+    })
+
+
+@capability_required("manage_movies")
 def edit_movie(request, movie_id):
     movie = get_object_or_404(Movie, id=movie_id)
     if request.method == "POST":
         form = CreateMovieForm(request.POST, instance=movie)
         if form.is_valid():
             with transaction.atomic():
-                form.save()
+                if "img_url" in form.changed_data:
+                    superseded = movie.poster
+                    transaction.on_commit(lambda: discard_posters(superseded))
+                    movie.poster = None
+                movie = form.save()
+                sync_movie_relations(movie)
+                touch_movie(movie.id)
+                if "img_url" in form.changed_data and movie.img_url:
+                    enqueue("cache_poster", payload={"movie_id": movie.id}, unique_key=f"poster:{movie.id}")
             return redirect("show_movie", movie_id=movie.id)
     else:
         form = CreateMovieForm(instance=movie)
     return render(request, "make-movie.html", {"form": form, "is_edit": True, "current_user": request.user})
 
 
-@login_required
-@user_passes_test(admin_or_moderator_only)
+@capability_required("manage_movies")
 def delete_movie(request, movie_id):
     movie_to_delete = get_object_or_404(Movie, id=movie_id)
-    with transaction.atomic():
-        movie_to_delete.delete()
+    soft_delete_movie(movie_to_delete)
     return redirect("get_all_movies")
 
 
-@login_required
-@user_passes_test(admin_or_moderator_only)
+def _selected_ids(request):
+    return [int(value) for value in request.POST.getlist("ids") if value.isdigit()]
+
+
+def _console_before(request):
+    before = request.GET.get("before", "")
+    return int(before) if before.isdigit() else None
+
+
+@capability_required("view_users")
 def users(request):
-    all_users = User.objects.all()
-    return render(request, "users.html", {"all_users": all_users, "current_user": request.user})
+    if request.method == "POST":
+        try:
+            changed = bulk_user_action(request.user, request.POST.get("action"), _selected_ids(request),
+                                       role=request.POST.get("role"))
+            messages.success(request, f"Updated {changed} users.")
+        except ModerationError as e:
+            messages.error(request, str(e))
+        return redirect(request.get_full_path())
+
+    query = request.GET.get("q", "").strip()
+    role = request.GET.get("role", "")
+    all_users, next_before = console_page(console_users(query, role, _console_before(request)))
+    return render(request, "users.html", {
+        "all_users": all_users,
+        "current_user": request.user,
+        "query": query,
+        "current_role": role,
+        "roles": RoleEnum.choices,
+        "next_before": next_before,
+    })
+
+
+@capability_required("moderate_content")
+def moderate_comments(request):
+    if request.method == "POST":
+        try:
+            deleted = bulk_delete_comments(request.user, _selected_ids(request))
+            messages.success(request, f"Deleted {deleted} comments.")
+        except ModerationError as e:
+            messages.error(request, str(e))
+        return redirect(request.get_full_path())
+
+    query = request.GET.get("q", "").strip()
+    author = request.GET.get("author", "")
+    author_id = int(author) if author.isdigit() else None
+    comments, next_before = console_page(console_comments(query, author_id, _console_before(request)))
+    return render(request, "moderate_comments.html", {
+        "comments": comments,
+        "query": query,
+        "author": author,
+        "next_before": next_before,
+    })
+
+
+@capability_required("moderate_content")
+def moderate_duplicates(request):
+    if request.method == "POST":
+        root = request.POST.get("root", "")
+        try:
+            if not root.isdigit():
+                raise ModerationError("Choose a duplicate cluster.")
+            deleted = bulk_delete_cluster(request.user, int(root), ban_authors=request.POST.get("action") == "ban")
+            messages.success(request, f"Deleted {deleted} copies.")
+        except ModerationError as e:
+            messages.error(request, str(e))
+        return redirect(request.get_full_path())
+
+    clusters, next_before = duplicates.cluster_page(_console_before(request))
+    return render(request, "moderate_duplicates.html", {
+        "clusters": clusters,
+        "next_before": next_before,
+    })
 
 
 @login_required
 def user_profile(request, user_id):
     profile_owner = get_object_or_404(User, id=user_id)
-    comments = Comment.objects.filter(author=profile_owner).select_related('movie')
-    replies = CommentReply.objects.filter(author=profile_owner).select_related('comment__movie')
+    comments = profile_comments(profile_owner.id)
+    replies = profile_replies(profile_owner.id)
 
     user_comments = {}
     for comment in comments:
@@ -458,6 +549,7 @@ def user_profile(request, user_id):
         user_comments[movie]["comments"].append({
             "id": comment.id,
             "text": comment.text,
+            "text_html": comment.html,
             "author_id": comment.author.id
         })
         user_comments[movie]["replies"][comment.id] = []
@@ -471,6 +563,7 @@ def user_profile(request, user_id):
             user_comments[movie]["replies"][comment.id].append({
                 "id": reply.id,
                 "reply_text": reply.reply_text,
+                "reply_plain": reply.reply_plain,
                 "author_id": reply.author.id
             })
 
@@ -484,17 +577,14 @@ def delete_comment(request, comment_id):
     if not comment:
         return JsonResponse({"success": False, "message": "Comment not found."}, status=404)
 
-    if not (request.user.id == comment.author.id or request.user.is_admin or request.user.is_moderator):
+    if not (request.user.id == comment.author_id or has_capability(request.user, "moderate_content")):
         return JsonResponse({
             "success": False,
             "message": "You do not have permission to delete this comment."
         }, status=403)
 
     try:
-        with transaction.atomic():
-            Vote.objects.filter(comment_id=comment_id).delete()
-            CommentReply.objects.filter(comment_id=comment_id).delete()
-            comment.delete()
+        soft_delete_comment(comment)
         return JsonResponse({"success": True})
     except Exception as e:
         logger.error(f"Error deleting comment {comment_id}: {str(e)}", exc_info=True)
@@ -504,19 +594,18 @@ def delete_comment(request, comment_id):
 @require_POST
 @login_required
 def delete_reply(request, reply_id):
-    reply = CommentReply.objects.filter(id=reply_id).first()
+    reply = CommentReply.objects.filter(id=reply_id).select_related('comment').first()
     if not reply:
         return JsonResponse({"success": False, "message": "Reply not found."}, status=404)
 
-    if not (request.user.id == reply.author.id or request.user.is_admin or request.user.is_moderator):
+    if not (request.user.id == reply.author_id or has_capability(request.user, "moderate_content")):
         return JsonResponse({
             "success": False,
             "message": "You do not have permission to delete this reply."
         }, status=403)
 
     try:
-        with transaction.atomic():
-            reply.delete()
+        soft_delete_reply(reply)
         return JsonResponse({"success": True})
     except Exception as e:
         logger.error(f"Error deleting reply {reply_id}: {str(e)}", exc_info=True)
@@ -543,11 +632,19 @@ def edit_comment(request, comment_id):
         if not new_text:
             return JsonResponse({"success": False, "message": "Comment cannot be empty."}, status=400)
 
+        comment.text = new_text
+        comment.render()
+        doc_id = duplicates.comment_doc_id(comment.id)
+        fingerprint = duplicates.fingerprint(comment.text_plain, doc_id)
+        if duplicates.rejects(fingerprint):
+            return JsonResponse({"success": False, "message": "This comment looks like a copy of one already posted."},
+                                status=400)
         with transaction.atomic():
-            comment.text = new_text
             comment.save()
+            duplicates.index_document(doc_id, fingerprint)
+            touch_movie(comment.movie_id)
 
-        return JsonResponse({"success": True})
+        return JsonResponse({"success": True, "html": comment.text_html})
 
     except Exception as e:
         logger.error(f"Error editing comment {comment_id}: {str(e)}", exc_info=True)
@@ -557,7 +654,7 @@ def edit_comment(request, comment_id):
 @require_POST
 @login_required
 def edit_reply(request, reply_id):
-    reply = CommentReply.objects.filter(id=reply_id).first()
+    reply = CommentReply.objects.filter(id=reply_id).select_related('comment').first()
     if not reply:
         return JsonResponse({"success": False, "message": "Reply not found."}, status=404)
 
@@ -574,25 +671,72 @@ def edit_reply(request, reply_id):
         if not new_text:
             return JsonResponse({"success": False, "message": "Reply cannot be empty."}, status=400)
 
+        reply.reply_text = new_text
+        reply.render()
+        doc_id = duplicates.reply_doc_id(reply.id)
+        fingerprint = duplicates.fingerprint(reply.reply_plain, doc_id)
+        if duplicates.rejects(fingerprint):
+            return JsonResponse({"success": False, "message": "This reply looks like a copy of one already posted."},
+                                status=400)
         with transaction.atomic():
-            reply.reply_text = new_text
             reply.save()
+            duplicates.index_document(doc_id, fingerprint)
+            touch_movie(reply.comment.movie_id)
 
-        return JsonResponse({"success": True})
+        return JsonResponse({"success": True, "html": reply.reply_html})
 
     except Exception as e:
         logger.error(f"Error editing reply {reply_id}: {str(e)}", exc_info=True)
         return JsonResponse({"success": False, "message": "Error editing reply"}, status=500)
 
 
+def avatar(request, digest):
+    svg = load_avatar(digest)
+    if svg is None:
+        raise Http404("Unknown avatar")
+    response = HttpResponse(svg, content_type="image/svg+xml")
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+def poster(request, name):
+    path = poster_path(name)
+    if path is None or not path.is_file():
+        raise Http404("Unknown poster")
+    response = FileResponse(path.open("rb"), content_type=POSTER_CONTENT_TYPES[name.rsplit(".", 1)[1]])
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@cacheable_page(static_page_etag)
 def about(request):
     return render(request, "about.html", {"current_user": request.user})
 
 
+@cacheable_page(static_page_etag)
 def seo(request):
     return render(request, "seo.html", {"current_user": request.user})
 
 
+@capability_required("manage_movies")
+def catalogue_snapshot(request):
+    # Reports the worker that served the request, so repeated calls sample the pool
+    return JsonResponse({"success": True, **snapshot_status()})
+
+
+@cacheable_page(sitemaps.sitemap_index_etag, sitemaps.sitemap_index_last_modified)
+def sitemap_index(request):
+    return FileResponse(sitemaps.open_index(sitemaps.base_url(request)), content_type="application/xml")
+
+
+@cacheable_page(sitemaps.sitemap_shard_etag, sitemaps.sitemap_shard_last_modified)
+def sitemap_shard(request, shard):
+    sitemap = sitemaps.open_shard(sitemaps.base_url(request), shard)
+    if sitemap is None:
+        raise Http404("Unknown sitemap")
+    return FileResponse(sitemap, content_type="application/xml")
+
+
 def error(request, message=None):
     if not message:
         message = request.GET.get("message", "Unknown error")
@@ -0,0 +1,153 @@
+from collections import defaultdict
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from . import auth
+from .caching import touch_movies
+from .models import Comment, CommentReply, Vote
+from .queries import locked_votes, movie_votes
+from .trending import record_activity
+
+VOTE_TYPES = ("like", "dislike")
+VOTE_STATE_TIMEOUT = 60 * 60
+
+# Client target prefix -> (model, Vote foreign key, path to the movie id)
+TARGETS = {
+    "comment": (Comment, "comment", "movie_id"),
+    "reply": (CommentReply, "reply", "comment__movie_id"),
+}
+
+
+class VoteError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_target(target):
+    if not isinstance(target, str):
+        raise VoteError("Invalid comment ID")
+    prefix, _, raw_id = target.partition("-")
+    if prefix not in TARGETS or not (raw_id.isascii() and raw_id.isdigit()):
+        raise VoteError("Invalid comment ID")
+    return prefix, int(raw_id)
+
+
+def _vote_state_key(user_id, movie_id):
+    return f"votestate:{user_id}:{movie_id}"
+
+
+def _load_vote_state(user_id, movie_id):
+    return {
+        f"comment-{comment_id}" if comment_id else f"reply-{reply_id}": vote_type
+        for comment_id, reply_id, vote_type in movie_votes(user_id, movie_id)
+    }
+
+
+def vote_state(user, movie_id):
+    # apply_votes only clears the entry in its own process, so a per-process cache would show stale buttons
+    if not auth.cache_is_shared():
+        return _load_vote_state(user.id, movie_id)
+    key = _vote_state_key(user.id, movie_id)
+    state = cache.get(key)
+    if state is None:
+        state = _load_vote_state(user.id, movie_id)
+        cache.set(key, state, VOTE_STATE_TIMEOUT)
+    return state
+
+
+def attach_vote_state(user, movie_id, comments):
+    state = vote_state(user, movie_id) if user.is_authenticated else {}
+    for comment in comments:
+        comment.user_vote = state.get(f"comment-{comment.id}")
+        for reply in comment.replies_set.all():
+            reply.user_vote = state.get(f"reply-{reply.id}")
+    return comments
+
+
+def _final_states(operations, existing):
+    # Replaying the toggles in memory leaves one write per target however many clicks arrived
+    states = {}
+    for target, vote_type in operations:
+        current = states.get(target, existing.get(target))
+        states[target] = None if current == vote_type else vote_type
+    return states
+
+
+def apply_votes(user, operations):
+    parsed = []
+    for operation in operations:
+        vote_type = operation.get("vote_type")
+        if vote_type not in VOTE_TYPES:
+            raise VoteError("Missing comment_id or vote_type")
+        parsed.append((parse_target(operation.get("comment_id")), vote_type))
+
+    ids_by_kind = defaultdict(set)
+    for (kind, target_id), _ in parsed:
+        ids_by_kind[kind].add(target_id)
+
+    with transaction.atomic():
+        movie_of = {}
+        existing = {}
+        # Locking the targets, always in the same order, serialises concurrent batches from one user even
+        # before any Vote row exists to lock
+        for kind, ids in sorted(ids_by_kind.items()):
+            model, field, movie_path = TARGETS[kind]
+            targets = model.objects.select_for_update(of=("self",)).filter(id__in=ids).order_by("id")
+            found = dict(targets.values_list("id", movie_path))
+            if len(found) != len(ids):
+                raise VoteError("Comment not found.", status=404)
+            movie_of.update({(kind, target_id): movie_id for target_id, movie_id in found.items()})
+            for target_id, vote_type in locked_votes(user.id, field, ids):
+                existing[(kind, target_id)] = vote_type
+
+        movie_ids = set(movie_of.values())
+        states = _final_states(parsed, existing)
+        new_votes = []
+        deltas = defaultdict(list)
+        for kind, ids in ids_by_kind.items():
+            model, field, _ = TARGETS[kind]
+            upserts = []
+            removed = []
+            for target_id in ids:
+                before = existing.get((kind, target_id))
+                after = states[(kind, target_id)]
+                if before == after:
+                    continue
+                if after is None:
+                    removed.append(target_id)
+                else:
+                    new_votes.append(movie_of[(kind, target_id)])
+                    upserts.append(Vote(user=user, vote_type=after, **{f"{field}_id": target_id}))
+                delta = (int(after == "like") - int(before == "like"), int(after == "dislike") - int(before == "dislike"))
+                deltas[(kind, delta)].append(target_id)
+
+            if removed:
+                Vote.objects.filter(user=user, **{f"{field}_id__in": removed}).delete()
+            if upserts:
+                Vote.objects.bulk_create(
+                    upserts, update_conflicts=True, unique_fields=["user", field], update_fields=["vote_type"]
+                )
+
+        # One UPDATE per distinct (likes, dislikes) change instead of one save per target
+        for (kind, (likes, dislikes)), ids in deltas.items():
+            TARGETS[kind][0].objects.filter(id__in=ids).update(
+                likes_count=Greatest(F("likes_count") + likes, Value(0)),
+                dislikes_count=Greatest(F("dislikes_count") + dislikes, Value(0)),
+            )
+        if deltas:
+            touch_movies(movie_ids)
+
+    if deltas:
+        cache.delete_many([_vote_state_key(user.id, movie_id) for movie_id in movie_ids])
+        record_activity("votes", new_votes)
+
+    counts = {}
+    for kind, ids in ids_by_kind.items():
+        rows = TARGETS[kind][0].objects.filter(id__in=ids).values_list("id", "likes_count", "dislikes_count")
+        for target_id, likes, dislikes in rows:
+            counts[f"{kind}-{target_id}"] = {
+                "likes": likes, "dislikes": dislikes, "vote": states[(kind, target_id)],
+            }
+    return counts
@@ -0,0 +1,15 @@
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ENV_FILE = BASE_DIR / ".env"
+
+_loaded = False
+
+
+def load_env():
+    # Settings call this once per process; the explicit path spares python-dotenv its search up the call stack
+    global _loaded
+    if not _loaded:
+        from dotenv import load_dotenv
+        load_dotenv(ENV_FILE)
+        _loaded = True
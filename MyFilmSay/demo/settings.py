@@ -10,15 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
-from pathlib import Path
-
 import os
-from dotenv import load_dotenv
 import sys
-load_dotenv()
+import tempfile
+from pathlib import Path
+from demo.config import BASE_DIR, load_env
 
-# Build paths inside the project like this: BASE_DIR / 'subdir'.
-BASE_DIR = Path(__file__).resolve().parent.parent
+load_env()
 
 
 # Quick-start development settings - unsuitable for production
@@ -32,6 +30,34 @@ DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
 
+TMDB_API_KEY = os.getenv("API_KEY_TMDb")
+
+# Under gunicorn --preload (see gunicorn.conf.py) the master imports views, templates and the lazily
+# loaded libraries once before forking, so workers start warm and share those pages
+PRELOAD_APP = os.getenv("PRELOAD_APP", "False").lower() == "true"
+
+# Part of every page ETag, so a deploy with changed templates invalidates cached pages
+RELEASE_VERSION = os.getenv("RELEASE_VERSION", "1")
+
+# How long a shared cache (reverse proxy / CDN) may keep anonymous pages
+PAGE_CACHE_SECONDS = int(os.getenv("PAGE_CACHE_SECONDS", "60"))
+
+# How long rendered anonymous pages stay in the server cache (keys include the ETag)
+RENDERED_PAGE_SECONDS = int(os.getenv("RENDERED_PAGE_SECONDS", "3600"))
+
+# Movie views are counted 1-in-N and flushed from the cache to the database periodically (0 turns counting off).
+# With a per-process cache each sampled view is written to the database straight away instead
+VIEW_SAMPLE_RATE = int(os.getenv("VIEW_SAMPLE_RATE", "10"))
+VIEW_FLUSH_SECONDS = int(os.getenv("VIEW_FLUSH_SECONDS", "300"))
+
+# Comment, reply and vote activity is kept in hourly buckets; the trending list is rebuilt
+# every TRENDING_REFRESH_SECONDS from the last TRENDING_WINDOW_HOURS, halving in weight
+# every TRENDING_HALF_LIFE_HOURS
+TRENDING_REFRESH_SECONDS = int(os.getenv("TRENDING_REFRESH_SECONDS", "300"))
+TRENDING_WINDOW_HOURS = int(os.getenv("TRENDING_WINDOW_HOURS", "72"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "12"))
+TRENDING_LIMIT = int(os.getenv("TRENDING_LIMIT", "100"))
+
 
 # Application definition
 
@@ -48,27 +74,40 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'MyFilmSay.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'demo.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept in memory per process outside of DEBUG
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'libraries': {
+                'film_tags': 'MyFilmSay.templatestags.film_tags',
+            },
         },
     },
 ]
@@ -91,12 +130,40 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 if 'test' in sys.argv:
     DATABASES['default'] = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:'
     }
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
     SECRET_KEY = 'test-secret-key'
+    # The per-process test cache is expected here; RateLimitTestCase covers the warning
+    SILENCED_SYSTEM_CHECKS = ['MyFilmSay.W001']
+
+# Write throttling per URL name: (scope, requests, window in seconds).
+# "user" falls back to the client IP for anonymous requests.
+RATE_LIMITS = {
+    "show_movie": ("user", 5, 60),
+    "reply_comment": ("user", 10, 60),
+    "vote": ("user", 60, 60),
+    "vote_batch": ("user", 30, 60),
+    "edit_comment": ("user", 20, 60),
+    "edit_reply": ("user", 20, 60),
+    "register": ("ip", 5, 60 * 60),
+    "login": ("ip", 10, 5 * 60),
+}
+RATE_LIMIT_CACHE = "default"
+# Set to e.g. HTTP_X_FORWARDED_FOR when running behind a trusted reverse proxy
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER", "REMOTE_ADDR")
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -117,6 +184,33 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The first hasher hashes new passwords; the others only verify old hashes, which
+# are rehashed with the first one (and its current costs) on the next login.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "argon2")
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 2))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+SCRYPT_WORK_FACTOR = int(os.getenv("SCRYPT_WORK_FACTOR", 2 ** 14))
+SCRYPT_BLOCK_SIZE = int(os.getenv("SCRYPT_BLOCK_SIZE", 8))
+SCRYPT_PARALLELISM = int(os.getenv("SCRYPT_PARALLELISM", 1))
+
+AVAILABLE_PASSWORD_HASHERS = {
+    "argon2": "MyFilmSay.hashers.TunedArgon2PasswordHasher",
+    "scrypt": "MyFilmSay.hashers.TunedScryptPasswordHasher",
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+}
+PASSWORD_HASHERS = [AVAILABLE_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in AVAILABLE_PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+
+AUTHENTICATION_BACKENDS = ["MyFilmSay.auth.CachedModelBackend"]
+# How long request.user is served from the cache instead of the database; only with a cache shared by
+# every worker (CACHE_BACKEND other than locmem/dummy), otherwise each request reads the user row
+USER_CACHE_SECONDS = int(os.getenv("USER_CACHE_SECONDS", 300))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -133,6 +227,75 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies plus .gz/.br variants; WhiteNoise serves
+# them straight from the app with far-future immutable caching.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+WHITENOISE_MAX_AGE = 60 * 60 * 24
+
+# Generated initials avatars, addressed by content hash
+AVATAR_ROOT = BASE_DIR / 'avatars'
+
+# Local copies of TMDb posters, resized and addressed by content hash
+POSTER_ROOT = Path(os.getenv("POSTER_ROOT", BASE_DIR / 'posters'))
+POSTER_MAX_BYTES = int(os.getenv("POSTER_MAX_BYTES", 10 * 1024 * 1024))
+# Poster URLs must start with one of these before they are fetched
+POSTER_SOURCE_PREFIXES = os.getenv("POSTER_SOURCE_PREFIXES", "https://image.tmdb.org/").split(",")
+
+# Sitemap files for the movie pages, SITEMAP_SHARD_SIZE URLs per file (50k is the protocol limit),
+# rebuilt when the catalogue changes; new comments and votes reach their lastmod at the refresh
+# that runs every SITEMAP_REFRESH_SECONDS
+SITEMAP_ROOT = Path(os.getenv("SITEMAP_ROOT", BASE_DIR / 'sitemaps'))
+SITEMAP_SHARD_SIZE = int(os.getenv("SITEMAP_SHARD_SIZE", 50000))
+SITEMAP_REFRESH_SECONDS = int(os.getenv("SITEMAP_REFRESH_SECONDS", 15 * 60))
+# e.g. https://myfilmsay.example; without it URLs follow the request host and nothing is precomputed
+SITEMAP_BASE_URL = os.getenv("SITEMAP_BASE_URL", "")
+
+# Movie metadata is served from a memory-mapped snapshot file shared by all workers. A movie change
+# sends requests to the database until the task worker has published the next one
+CATALOGUE_SNAPSHOT = os.getenv("CATALOGUE_SNAPSHOT", "True").lower() == "true"
+CATALOGUE_SNAPSHOT_ROOT = Path(os.getenv("CATALOGUE_SNAPSHOT_ROOT", BASE_DIR / 'snapshots'))
+
+# Database-backed task queue (manage.py run_worker)
+TASK_LOCK_TIMEOUT = int(os.getenv("TASK_LOCK_TIMEOUT", 600))
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", 1))
+
+# Rows deleted per transaction when purging soft-deleted content
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", 500))
+
+# Comment and reply text is treated as Markdown (when the package is installed) before sanitizing
+COMMENT_MARKDOWN = os.getenv("COMMENT_MARKDOWN", "True").lower() == "true"
+
+# New comments and replies whose MinHash similarity to an earlier one reaches DUPLICATE_THRESHOLD
+# are flagged for the moderation console, or refused outright with DUPLICATE_ACTION=reject.
+# Texts shorter than DUPLICATE_MIN_WORDS are not checked.
+DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "flag")
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+DUPLICATE_MIN_WORDS = int(os.getenv("DUPLICATE_MIN_WORDS", "8"))
+
+# Top-level comment threads untouched for ARCHIVE_AFTER_DAYS, on movies without newer comments,
+# are moved to the compressed archive by manage.py archive_threads
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+if 'test' in sys.argv:
+    # A published snapshot would outlive the test that wrote it; CatalogueSnapshotTestCase turns it on
+    CATALOGUE_SNAPSHOT = False
+    CATALOGUE_SNAPSHOT_ROOT = Path(tempfile.gettempdir()) / 'myfilmsay-test-snapshots'
+    AVATAR_ROOT = Path(tempfile.gettempdir()) / 'myfilmsay-test-avatars'
+    POSTER_ROOT = Path(tempfile.gettempdir()) / 'myfilmsay-test-posters'
+    SITEMAP_ROOT = Path(tempfile.gettempdir()) / 'myfilmsay-test-sitemaps'
+    # A sampled view is an extra UPDATE with the per-process test cache; PopularityTestCase turns counting on
+    VIEW_SAMPLE_RATE = 0
+    STATIC_ROOT = None
+    STORAGES["staticfiles"]["BACKEND"] = "django.contrib.staticfiles.storage.StaticFilesStorage"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -0,0 +1,13 @@
+import os
+
+# gunicorn demo.wsgi -c gunicorn.conf.py
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "3"))
+preload_app = True
+os.environ.setdefault("PRELOAD_APP", "True")
+
+
+def post_fork(server, worker):
+    # Each worker opens its own database connections
+    from django.db import connections
+    connections.close_all()